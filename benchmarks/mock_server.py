@@ -0,0 +1,354 @@
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any
+from urllib.parse import urlparse, parse_qs
+
+
+class MockState:
+    """
+    模拟服务的配置和统计。
+
+    GitHub 部分提供分页搜索（Link 头、ETag、速率限制头）、/topics 和 GraphQL；
+    DeepSeek 部分提供 /v1/models 和 /v1/chat/completions（支持 SSE 流式输出）。
+    所有响应都由参数决定，同样的配置每次运行得到同样的数据。
+    """
+
+    def __init__(self, repos_per_topic: int = 60, overlap: float = 0.1, missing_topics: float = 0.2,
+                 github_latency: float = 0.02, chat_latency: float = 0.3, jitter: float = 0.1,
+                 error_429: float = 0.0, error_5xx: float = 0.0, stream_chunks: int = 20,
+                 batch_drop: float = 0.0, forks: float = 0.0, slow_rate: float = 0.0, slow_factor: float = 10.0,
+                 seed: int = 42):
+        self.repos_per_topic = repos_per_topic
+        self.overlap = overlap
+        self.missing_topics = missing_topics
+        self.github_latency = github_latency
+        self.chat_latency = chat_latency
+        self.jitter = jitter
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.stream_chunks = max(1, stream_chunks)
+        self.batch_drop = batch_drop
+        self.forks = forks
+        self.slow_rate = slow_rate
+        self.slow_factor = slow_factor
+        self.random = random.Random(seed)
+        self.counters = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def sleep(self, base: float):
+        if base <= 0:
+            return
+        with self.lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(base * factor)
+
+    def chat_delay(self) -> float:
+        """单个分析的延迟，按 slow_rate 的比例慢 slow_factor 倍（模拟长尾）"""
+        with self.lock:
+            slow = self.random.random() < self.slow_rate
+        if slow:
+            self.count('chat_slow')
+            return self.chat_latency * self.slow_factor
+        return self.chat_latency
+
+    def inject_error(self):
+        """按配置的比例返回需要注入的错误状态码，不注入时返回 None"""
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.error_429:
+            return 429
+        if roll < self.error_429 + self.error_5xx:
+            return 503
+        return None
+
+    def repo(self, topic: str, index: int) -> Dict[str, Any]:
+        # 一部分仓库在所有主题下共用同一个名字，用来覆盖去重逻辑
+        shared = index < int(self.repos_per_topic * self.overlap)
+        # 一部分仓库是前一个仓库的 fork：名称和描述相同，所有者不同
+        fork = not shared and index > 0 and (index * 37) % 100 < self.forks * 100
+        base = index - 1 if fork and index - 1 >= int(self.repos_per_topic * self.overlap) else index
+        name = f"{topic}-{base}" if not shared else f"shared-{index}"
+        full_name = f"fork{index}/{name}" if base != index else f"owner{index % 13}/{name}"
+        return {
+            'html_url': f"https://github.com/{full_name}",
+            'full_name': full_name,
+            'description': f"Mock repository {name} for benchmarking: {self.summary_words(name)}",
+            'stargazers_count': (self.repos_per_topic - index) * 10,
+            'language': ['Python', 'TypeScript', 'Rust', None][index % 4],
+            'topics': None if index % 100 < self.missing_topics * 100 else [topic, 'benchmark'],
+            'pushed_at': '2026-01-01T00:00:00Z'
+        }
+
+    # 描述中的随机词，使不同仓库的描述不会因为模板相同而被当作近似重复
+    VOCABULARY = ('agent', 'vision', 'speech', 'retrieval', 'embedding', 'inference', 'training', 'dataset',
+                  'serving', 'quantization', 'notebook', 'pipeline', 'workflow', 'plugin', 'chatbot', 'search',
+                  'translation', 'robotics', 'compiler', 'kernel', 'dashboard', 'annotation', 'benchmark', 'tuning',
+                  'graph', 'audio', 'video', 'diffusion', 'tabular', 'forecasting', 'ranking', 'privacy')
+
+    def summary_words(self, name: str) -> str:
+        return ' '.join(random.Random(name).sample(self.VOCABULARY, 6))
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counters)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state: MockState = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status: int, body: Any, headers: Dict[str, str] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int):
+        self.state.count(f"injected_{status}")
+        headers = {'Retry-After': '0'} if status == 429 else {}
+        self._send_json(status, {'message': 'injected error'}, headers)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/__stats':
+            return self._send_json(200, self.state.snapshot())
+        if url.path == '/search/repositories':
+            return self._search(params)
+        match = re.match(r'^/repos/(.+)/topics$', url.path)
+        if match:
+            self.state.count('github_topics')
+            self.state.sleep(self.state.github_latency)
+            return self._send_json(200, {'names': ['benchmark', 'fallback']})
+        if url.path == '/v1/models':
+            self.state.count('deepseek_models')
+            return self._send_json(200, {'data': [{'id': 'deepseek-chat'}]})
+        self._send_json(404, {'message': 'Not Found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_json()
+        if url.path == '/graphql':
+            return self._graphql(body)
+        if url.path == '/v1/chat/completions':
+            return self._chat(body)
+        self._send_json(404, {'message': 'Not Found'})
+
+    def _search(self, params: Dict[str, list]):
+        state = self.state
+        state.count('github_search')
+        state.sleep(state.github_latency)
+
+        topic = params.get('q', ['topic:unknown'])[0].split(':', 1)[-1]
+        page = int(params.get('page', ['1'])[0])
+        per_page = int(params.get('per_page', ['30'])[0])
+        last_page = max(1, -(-state.repos_per_topic // per_page))
+        etag = f'"{topic}-{page}-{per_page}-{state.repos_per_topic}"'
+        headers = {
+            'ETag': etag,
+            'X-RateLimit-Remaining': '1000',
+            'X-RateLimit-Reset': str(int(time.time()) + 60)
+        }
+        if self.headers.get('If-None-Match') == etag:
+            state.count('github_not_modified')
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start = (page - 1) * per_page
+        end = min(start + per_page, state.repos_per_topic)
+        items = [state.repo(topic, i) for i in range(start, end)]
+        base = f"http://{self.headers['Host']}/search/repositories?q=topic:{topic}&sort=stars&order=desc&per_page={per_page}"
+        links = []
+        if page < last_page:
+            links.append(f'<{base}&page={page + 1}>; rel="next"')
+        links.append(f'<{base}&page={last_page}>; rel="last"')
+        headers['Link'] = ', '.join(links)
+        self._send_json(200, {'total_count': state.repos_per_topic, 'items': items}, headers)
+
+    def _graphql(self, body: Dict[str, Any]):
+        self.state.count('github_graphql')
+        self.state.sleep(self.state.github_latency)
+        aliases = re.findall(r'(\w+): repository\(', body.get('query', ''))
+        data = {alias: {'repositoryTopics': {'nodes': [{'topic': {'name': 'benchmark'}}]}} for alias in aliases}
+        self._send_json(200, {'data': data})
+
+    def _chat(self, body: Dict[str, Any]):
+        state = self.state
+        state.count('chat_requests')
+        error = state.inject_error()
+        if error:
+            state.sleep(state.github_latency)
+            return self._send_error(error)
+
+        prompt = body.get('messages', [{}])[-1].get('content', '')
+        if (body.get('response_format') or {}).get('type') == 'json_object':
+            return self._batch_chat(prompt, body.get('max_tokens'))
+        content = f"## 模拟分析\n\n{prompt[:200]}\n\n" + "这是基准测试生成的分析内容。" * 20
+        # 按每 2 个字符 1 个 token 粗略计算，超过 max_tokens 时截断
+        finish_reason = 'stop'
+        max_tokens = body.get('max_tokens')
+        if max_tokens and len(content) // 2 > max_tokens:
+            content = content[:max_tokens * 2]
+            finish_reason = 'length'
+        usage = {
+            'prompt_tokens': len(prompt) // 2,
+            'completion_tokens': len(content) // 2,
+            'total_tokens': (len(prompt) + len(content)) // 2
+        }
+        if not body.get('stream'):
+            state.sleep(state.chat_delay())
+            return self._send_json(200, {
+                'choices': [{'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+                'usage': usage
+            })
+        self._stream_chat(content, usage, finish_reason)
+
+    def _batch_chat(self, prompt: str, max_tokens: int = None):
+        """批量请求：按项目编号返回 JSON，按 batch_drop 的比例故意遗漏部分项目"""
+        state = self.state
+        state.count('chat_batch_requests')
+        numbers = re.findall(r'项目编号：(\d+)', prompt)
+        analyses = []
+        for number in numbers:
+            with state.lock:
+                dropped = state.random.random() < state.batch_drop
+            if dropped:
+                state.count('batch_dropped')
+                continue
+            analyses.append({'id': int(number), 'analysis': f"## 模拟分析 {number}\n\n" + "这是基准测试生成的分析内容。" * 20})
+        content = json.dumps({'analyses': analyses}, ensure_ascii=False)
+        completion_tokens = len(content) // 2
+        # 批量回答的生成时间随项目数增长，但只有一次往返
+        state.sleep(state.chat_latency * (1 + 0.5 * max(0, len(numbers) - 1)))
+        self._send_json(200, {
+            'choices': [{'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {
+                'prompt_tokens': len(prompt) // 2,
+                'completion_tokens': completion_tokens,
+                'total_tokens': len(prompt) // 2 + completion_tokens
+            }
+        })
+
+    def _stream_chat(self, content: str, usage: Dict[str, int], finish_reason: str):
+        state = self.state
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write_event(payload: str):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+            self.wfile.flush()
+
+        # 首个 token 前占用一半延迟，其余均匀分布在各个分块之间
+        size = -(-len(content) // state.stream_chunks)
+        try:
+            state.sleep(state.chat_latency / 2)
+            for i in range(0, len(content), size):
+                write_event(json.dumps({'choices': [{'delta': {'content': content[i:i + size]}}]}))
+                state.sleep(state.chat_latency / 2 / state.stream_chunks)
+            write_event(json.dumps({'choices': [{'delta': {}, 'finish_reason': finish_reason}]}))
+            write_event(json.dumps({'choices': [], 'usage': usage}))
+            write_event('[DONE]')
+            self.wfile.write(b'0\r\n\r\n')
+            self.wfile.flush()
+        except OSError:
+            state.count('stream_aborted')
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭连接池中的空闲连接属于正常情况，不输出堆栈
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_server(state: MockState, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程中启动模拟服务，返回 server 对象（端口见 server.server_address）"""
+    handler = type('BoundMockHandler', (MockHandler,), {'state': state})
+    server = MockServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='GitHub / DeepSeek 本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='监听端口，0 表示随机端口')
+    parser.add_argument('--repos-per-topic', type=int, default=60, help='每个主题的仓库数量')
+    parser.add_argument('--overlap', type=float, default=0.1, help='各主题之间重复仓库的比例')
+    parser.add_argument('--missing-topics', type=float, default=0.2, help='搜索结果缺少 topics 字段的比例')
+    parser.add_argument('--github-latency', type=float, default=0.02, help='GitHub 接口延迟（秒）')
+    parser.add_argument('--chat-latency', type=float, default=0.3, help='chat 接口延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.1, help='延迟随机抖动比例')
+    parser.add_argument('--error-429', type=float, default=0.0, help='chat 请求返回 429 的比例')
+    parser.add_argument('--error-5xx', type=float, default=0.0, help='chat 请求返回 503 的比例')
+    parser.add_argument('--stream-chunks', type=int, default=20, help='流式响应的分块数量')
+    parser.add_argument('--batch-drop', type=float, default=0.0, help='批量回答中遗漏项目的比例')
+    parser.add_argument('--forks', type=float, default=0.0, help='作为前一个仓库 fork（名称和描述相同）的仓库比例')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='chat 请求变慢的比例（模拟长尾延迟）')
+    parser.add_argument('--slow-factor', type=float, default=10.0, help='变慢的请求的延迟倍数')
+    parser.add_argument('--seed', type=int, default=42)
+    return parser
+
+
+def state_from_args(args: argparse.Namespace) -> MockState:
+    return MockState(
+        repos_per_topic=args.repos_per_topic,
+        overlap=args.overlap,
+        missing_topics=args.missing_topics,
+        github_latency=args.github_latency,
+        chat_latency=args.chat_latency,
+        jitter=args.jitter,
+        error_429=args.error_429,
+        error_5xx=args.error_5xx,
+        stream_chunks=args.stream_chunks,
+        batch_drop=args.batch_drop,
+        forks=args.forks,
+        slow_rate=args.slow_rate,
+        slow_factor=args.slow_factor,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    server = start_server(state_from_args(args), args.host, args.port)
+    host, port = server.server_address[:2]
+    # 第一行输出监听地址，方便其他进程读取
+    print(f"http://{host}:{port}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
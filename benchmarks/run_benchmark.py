@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, Any, List
+
+import requests
+
+# 以脚本方式运行时，让 scripts.* 和 run_automation 可以被导入
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法计算百分位数，没有数据时返回 0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def start_mock_server(mock_config: Dict[str, Any]) -> (subprocess.Popen, str):
+    """在独立进程中启动模拟服务，避免服务端线程影响被测进程的 CPU 和内存统计"""
+    mock_args = []
+    for key, value in mock_config.items():
+        mock_args += [f"--{key.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_server.py')] + mock_args,
+        stdout=subprocess.PIPE, text=True
+    )
+    base_url = process.stdout.readline().strip()
+    if not base_url:
+        process.kill()
+        raise RuntimeError("模拟服务启动失败")
+    return process, base_url
+
+
+def run_benchmark(args: argparse.Namespace, mock_config: Dict[str, Any]) -> Dict[str, Any]:
+    server, base_url = start_mock_server(mock_config)
+    workdir = tempfile.mkdtemp(prefix='ai_tools_bench_')
+    original_cwd = os.getcwd()
+    try:
+        # 所有输出（日志、缓存、已处理数据库、报告、密钥缓存）都写到临时目录
+        os.environ.update({
+            'GITHUB_API_BASE': base_url,
+            'DEEPSEEK_API_BASE': f"{base_url}/v1",
+            'DEEPSEEK_API_KEY': 'benchmark',
+            'DEEPSEEK_API_KEY_FILE': os.path.join(workdir, 'config', 'api_keys.json')
+        })
+        if args.graphql:
+            os.environ['GITHUB_TOKEN'] = 'benchmark'
+        else:
+            os.environ.pop('GITHUB_TOKEN', None)
+        os.chdir(workdir)
+
+        import run_automation
+        from cli import setup_logging
+        from scripts.metrics import metrics
+        from scripts.project_analyzer import ProjectAnalyzer
+        setup_logging(args.log_level)
+
+        # 记录每个项目从开始分析到得到结果的耗时（包含重试和限流等待），
+        # 批量模式下同一批的项目共用整批的耗时
+        latencies, outcomes = [], []
+        analyze_single = ProjectAnalyzer._analyze_safely
+        analyze_batch = ProjectAnalyzer._analyze_batch_safely
+
+        def timed_single(self, project_data, *a, **kw):
+            started = time.perf_counter()
+            result = analyze_single(self, project_data, *a, **kw)
+            latencies.append(time.perf_counter() - started)
+            outcomes.append(bool(result.get('success')))
+            return result
+
+        def timed_batch(self, projects):
+            started = time.perf_counter()
+            results = analyze_batch(self, projects)
+            elapsed = time.perf_counter() - started
+            latencies.extend([elapsed] * len(results))
+            outcomes.extend(bool(result.get('success')) for result in results)
+            return results
+
+        ProjectAnalyzer._analyze_safely = timed_single
+        ProjectAnalyzer._analyze_batch_safely = timed_batch
+        try:
+            started = time.perf_counter()
+            run_automation.main(
+                concurrency=args.concurrency,
+                use_cache=False,
+                max_pages=args.max_pages,
+                use_http_cache=False,
+                stream=args.stream,
+                idle_timeout=args.idle_timeout,
+                token_budget=args.token_budget,
+                max_tokens=args.max_tokens,
+                batch_size=args.batch_size,
+                dedup_threshold=args.dedup_threshold,
+                max_duration=args.max_duration,
+                hedge=not args.no_hedge
+            )
+            duration = time.perf_counter() - started
+        finally:
+            ProjectAnalyzer._analyze_safely = analyze_single
+            ProjectAnalyzer._analyze_batch_safely = analyze_batch
+
+        server_stats = requests.get(f"{base_url}/__stats", timeout=5).json()
+        summary = metrics.summary()
+        stages = summary['histograms']
+        tokens = {c['labels']['kind']: c['value'] for c in summary['counters'] if c['name'] == 'llm_tokens_total'}
+    finally:
+        os.chdir(original_cwd)
+        server.terminate()
+        server.wait()
+        if args.keep_workdir:
+            print(f"工作目录: {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    analyzed = len(outcomes)
+    chat_requests = server_stats.get('chat_requests', 0)
+    return {
+        'config': {
+            'concurrency': args.concurrency,
+            'stream': args.stream,
+            'max_pages': args.max_pages,
+            'graphql': args.graphql,
+            'token_budget': args.token_budget,
+            'max_tokens': args.max_tokens,
+            'batch_size': args.batch_size,
+            'dedup_threshold': args.dedup_threshold,
+            'max_duration': args.max_duration,
+            'hedge': not args.no_hedge,
+            'mock': mock_config
+        },
+        'duration_sec': round(duration, 3),
+        'repos_analyzed': analyzed,
+        'repos_succeeded': sum(outcomes),
+        'repos_per_sec': round(analyzed / duration, 3) if duration > 0 else 0.0,
+        'latency_sec': {
+            'mean': round(sum(latencies) / analyzed, 4) if analyzed else 0.0,
+            'p50': round(percentile(latencies, 50), 4),
+            'p95': round(percentile(latencies, 95), 4),
+            'p99': round(percentile(latencies, 99), 4),
+            'max': round(max(latencies), 4) if latencies else 0.0
+        },
+        'tokens': tokens,
+        'chat_requests': chat_requests,
+        # 近似重复检测发现的工具数量，这些工具沿用相似工具的分析，不请求 API
+        'duplicates': sum(c['value'] for c in summary['counters'] if c['name'] == 'duplicates_total'),
+        # 对冲请求：发送、胜出（先于原请求返回）和落后（返回后被丢弃）的次数
+        'hedges': {result: sum(c['value'] for c in summary['counters']
+                               if c['name'] == 'llm_hedge_total' and c['labels']['result'] == result)
+                   for result in ('sent', 'won', 'lost')},
+        # 截止时间前来不及分析、留到下次运行的工具数量
+        'deadline_skipped': sum(c['value'] for c in summary['counters'] if c['name'] == 'deadline_skipped_total'),
+        # 客户端的重试次数（限流调度器的 retries_total，包括 GitHub 和 LLM 请求）
+        'retries': sum(c['value'] for c in summary['counters'] if c['name'] == 'retries_total'),
+        # 模拟服务注入的错误数
+        'injected_errors': sum(v for k, v in server_stats.items() if k.startswith('injected_')),
+        # Linux 上 ru_maxrss 的单位是 KB
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'server': server_stats,
+        # 各阶段的耗时分布，来自 scripts.metrics
+        'stages': stages
+    }
+
+
+if __name__ == "__main__":
+    from mock_server import build_arg_parser
+
+    parser = argparse.ArgumentParser(
+        description='离线基准测试：针对本地模拟服务运行完整流程，输出 JSON 格式的性能数据',
+        parents=[build_arg_parser()], conflict_handler='resolve', add_help=False
+    )
+    parser.add_argument('-h', '--help', action='help', help='显示帮助信息')
+    parser.add_argument('--concurrency', type=int, default=4, help='分析并发数')
+    parser.add_argument('--max-pages', type=int, default=3, help='每个主题最多获取的页数')
+    parser.add_argument('--stream', action='store_true', help='使用流式响应')
+    parser.add_argument('--idle-timeout', type=float, default=30, help='流式模式的空闲超时秒数')
+    parser.add_argument('--graphql', action='store_true', help='设置 GITHUB_TOKEN，通过 GraphQL 补全元数据')
+    parser.add_argument('--token-budget', type=int, help='本次运行的 token 预算')
+    parser.add_argument('--max-tokens', type=int, default=2048, help='单次分析回答的最大 token 数')
+    parser.add_argument('--batch-size', type=int, default=1, help='每个请求分析的项目数量')
+    parser.add_argument('--dedup-threshold', type=float, default=0.85, help='近似重复检测的相似度阈值，0 表示不检测')
+    parser.add_argument('--no-hedge', action='store_true', help='不发送对冲请求')
+    parser.add_argument('--max-duration', type=float, help='本次运行的最长秒数，预计来不及完成的分析不再提交')
+    parser.add_argument('--output', type=str, help='把结果写入指定的 JSON 文件')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时工作目录，便于检查日志和报告')
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    args = parser.parse_args()
+
+    # 模拟服务的参数原样转发给子进程
+    mock_dests = {action.dest for action in build_arg_parser()._actions if action.dest != 'help'}
+    mock_config = {dest: getattr(args, dest) for dest in sorted(mock_dests - {'host', 'port'})}
+
+    result = run_benchmark(args, mock_config)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+统一的命令行入口。
+
+用法: python3 cli.py <子命令> [参数]，子命令见 python3 cli.py --help。
+各子命令只在执行时才导入需要的模块，例如 seen、queue 和 catalog 不会导入 requests，
+查看帮助或管理已处理的仓库时不需要加载网络和分析相关的代码。
+"""
+
+import os
+import sys
+import logging
+import argparse
+
+from scripts.token_usage import TokenUsage
+
+DEFAULT_QUEUE = 'output/work_queue.db'
+
+
+def setup_logging(level: str = 'DEBUG'):
+    """同时输出到 logs/automation_log.txt 和终端"""
+    os.makedirs("logs", exist_ok=True)
+    logging.basicConfig(
+        level=level,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('logs/automation_log.txt'),
+            logging.StreamHandler()
+        ]
+    )
+    logging.getLogger().setLevel(level)
+
+
+def add_analysis_arguments(parser: argparse.ArgumentParser):
+    """run 和 worker 共用的分析参数"""
+    parser.add_argument('--api-key', type=str, help='DeepSeek API密钥')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时进行的分析请求数量（默认4个）')
+    parser.add_argument('--stream', action='store_true', help='使用流式响应接收分析结果，按空闲时间判断超时')
+    parser.add_argument('--idle-timeout', type=float, default=30, help='流式模式下两次收到数据之间的最长等待秒数（默认30秒）')
+    parser.add_argument('--no-cache', action='store_true', help='不使用分析结果缓存，强制重新请求 API')
+    parser.add_argument('--metrics-file', type=str, help='运行指标的输出文件，.prom 后缀为 Prometheus 文本格式（默认 output/metrics_<运行ID>.json）')
+    parser.add_argument('--batch-size', type=int, default=1, help='每个请求分析的项目数量，大于1时启用批量模式（默认1）')
+    parser.add_argument('--token-budget', type=int, help='本次运行最多使用的 token 数，达到后不再提交新的分析（默认不限制）')
+    parser.add_argument('--max-tokens', type=int, default=2048, help='单次分析回答的最大 token 数（默认2048）')
+    parser.add_argument('--max-description-chars', type=int, default=500, help='提示中项目描述的最大字符数（默认500）')
+    parser.add_argument('--price-prompt', type=float, default=TokenUsage.DEFAULT_PROMPT_PRICE, help='每百万提示 token 的价格（美元），用于估算费用')
+    parser.add_argument('--price-completion', type=float, default=TokenUsage.DEFAULT_COMPLETION_PRICE, help='每百万回答 token 的价格（美元），用于估算费用')
+    parser.add_argument('--validation-ttl', type=float, default=24, help='密钥验证结果和选择的模型的保留小时数，期间不再请求模型列表（默认24，0 表示每次验证）')
+    parser.add_argument('--dedup-threshold', type=float, default=0.85, help='近似重复检测的相似度阈值，与已分析工具相似时沿用其分析（默认0.85）')
+    parser.add_argument('--no-dedup', action='store_true', help='不进行近似重复检测，每个工具都单独分析')
+    parser.add_argument('--backends', type=str, metavar='FILE', help='备用 LLM 后端的 JSON 配置（OpenAI 兼容端点），与 DeepSeek 一起按耗时和错误率路由')
+    parser.add_argument('--no-hedge', action='store_true', help='不对超过 p95 耗时的慢请求发送对冲请求')
+    parser.add_argument('--log-level', default='DEBUG', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='日志级别（默认 DEBUG）')
+
+
+def analysis_options(args) -> dict:
+    """add_analysis_arguments 定义的参数对应的 run_automation.main 参数"""
+    return dict(
+        concurrency=args.concurrency,
+        use_cache=not args.no_cache,
+        stream=args.stream,
+        idle_timeout=args.idle_timeout,
+        metrics_file=args.metrics_file,
+        token_budget=args.token_budget,
+        max_tokens=args.max_tokens,
+        max_description_chars=args.max_description_chars,
+        prompt_price=args.price_prompt,
+        completion_price=args.price_completion,
+        batch_size=args.batch_size,
+        validation_ttl=args.validation_ttl * 3600,
+        dedup_threshold=0 if args.no_dedup else args.dedup_threshold,
+        backends_file=args.backends,
+        hedge=not args.no_hedge
+    )
+
+
+def add_run_arguments(parser: argparse.ArgumentParser):
+    add_analysis_arguments(parser)
+    parser.add_argument('--test', action='store_true', help='测试模式：仅分析少量项目')
+    parser.add_argument('--test-count', type=int, default=3, help='测试模式下要分析的项目数量（默认3个）')
+    parser.add_argument('--max-pages', type=int, default=3, help='每个 GitHub 主题最多获取的搜索结果页数（默认3页）')
+    parser.add_argument('--no-http-cache', action='store_true', help='不使用 GitHub 条件请求缓存')
+    parser.add_argument('--resume', type=str, metavar='RUN_ID', help='继续之前中断的运行，跳过已完成的项目')
+    parser.add_argument('--no-refresh', action='store_true', help='已处理的仓库即使有变化也不重新分析')
+    parser.add_argument('--priority-weights', type=str, help='分析优先级各项的权重，例如 stars=1,growth=2,recency=1,topics=1（未列出的项使用默认值，即此例）')
+    parser.add_argument('--deadline', type=str, help='截止时间，HH:MM 或 ISO 格式；预计来不及完成的低优先级分析留到下次运行')
+    parser.add_argument('--max-duration', type=str, help='本次运行的最长时间，例如 45m、2h；守护模式下对每次运行分别计时')
+    parser.add_argument('--daemon', action='store_true', help='守护模式：按 --interval 或 --cron 持续运行，收到 SIGTERM 时排空在途分析后退出')
+    parser.add_argument('--interval', type=str, default='6h', help='守护模式的运行间隔，例如 90s、30m、6h、1d（默认6h）')
+    parser.add_argument('--cron', type=str, help="守护模式使用的 cron 表达式（分 时 日 月 星期），例如 '0 */6 * * *'，优先于 --interval")
+
+
+def command_run(args, parser):
+    if args.daemon and args.resume:
+        parser.error('--daemon 不能与 --resume 同时使用')
+    if args.daemon and args.deadline:
+        parser.error('守护模式请使用 --max-duration 限制每次运行的时间')
+    from scripts.scheduler import parse_deadline, parse_duration
+    from scripts.analysis_scheduler import AnalysisScheduler
+    try:
+        deadline = parse_deadline(args.deadline) if args.deadline else None
+        max_duration = parse_duration(args.max_duration) if args.max_duration else None
+        weights = AnalysisScheduler.parse_weights(args.priority_weights) if args.priority_weights else None
+    except ValueError as e:
+        parser.error(str(e))
+    schedule = None
+    if args.daemon:
+        from scripts.scheduler import CronSchedule, IntervalSchedule
+        try:
+            schedule = CronSchedule(args.cron) if args.cron else IntervalSchedule.parse(args.interval)
+        except ValueError as e:
+            parser.error(str(e))
+
+    setup_logging(args.log_level)
+    if args.api_key:
+        os.environ['DEEPSEEK_API_KEY'] = args.api_key
+
+    import run_automation
+    options = dict(
+        analysis_options(args),
+        test_mode=args.test,
+        max_test_items=args.test_count,
+        max_pages=args.max_pages,
+        use_http_cache=not args.no_http_cache,
+        resume_run_id=args.resume,
+        refresh_changed=not args.no_refresh,
+        deadline=deadline,
+        max_duration=max_duration,
+        priority_weights=weights
+    )
+    if schedule:
+        run_automation.run_daemon(schedule, **options)
+    else:
+        run_automation.main(**options)
+
+
+def run_worker_process(args) -> int:
+    setup_logging(args.log_level)
+    if args.api_key:
+        os.environ['DEEPSEEK_API_KEY'] = args.api_key
+    import run_automation
+    return run_automation.run_worker(
+        queue_path=args.queue, visibility=args.lease_timeout, max_attempts=args.max_attempts,
+        poll_interval=args.poll_interval, exit_when_empty=args.exit_when_empty, **analysis_options(args)
+    ) or 0
+
+
+def command_worker(args, parser):
+    if args.processes <= 1:
+        return run_worker_process(args)
+    import signal
+    import multiprocessing
+    processes = [multiprocessing.Process(target=run_worker_process, args=(args,), name=f'worker-{i + 1}')
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    # 终端的 Ctrl+C 会直接发给同一进程组中的工作进程，只需转发 SIGTERM
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for process in processes:
+        process.join()
+    return max(process.exitcode or 0 for process in processes)
+
+
+def command_queue(args, parser):
+    from scripts.work_queue import open_work_queue
+    queue = open_work_queue(args.queue)
+    try:
+        if args.requeue_failed:
+            print(f"已将 {queue.requeue_failed()} 个失败的工具重新放入队列")
+        if args.purge:
+            print(f"已删除 {queue.purge(args.purge)} 个状态为 {args.purge} 的工具")
+        stats = queue.stats()
+        print(f"工作队列 {args.queue}: " + ', '.join(f"{state} {count}" for state, count in stats.items()))
+    finally:
+        queue.close()
+
+
+def manage_seen(args) -> bool:
+    """处理 --show / --clear / --remove，只打开已处理仓库数据库；没有这些参数时返回 False"""
+    if not (args.show or args.clear or args.remove):
+        return False
+    from scripts.seen_store import open_seen_store
+    store = open_seen_store()
+    try:
+        if args.clear:
+            store.clear()
+            print("已清空所有处理记录")
+        elif args.remove:
+            if store.remove(args.remove):
+                print(f"已从处理记录中移除: {args.remove}")
+            else:
+                print(f"未找到该仓库: {args.remove}")
+        else:
+            urls = list(store)
+            if not urls:
+                print("还没有处理过任何仓库")
+            else:
+                print(f"\n已处理的仓库 (共 {len(urls)} 个):")
+                for i, url in enumerate(urls, 1):
+                    print(f"{i}. {url}")
+    finally:
+        store.close()
+    return True
+
+
+def add_seen_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--show', action='store_true', help='显示已处理的仓库列表')
+    parser.add_argument('--clear', action='store_true', help='清空已处理的仓库列表')
+    parser.add_argument('--remove', type=str, help='从已处理列表中移除指定的仓库 URL')
+
+
+def command_collect(args, parser):
+    if manage_seen(args):
+        return
+    setup_logging(args.log_level)
+    from scripts.data_collection import DataCollector
+    collector = DataCollector(max_pages=args.max_pages, use_http_cache=not args.no_http_cache)
+    if args.enqueue:
+        return enqueue_tools(collector, args.queue)
+    tools = collector.collect_all_data()
+    print(f"收集到 {len(tools)} 个新工具")
+
+
+def enqueue_tools(collector, queue_path: str):
+    """把新工具按优先级放入工作队列，由 worker 分析；分析完成后才记为已处理"""
+    from scripts.analysis_scheduler import AnalysisScheduler
+    from scripts.catalog import Catalog
+    from scripts.work_queue import open_work_queue
+    catalog = Catalog()
+    scheduler = AnalysisScheduler(known_tags=catalog.known_tags())
+    catalog.close()
+    queue = open_work_queue(queue_path)
+    try:
+        collected = []
+        for tool in collector.iter_new_tools():
+            tool['priority'] = round(scheduler.score(tool), 3)
+            scheduler.known_tags.update(tag.lower() for tag in tool.get('tags') or [])
+            collected.append(tool)
+        added = queue.enqueue(collected)
+        print(f"收集到 {len(collected)} 个新工具，{added} 个新加入工作队列；队列状态: {queue.stats()}")
+    finally:
+        queue.close()
+        collector.seen_store.close()
+
+
+def command_seen(args, parser):
+    if not manage_seen(args):
+        args.show = True
+        manage_seen(args)
+
+
+def command_report(args, parser):
+    from scripts.report_writer import rebuild_markdown
+    count = rebuild_markdown(args.jsonl, args.output)
+    print(f"已根据 {count} 个工具重新生成报告")
+
+
+def command_catalog(args, parser):
+    from scripts.catalog import main as catalog_main
+    return catalog_main(args.catalog_args)
+
+
+def command_test_api(args, parser):
+    from test_deepseek_api import test_deepseek_api
+    working = test_deepseek_api(args.api_key, api_base=args.api_base, deadline=args.deadline,
+                                concurrency=args.concurrency, save=not args.no_save)
+    return 0 if working else 1
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='GitHub AI 工具收集和分析器')
+    subparsers = parser.add_subparsers(dest='command', required=True, metavar='<子命令>')
+
+    run_parser = subparsers.add_parser('run', help='收集并分析新工具，生成报告（可使用 --daemon 持续运行）')
+    add_run_arguments(run_parser)
+    run_parser.set_defaults(handler=command_run)
+
+    collect_parser = subparsers.add_parser('collect', help='只从 GitHub 收集新工具，不进行分析')
+    add_seen_arguments(collect_parser)
+    collect_parser.add_argument('--max-pages', type=int, default=3, help='每个 GitHub 主题最多获取的搜索结果页数（默认3页）')
+    collect_parser.add_argument('--no-http-cache', action='store_true', help='不使用 GitHub 条件请求缓存')
+    collect_parser.add_argument('--enqueue', action='store_true', help='把新工具放入工作队列，由 worker 子命令分析（不记为已处理）')
+    collect_parser.add_argument('--queue', default=DEFAULT_QUEUE, help=f'工作队列文件（默认 {DEFAULT_QUEUE}）')
+    collect_parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='日志级别（默认 INFO）')
+    collect_parser.set_defaults(handler=command_collect)
+
+    worker_parser = subparsers.add_parser('worker', help='从工作队列租用并分析工具，可在多个进程或主机上同时运行')
+    add_analysis_arguments(worker_parser)
+    worker_parser.add_argument('--queue', default=DEFAULT_QUEUE, help=f'工作队列文件（默认 {DEFAULT_QUEUE}）')
+    worker_parser.add_argument('--processes', type=int, default=1, help='启动的工作进程数量（默认1）')
+    worker_parser.add_argument('--lease-timeout', type=float, default=300, help='租期秒数，工作进程失联超过该时间后工具重新可见（默认300）')
+    worker_parser.add_argument('--max-attempts', type=int, default=3, help='每个工具的最大尝试次数，超过后标记为失败（默认3）')
+    worker_parser.add_argument('--poll-interval', type=float, default=30, help='队列为空时检查新工具的间隔秒数（默认30）')
+    worker_parser.add_argument('--exit-when-empty', action='store_true', help='队列为空时退出，而不是等待新工具')
+    worker_parser.set_defaults(handler=command_worker)
+
+    queue_parser = subparsers.add_parser('queue', help='查看或管理工作队列')
+    queue_parser.add_argument('--queue', default=DEFAULT_QUEUE, help=f'工作队列文件（默认 {DEFAULT_QUEUE}）')
+    queue_parser.add_argument('--requeue-failed', action='store_true', help='把失败的工具重新放入队列')
+    queue_parser.add_argument('--purge', choices=['done', 'failed'], help='删除指定状态的工具')
+    queue_parser.set_defaults(handler=command_queue)
+
+    seen_parser = subparsers.add_parser('seen', help='查看或管理已处理的仓库（默认显示列表）')
+    add_seen_arguments(seen_parser)
+    seen_parser.set_defaults(handler=command_seen)
+
+    report_parser = subparsers.add_parser('report', help='根据 JSON Lines 输出重新生成 Markdown 报告')
+    report_parser.add_argument('jsonl', help='ai_tools_<运行ID>.jsonl 文件')
+    report_parser.add_argument('output', nargs='?', help='Markdown 文件名（默认与 JSON Lines 同名）')
+    report_parser.set_defaults(handler=command_report)
+
+    # catalog 的参数原样交给 scripts/catalog.py 解析
+    catalog_parser = subparsers.add_parser('catalog', add_help=False, help='查询本地工具目录（参数同 scripts/catalog.py）')
+    catalog_parser.set_defaults(handler=command_catalog)
+
+    test_parser = subparsers.add_parser('test-api', help='测试 DeepSeek API 连接')
+    test_parser.add_argument('api_key', help='DeepSeek API密钥')
+    test_parser.add_argument('--api-base', help='API 端点（默认 DEEPSEEK_API_BASE 或官方端点）')
+    test_parser.add_argument('--deadline', type=float, default=30, help='整体探测的最长秒数（默认30）')
+    test_parser.add_argument('--concurrency', type=int, default=8, help='同时进行的探测数量（默认8）')
+    test_parser.add_argument('--no-save', action='store_true', help='不把可用的配置写入密钥配置文件')
+    test_parser.set_defaults(handler=command_test_api)
+    return parser
+
+
+def main(argv=None) -> int:
+    parser = build_arg_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'catalog':
+        args.catalog_args = extra
+    elif extra:
+        parser.error(f"无法识别的参数: {' '.join(extra)}")
+    return args.handler(args, parser) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,123 +1,342 @@
-import os
+import sys
+
+if __name__ == "__main__":
+    # 参数解析在 cli.py 中，python3 run_automation.py 等同于 python3 cli.py run；
+    # 在导入分析相关的模块之前转发
+    from cli import main as cli_main
+    sys.exit(cli_main(['run'] + sys.argv[1:]))
+
+import signal
+import hashlib
+import itertools
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+from scripts.analysis_scheduler import AnalysisScheduler
+from scripts.catalog import Catalog
 from scripts.data_collection import DataCollector
+from scripts.dedup import DuplicateFilter
+from scripts.metrics import metrics
 from scripts.project_analyzer import ProjectAnalyzer
+from scripts.report_writer import ReportWriter
+# save_to_markdown 原来定义在本模块中，保留从 run_automation 导入的旧用法
+from scripts.report_writer import save_to_markdown  # noqa: F401
+from scripts.run_journal import RunJournal
+from scripts.token_usage import TokenUsage
+from scripts.work_queue import QueueConsumer, open_work_queue
 
-# Create logs directory if it doesn't exist
-os.makedirs("logs", exist_ok=True)
+# analyze_stream 和 main 中用于创建分析器的参数
+ANALYZER_OPTIONS = ('use_cache', 'stream', 'idle_timeout', 'max_tokens', 'max_description_chars', 'batch_size',
+                    'validation_ttl', 'backends_file', 'hedge')
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('logs/automation_log.txt'),
-        logging.StreamHandler()
-    ]
-)
+def skip_analysis(tools, message):
+    """
+    分析不可用时，为工具产出带说明的跳过结果（skipped 为 True）。
+    跳过的工具不写入报告和目录，也不记为失败；调用方收到第一个跳过结果后应停止迭代，
+    避免继续从收集器或工作队列取出工具。
+    """
+    for tool in tools:
+        yield tool, {"analysis": message, "success": False, "skipped": True}
 
-def save_to_markdown(tools, filename):
-    with open(filename, 'w', encoding='utf-8') as f:
-        # Write header
-        f.write(f"# AI 工具分析报告 - {datetime.now().strftime('%Y-%m-%d')}\n\n")
-        
-        # Write summary
-        total_stars = sum(tool.get('stars', 0) for tool in tools)
-        languages = set(tool.get('language', '未知') for tool in tools)
-        f.write(f"## 今日更新概览\n\n")
-        f.write(f"- 新增工具数量: {len(tools)} 个\n")
-        f.write(f"- 总星标数: {total_stars} ⭐\n")
-        f.write(f"- 涉及编程语言: {', '.join(languages)}\n\n")
-        
-        # Group tools by language
-        tools_by_language = {}
-        for tool in tools:
-            lang = tool.get('language', '未知')
-            if lang not in tools_by_language:
-                tools_by_language[lang] = []
-            tools_by_language[lang].append(tool)
-        
-        # Write tools by language
-        for lang, lang_tools in sorted(tools_by_language.items()):
-            f.write(f"## {lang} 相关工具\n\n")
-            
-            for i, tool in enumerate(lang_tools, 1):
-                f.write(f"### {i}. {tool['name']} ⭐{tool.get('stars', 0)}\n\n")
-                f.write(f"**AI 分析报告**:\n\n{tool.get('analysis', '暂无分析')}\n\n")
-                f.write(f"**描述**: {tool['description']}\n\n")
-                f.write(f"**标签**: {', '.join(tool.get('tags', []))}\n\n")
-                f.write(f"**GitHub**: [{tool['url']}]({tool['url']})\n\n")
-                f.write("---\n\n")
+def create_analyzer(state=None, use_cache=True, stream=False, idle_timeout=30, usage=None, max_tokens=2048,
+                    max_description_chars=500, batch_size=1, validation_ttl=ProjectAnalyzer.VALIDATION_TTL,
+                    backends_file=None, hedge=True):
+    """
+    返回分析器：state 中已有时复用（并换用本次运行的 usage），否则新建并保存到 state。
+    API 密钥未设置时抛出 ValueError。
+    """
+    analyzer = state.get('analyzer') if state is not None else None
+    if analyzer:
+        if usage is not None:
+            analyzer.usage = usage
+        return analyzer
+    analyzer = ProjectAnalyzer(use_cache=use_cache, stream=stream, idle_timeout=idle_timeout, usage=usage,
+                               max_tokens=max_tokens, max_description_chars=max_description_chars,
+                               batch_size=batch_size, validation_ttl=validation_ttl,
+                               backends_file=backends_file, hedge=hedge)
+    if state is not None:
+        state['analyzer'] = analyzer
+    return analyzer
 
-def main(test_mode=False, max_test_items=3):
-    logging.info("开始收集AI工具信息...")
-    collector = DataCollector()
+def analyze_stream(tools, concurrency=4, use_cache=True, stream=False, idle_timeout=30, on_partial=None,
+                   usage=None, max_tokens=2048, max_description_chars=500, batch_size=1, state=None,
+                   stop_event=None, validation_ttl=ProjectAnalyzer.VALIDATION_TTL, backends_file=None, hedge=True):
+    """
+    初始化分析器并验证 API 密钥，然后边收集边分析，按完成顺序产出 (tool, analysis_result)。
+    usage 用于累计本次运行的 token 用量，预算耗尽后停止分析剩余的工具。
+    state 不为 None 时复用其中的分析器（已验证的密钥、选择的模型和分析缓存），并保存新建的分析器。
+    stop_event 被设置后不再提交新的分析，在途的分析完成后结束。
+    """
     try:
-        tools = collector.collect_all_data()
-        
-        if test_mode and tools:
-            # 在测试模式下，只处理少量项目
-            logging.info(f"测试模式: 从 {len(tools)} 个工具中只分析 {min(max_test_items, len(tools))} 个")
-            tools = tools[:min(max_test_items, len(tools))]
-        
-        logging.info(f"从 GitHub 收集到 {len(tools)} 个新工具")
-        
-        if tools:
-            # 初始化项目分析器
-            try:
-                analyzer = ProjectAnalyzer()
-                logging.info("正在验证 API 密钥...")
-                
-                # 先验证 API 密钥是否有效
-                if analyzer.check_api_key_validity():
-                    logging.info("API 密钥有效，开始分析项目...")
-                    
-                    # 分析每个项目
-                    for i, tool in enumerate(tools):
-                        logging.info(f"正在分析项目 {i+1}/{len(tools)}: {tool['name']}")
-                        analysis_result = analyzer.analyze_project(tool)
-                        tool['analysis'] = analysis_result['analysis']
-                    
-                    logging.info("项目分析完成")
-                else:
-                    logging.error("API 密钥无效，将跳过项目分析")
-                    for tool in tools:
-                        tool['analysis'] = "由于 API 密钥无效，项目分析被跳过。请确保提供有效的 DeepSeek API 密钥。"
-                
-            except ValueError as e:
-                logging.error(f"API 密钥错误: {str(e)}")
-                for tool in tools:
-                    tool['analysis'] = f"项目分析失败: {str(e)}。请使用 --api-key 参数提供有效的 DeepSeek API 密钥。"
-            except Exception as e:
-                logging.error(f"项目分析过程中发生错误: {str(e)}", exc_info=True)
-                # 继续执行，即使分析失败也保存收集到的数据
-                for tool in tools:
-                    if 'analysis' not in tool:
-                        tool['analysis'] = f"项目分析失败: {str(e)}"
-        
+        analyzer = create_analyzer(state, use_cache=use_cache, stream=stream, idle_timeout=idle_timeout, usage=usage,
+                                   max_tokens=max_tokens, max_description_chars=max_description_chars,
+                                   batch_size=batch_size, validation_ttl=validation_ttl,
+                                   backends_file=backends_file, hedge=hedge)
+    except ValueError as e:
+        logging.error(f"API 密钥错误: {str(e)}")
+        yield from skip_analysis(tools, f"项目分析失败: {str(e)}。请使用 --api-key 参数提供有效的 DeepSeek API 密钥。")
+        return
+    
+    logging.info("正在验证 API 密钥...")
+    if not analyzer.check_api_key_validity():
+        logging.error("API 密钥无效，将跳过项目分析")
+        yield from skip_analysis(tools, "由于 API 密钥无效，项目分析被跳过。请确保提供有效的 DeepSeek API 密钥。")
+        return
+    
+    logging.info("API 密钥有效，开始分析项目...")
+    yield from analyzer.iter_analyses(tools, max_concurrency=concurrency, on_partial=on_partial, stop_event=stop_event)
+    
+    logging.info("项目分析完成")
+    if analyzer.cache:
+        stats = analyzer.cache.stats()
+        logging.info(f"分析缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, 共 {stats['entries']} 个条目")
+
+def log_metrics_summary():
+    """在日志中输出耗时最多的阶段"""
+    for name, histogram in metrics.top_spans():
+        logging.info(
+            f"耗时统计 {name}: {histogram.count} 次, 共 {histogram.sum:.2f} 秒, "
+            f"p95 {histogram.quantile(0.95):.2f} 秒, 最长 {histogram.max:.2f} 秒"
+        )
+
+def main(test_mode=False, max_test_items=3, concurrency=4, use_cache=True, max_pages=3, use_http_cache=True,
+         resume_run_id=None, stream=False, idle_timeout=30, metrics_file=None, token_budget=None,
+         max_tokens=2048, max_description_chars=500, prompt_price=TokenUsage.DEFAULT_PROMPT_PRICE,
+         completion_price=TokenUsage.DEFAULT_COMPLETION_PRICE, batch_size=1, refresh_changed=True,
+         validation_ttl=ProjectAnalyzer.VALIDATION_TTL, dedup_threshold=0.85, deadline=None, max_duration=None,
+         priority_weights=None, backends_file=None, hedge=True, consumer=None, state=None, stop_event=None):
+    """
+    收集并分析一次。state 为守护模式在多次运行间共享的字典，其中的收集器和分析器会被复用；
+    stop_event 被设置后不再提交新的分析，已在途的分析写入后正常结束本次运行。
+    dedup_threshold 为近似重复检测的相似度阈值，与已分析工具的相似度达到阈值时沿用已有分析（0 表示不检测）。
+    工具按优先级（priority_weights 为各项权重）从高到低分析；deadline（datetime）或 max_duration（秒，
+    从本次运行开始计时）之前预计无法完成的分析不再提交，剩余的工具留到下次运行。
+    backends_file 为备用 LLM 后端的配置文件，hedge 为是否对慢请求发送对冲请求（见 scripts/llm_backends.py）。
+    consumer（QueueConsumer）不为 None 时为工作进程模式：工具从共享的工作队列租用，而不是从 GitHub 收集，
+    队列中没有可租用的项目时结束本次运行。
+    """
+    started = datetime.now()
+    if max_duration:
+        limit = started + timedelta(seconds=max_duration)
+        deadline = min(deadline, limit) if deadline else limit
+    metrics.reset()
+    usage = TokenUsage(token_budget, prompt_price, completion_price)
+    # 多个工作进程可能在同一秒开始运行，运行 ID 加上工作进程标识
+    journal = RunJournal(resume_run_id or (f"{started:%Y%m%d_%H%M%S}_{consumer.owner}" if consumer else None))
+    finished, failed = {}, {}
+    if resume_run_id:
+        if not journal.exists():
+            logging.error(f"找不到运行日志: {journal.path}")
+            return
+        for url, entry in journal.load().items():
+            (finished if entry.get('success') else failed)[url] = entry
+        logging.info(f"继续运行 {journal.run_id}: 已完成 {len(finished)} 个项目，{len(failed)} 个失败的项目将重试")
+    else:
+        logging.info(f"运行 ID: {journal.run_id}（中断后可使用 --resume {journal.run_id} 继续）")
+    
+    logging.info("开始从工作队列租用工具..." if consumer else "开始收集AI工具信息...")
+    collector = state.get('collector') if state is not None else None
+    if collector is None:
+        collector = DataCollector(max_pages=max_pages, use_http_cache=use_http_cache, refresh_changed=refresh_changed)
+        if state is not None:
+            state['collector'] = collector
+    
+    filename = f"output/ai_tools_{journal.run_id}.md"
+    writer = ReportWriter(filename)
+    # 所有分析结果同时写入本地目录，便于之后查询和重新生成报告
+    catalog = Catalog()
+    for entry in finished.values():
+        writer.add(entry['tool'], True)
+        # 上次运行可能在写入日志后、记为已处理前中断；重新写入可以同时更新指纹
+        analysis_hash = hashlib.sha256(entry['tool'].get('analysis', '').encode('utf-8')).hexdigest()
+        collector.mark_seen(entry['tool'], analysis_hash)
+    
+    # 先分析优先级高的工具；有截止时间时，来不及分析的低优先级工具留到下次运行
+    scheduler = AnalysisScheduler(priority_weights, deadline, catalog.known_tags())
+    if deadline:
+        logging.info(f"截止时间: {deadline.strftime('%Y-%m-%d %H:%M:%S')}")
+    if consumer:
+        # 队列按入队时计算的优先级租出，分析器有空闲位置时才租用下一个，多个工作进程平均分担
+        tools = consumer.iter_tools(stop_event)
+    else:
+        # 工具从收集器流入分析线程，分析完成后立即写入运行日志
+        tools = scheduler.order(tool for tool in collector.iter_new_tools() if tool['url'] not in finished)
+    # 近似重复的工具（fork、镜像、相似的封装）不再请求 API，沿用相似工具的分析
+    dedup = DuplicateFilter(catalog, dedup_threshold) if dedup_threshold else None
+    if dedup:
+        tools = dedup.filter(tools)
+    if test_mode:
+        # 在测试模式下，只处理少量项目
+        logging.info(f"测试模式: 只分析前 {max_test_items} 个新工具")
+        tools = itertools.islice(tools, max_test_items)
+    
+    def save_result(tool, analysis_result):
+        tool['analysis'] = analysis_result['analysis']
+        success = bool(analysis_result.get('success'))
+        with metrics.span('journal_write'):
+            journal.record(tool, success)
+        with metrics.span('catalog_write'):
+            catalog.add(tool, success, journal.run_id)
+        writer.add(tool, success)
+        failed.pop(tool['url'], None)
+        # 分析结果持久化之后才记为已处理；失败的项目下次运行时会重试
+        if success:
+            analysis_hash = hashlib.sha256(tool['analysis'].encode('utf-8')).hexdigest()
+            collector.mark_seen(tool, analysis_hash)
+        if consumer:
+            consumer.done(tool, success, None if success else tool['analysis'])
+        if not tool.get('duplicate_of'):
+            scheduler.complete(tool, cached=bool(analysis_result.get('cached')))
+            if dedup:
+                dedup.record(tool, success)
+        if dedup:
+            for duplicate, reused in dedup.pop_resolved():
+                save_result(duplicate, reused)
+    
+    try:
+        # 流式模式下，生成中的内容会先以 partial 记录写入运行日志
+        results = analyze_stream(tools, concurrency=concurrency, use_cache=use_cache, stream=stream,
+                                 idle_timeout=idle_timeout, on_partial=journal.record_partial if stream else None,
+                                 usage=usage, max_tokens=max_tokens, max_description_chars=max_description_chars,
+                                 batch_size=batch_size, state=state, stop_event=stop_event,
+                                 validation_ttl=validation_ttl, backends_file=backends_file, hedge=hedge)
+        for tool, analysis_result in results:
+            if analysis_result.get('skipped'):
+                # 分析不可用（密钥未设置或无效）：不再取出更多的工具，已租用的工具由 release_all 退回队列，
+                # 收集到的工具没有记为已处理，下次运行时处理
+                logging.warning("分析不可用，本次运行不再处理剩余的工具")
+                break
+            save_result(tool, analysis_result)
+        if dedup:
+            # 所有分析结束后，参照目录中已有分析的重复项可能还没有写入
+            for duplicate, reused in dedup.pop_resolved():
+                save_result(duplicate, reused)
+            if dedup.reused:
+                logging.info(f"近似重复检测: {dedup.reused} 个工具沿用了相似工具的分析")
+            if dedup.pending():
+                logging.info(f"{dedup.pending()} 个相似工具的参照对象未完成分析，将在下次运行时处理")
     except Exception as e:
         logging.error(f"收集工具信息时发生错误: {str(e)}", exc_info=True)
-        return
+    finally:
+        # 本次没有重新分析的失败项目仍按原结果写入报告
+        for entry in failed.values():
+            writer.add(entry['tool'], False)
+        if consumer:
+            released = consumer.release_all()
+            if released:
+                logging.info(f"{released} 个租用的工具没有处理，已退回工作队列")
+        journal.close()
+        catalog.close()
+        usage_summary = usage.summary()
+        with metrics.span('report_write'):
+            writer.close(usage_summary)
+        logging.info(
+            f"Token 用量: 共 {usage_summary['total_tokens']}（提示 {usage_summary['prompt_tokens']} / "
+            f"回答 {usage_summary['completion_tokens']}），预估费用 ${usage_summary['cost_usd']:.4f}，"
+            f"平均生成速度 {usage_summary['tokens_per_sec']} tokens/秒"
+        )
+        if usage.exhausted:
+            logging.warning(f"本次运行已达到 token 预算 {usage.budget}，未分析的工具会在下次运行时处理")
+        # 运行结束时导出指标（.prom 为 Prometheus 文本格式，其他为 JSON 摘要）
+        metrics_file = metrics_file or f"output/metrics_{journal.run_id}.json"
+        try:
+            metrics.write(metrics_file)
+            log_metrics_summary()
+            logging.info(f"运行指标已保存到: {metrics_file}")
+        except OSError as e:
+            logging.warning(f"保存运行指标时出错: {str(e)}")
     
-    if not tools:
+    logging.info(f"从 GitHub 收集并处理了 {writer.count} 个新工具")
+    if not writer.count:
         logging.warning("未收集到任何工具信息")
         return
     
-    os.makedirs("output", exist_ok=True)
-    filename = f"output/ai_tools_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
-    save_to_markdown(tools, filename)
-    logging.info(f"所有数据已保存到: {filename}")
+    logging.info(f"所有数据已保存到: {filename}（另有 {writer.jsonl_path} 和 {writer.csv_path}）")
 
-if __name__ == "__main__":
-    import argparse
-    parser = argparse.ArgumentParser(description='GitHub AI 工具收集和分析器')
-    parser.add_argument('--api-key', type=str, help='DeepSeek API密钥')
-    parser.add_argument('--test', action='store_true', help='测试模式：仅分析少量项目')
-    parser.add_argument('--test-count', type=int, default=3, help='测试模式下要分析的项目数量（默认3个）')
-    args = parser.parse_args()
+def install_stop_handlers() -> threading.Event:
+    """收到 SIGTERM 或 SIGINT 时设置返回的事件；再次收到信号时立即退出"""
+    stop_event = threading.Event()
     
-    if args.api_key:
-        os.environ['DEEPSEEK_API_KEY'] = args.api_key
+    def request_stop(signum, frame):
+        if stop_event.is_set():
+            raise KeyboardInterrupt
+        logging.warning(f"收到 {signal.Signals(signum).name}，等待在途的分析完成后退出（再次发送将立即退出）")
+        stop_event.set()
     
-    main(test_mode=args.test, max_test_items=args.test_count)
\ No newline at end of file
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+    return stop_event
+
+def run_daemon(schedule, **options):
+    """
+    守护模式：按 schedule（IntervalSchedule 或 CronSchedule）反复调用 main()，立即开始第一次运行。
+    收集器（连接池、HTTP 缓存、已处理仓库数据库）和分析器（密钥验证结果、选择的模型、分析缓存）
+    在多次运行间复用。收到 SIGTERM 或 SIGINT 后不再提交新的分析，等在途的分析完成并写入报告后退出；
+    再次收到信号时立即退出。
+    """
+    stop_event = install_stop_handlers()
+    state = {}
+    logging.info(f"守护模式已启动，调度: {schedule}")
+    try:
+        while not stop_event.is_set():
+            started = datetime.now()
+            try:
+                main(state=state, stop_event=stop_event, **options)
+            except Exception as e:
+                logging.error(f"本次运行失败: {str(e)}", exc_info=True)
+            if stop_event.is_set():
+                break
+            next_run = schedule.next_run(started)
+            logging.info(f"下一次运行时间: {next_run.strftime('%Y-%m-%d %H:%M:%S')}")
+            # 等待期间收到信号会立即返回
+            stop_event.wait(max(0.0, (next_run - datetime.now()).total_seconds()))
+    finally:
+        if 'collector' in state:
+            state['collector'].seen_store.close()
+        logging.info("守护模式已退出")
+
+def run_worker(queue_path='output/work_queue.db', visibility=300, max_attempts=3, poll_interval=30,
+               exit_when_empty=False, **options):
+    """
+    工作进程模式：从共享的工作队列（collect --enqueue 写入）租用工具并分析，可以同时运行任意数量的工作进程。
+    队列中有可租用的项目时调用一次 main() 处理到队列为空，之后每 poll_interval 秒检查一次；
+    exit_when_empty 为 True 时队列为空即退出。收到 SIGTERM 或 SIGINT 后排空在途的分析，
+    已租用但没有开始分析的工具退回队列后退出。
+    API 密钥在租用任何工具之前验证，无效时（包括运行中失效）返回 1，租用的工具退回队列而不记为失败。
+    """
+    stop_event = install_stop_handlers()
+    state = {}
+    try:
+        analyzer = create_analyzer(state, **{name: options[name] for name in ANALYZER_OPTIONS if name in options})
+    except ValueError as e:
+        logging.error(f"API 密钥错误: {str(e)}")
+        return 1
+    if not analyzer.check_api_key_validity():
+        logging.error("API 密钥无效，工作进程退出，没有租用任何工具")
+        return 1
+    queue = open_work_queue(queue_path, max_attempts=max_attempts)
+    consumer = QueueConsumer(queue, visibility=visibility)
+    logging.info(f"工作进程 {consumer.owner} 已启动，队列: {queue_path}，租期 {visibility:g} 秒")
+    try:
+        while not stop_event.is_set():
+            if queue.ready():
+                try:
+                    main(consumer=consumer, state=state, stop_event=stop_event, **options)
+                except Exception as e:
+                    logging.error(f"本次运行失败: {str(e)}", exc_info=True)
+                    stop_event.wait(poll_interval)
+                if not analyzer.key_validated:
+                    # 密钥在运行中失效：没有分析的工具已退回队列，由其他工作进程（或修正密钥后的本进程）处理
+                    logging.error("API 密钥无效，工作进程退出")
+                    return 1
+                continue
+            if exit_when_empty:
+                break
+            stop_event.wait(poll_interval)
+    finally:
+        consumer.close()
+        stats = queue.stats()
+        queue.close()
+        if 'collector' in state:
+            state['collector'].seen_store.close()
+        logging.info(f"工作进程 {consumer.owner} 已退出，处理了 {consumer.leased} 个工具；队列状态: {stats}")
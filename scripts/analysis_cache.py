@@ -0,0 +1,29 @@
+import json
+import hashlib
+from typing import Dict, Any, Optional
+
+from scripts.disk_cache import DiskCache
+
+
+class AnalysisCache(DiskCache):
+    """
+    基于内容哈希的分析结果磁盘缓存。
+
+    缓存键由模型名称、系统提示、用户提示和温度参数计算得出，只要提示内容不变，
+    重新运行时就直接复用之前的分析结果。
+    """
+
+    label = '分析缓存'
+
+    def __init__(self, cache_dir: str = 'output/analysis_cache', ttl_days: float = 30, max_entries: int = 2000):
+        super().__init__(cache_dir, ttl_days=ttl_days, max_entries=max_entries)
+
+    @staticmethod
+    def make_key(model_name: str, system_prompt: str, user_prompt: str, temperature: float) -> str:
+        """根据请求内容计算缓存键"""
+        payload = json.dumps([model_name, system_prompt, user_prompt, temperature], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def set(self, key: str, analysis: str, metadata: Optional[Dict[str, Any]] = None):
+        """写入缓存条目，只应在分析成功时调用"""
+        self.set_entry(key, {'analysis': analysis, 'metadata': metadata or {}})
@@ -0,0 +1,184 @@
+import math
+import time
+import heapq
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from scripts.metrics import metrics
+
+
+class LatencyEstimator:
+    """
+    单个分析请求耗时的估计，与 TCP 估计重传超时的方法相同：
+    平滑平均 srtt 和平均偏差 rttvar 按指数加权更新，估计值取 srtt + 2 * rttvar，
+    偶尔的慢请求会提高估计值，但不会被单次的异常值主导。
+    initial 为还没有观测值时的估计，None 表示未知。
+    """
+
+    ALPHA = 0.125
+    BETA = 0.25
+
+    def __init__(self, initial: float = None):
+        self.initial = initial
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            if self.srtt is None:
+                self.srtt, self.rttvar = seconds, seconds / 2
+            else:
+                self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - seconds)
+                self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * seconds
+            self.samples += 1
+
+    def estimate(self) -> Optional[float]:
+        """还没有观测值时返回初始估计"""
+        with self._lock:
+            return self.initial if self.srtt is None else self.srtt + 2 * self.rttvar
+
+
+class AnalysisScheduler:
+    """
+    按优先级和截止时间安排分析顺序。
+
+    收集到的工具由后台线程放入优先队列，order() 在分析器有空闲位置时产出当前优先级最高的工具，
+    收集通常比分析快得多，因此越往后排序覆盖的工具越多。优先级为以下各项的加权和：
+      stars    log10(星标数 + 1)
+      growth   上次处理后星标数的增长，log2(现在 / 上次)，新工具为 0
+      recency  最近推送时间，当天为 1，一年前及更早为 0
+      topics   目录和本次运行中都还没有出现过的标签所占的比例
+    设置了截止时间时，按观测到的请求耗时估计下一个分析能否在截止前完成，
+    不能完成时停止分发，剩余（优先级更低的）工具不记为已处理，下次运行时处理。
+    调用方在每个由 order() 产出的工具得到结果后调用 complete()。
+    """
+
+    DEFAULT_WEIGHTS = {'stars': 1.0, 'growth': 2.0, 'recency': 1.0, 'topics': 1.0}
+
+    def __init__(self, weights: Dict[str, float] = None, deadline: datetime = None,
+                 known_tags: Iterable[str] = (), estimator: LatencyEstimator = None):
+        self.weights = dict(self.DEFAULT_WEIGHTS, **(weights or {}))
+        self.deadline = deadline
+        self.estimator = estimator or LatencyEstimator()
+        self.known_tags: Set[str] = {tag.lower() for tag in known_tags}
+        self.skipped = 0
+        self._condition = threading.Condition()
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._sequence = 0
+        self._feeding = False
+        self._stopped = False
+        self._error: Optional[Exception] = None
+        # url -> 分发时间（time.monotonic()）
+        self._dispatched: Dict[str, float] = {}
+
+    @classmethod
+    def parse_weights(cls, spec: str) -> Dict[str, float]:
+        """解析 stars=1,growth=2 这样的权重，未列出的项使用默认值"""
+        weights = {}
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            name, _, value = item.partition('=')
+            name = name.strip()
+            if name not in cls.DEFAULT_WEIGHTS:
+                raise ValueError(f"未知的优先级项: {name}（可选 {', '.join(cls.DEFAULT_WEIGHTS)}）")
+            try:
+                weights[name] = float(value)
+            except ValueError:
+                raise ValueError(f"无法解析的优先级权重: {item}")
+        return weights
+
+    def score(self, tool: Dict[str, Any], now: datetime = None) -> float:
+        stars = tool.get('stars') or 0
+        previous = tool.get('previous_stars')
+        growth = max(0.0, math.log2((stars + 1) / (previous + 1))) if previous is not None else 0.0
+        recency = 0.0
+        if tool.get('pushed_at'):
+            try:
+                pushed = datetime.fromisoformat(tool['pushed_at'].replace('Z', '+00:00'))
+                now = now or datetime.now(timezone.utc)
+                recency = max(0.0, 1 - (now - pushed).days / 365)
+            except (TypeError, ValueError):
+                pass
+        tags = {tag.lower() for tag in tool.get('tags') or []}
+        unseen = len(tags - self.known_tags) / len(tags) if tags else 0.0
+        return (self.weights['stars'] * math.log10(stars + 1) + self.weights['growth'] * growth +
+                self.weights['recency'] * recency + self.weights['topics'] * unseen)
+
+    def _feed(self, tools: Iterable[Dict[str, Any]]):
+        try:
+            for tool in tools:
+                with self._condition:
+                    if self._stopped:
+                        break
+                    tool['priority'] = round(self.score(tool), 3)
+                    # 标签在第一次出现时计入新主题，之后出现的同类工具不再加分
+                    self.known_tags.update(tag.lower() for tag in tool.get('tags') or [])
+                    heapq.heappush(self._heap, (-tool['priority'], self._sequence, tool))
+                    self._sequence += 1
+                    self._condition.notify()
+        except Exception as e:
+            self._error = e
+        finally:
+            # 提前停止时关闭收集器的生成器，让它结束剩余的搜索
+            close = getattr(tools, 'close', None)
+            if close:
+                close()
+            with self._condition:
+                self._feeding = False
+                self._condition.notify_all()
+
+    def _deadline_exceeded(self) -> bool:
+        if self.deadline is None:
+            return False
+        remaining = (self.deadline - datetime.now()).total_seconds()
+        # 第一批分析完成之前没有耗时可以参考，只要还没到截止时间就分发
+        estimate = self.estimator.estimate()
+        return remaining <= 0 or (estimate is not None and remaining < estimate)
+
+    def order(self, tools: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """按优先级从高到低产出 tools 中的工具；收集中的异常会在这里重新抛出"""
+        self._feeding, self._stopped = True, False
+        feeder = threading.Thread(target=self._feed, args=(tools,), name='priority-feeder', daemon=True)
+        feeder.start()
+        try:
+            while True:
+                with self._condition:
+                    while not self._heap and self._feeding:
+                        self._condition.wait()
+                    if not self._heap:
+                        break
+                    if self._deadline_exceeded():
+                        self._stop_for_deadline()
+                        return
+                    _, _, tool = heapq.heappop(self._heap)
+                    self._dispatched[tool['url']] = time.monotonic()
+                yield tool
+        finally:
+            # 提前停止时不等待收集线程：它可能正在等待 GitHub 的响应，会在取到下一个工具时退出
+            with self._condition:
+                self._stopped = True
+                self._heap.clear()
+        feeder.join()
+        if self._error is not None:
+            raise self._error
+
+    def _stop_for_deadline(self):
+        """在持有 _condition 时调用：停止收集，统计已收集但未分发的工具"""
+        self._stopped = True
+        self.skipped = len(self._heap)
+        metrics.counter('deadline_skipped_total', self.skipped)
+        estimate = self.estimator.estimate()
+        reason = f"预计单个分析需要 {estimate:.1f} 秒，" if estimate is not None else ""
+        logging.warning(
+            f"{reason}无法在截止时间 {self.deadline.strftime('%Y-%m-%d %H:%M:%S')} 前完成，停止分发；"
+            f"{self.skipped} 个优先级较低的工具留到下次运行"
+        )
+
+    def complete(self, tool: Dict[str, Any], cached: bool = False):
+        """记录 order() 产出的工具的分析耗时；命中缓存的结果不代表请求耗时，不计入估计"""
+        started = self._dispatched.pop(tool['url'], None)
+        if started is not None and not cached:
+            self.estimator.observe(time.monotonic() - started)
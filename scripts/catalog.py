@@ -0,0 +1,376 @@
+import os
+import sys
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+if __name__ == "__main__":
+    # 直接运行 python scripts/catalog.py 时，把项目根目录加入模块搜索路径
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.report_writer import ReportWriter
+
+
+class Catalog:
+    """
+    收集到的工具和分析结果的本地目录（SQLite）。
+
+    tools 表保存每个仓库的最新信息和分析，按 url、语言、星标数、发现日期和分析时间建立索引；
+    tool_tags 表按标签索引；analyses 表保留每次分析的历史记录。
+    SQLite 支持 FTS5 时，分析内容、名称和描述会建立全文索引，否则文本查询退化为 LIKE。
+    """
+
+    # 更新时保留已有分析的条件：新的分析失败（或没有结果）而已有的分析成功
+    KEEP_PREVIOUS_ANALYSIS = "COALESCE(excluded.success, 0) = 0 AND tools.success = 1"
+
+    def __init__(self, db_path: str = 'output/catalog.db'):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tools (
+                    url TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    description TEXT,
+                    language TEXT,
+                    stars INTEGER,
+                    tags TEXT,
+                    discovered_date TEXT,
+                    pushed_at TEXT,
+                    analysis TEXT,
+                    success INTEGER,
+                    analyzed_at TEXT,
+                    run_id TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_tools_language ON tools(language COLLATE NOCASE);
+                CREATE INDEX IF NOT EXISTS idx_tools_stars ON tools(stars);
+                CREATE INDEX IF NOT EXISTS idx_tools_discovered ON tools(discovered_date);
+                CREATE INDEX IF NOT EXISTS idx_tools_analyzed ON tools(analyzed_at);
+
+                CREATE TABLE IF NOT EXISTS tool_tags (
+                    url TEXT NOT NULL,
+                    tag TEXT NOT NULL,
+                    PRIMARY KEY (url, tag)
+                );
+                CREATE INDEX IF NOT EXISTS idx_tool_tags_tag ON tool_tags(tag);
+
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    run_id TEXT,
+                    analyzed_at TEXT NOT NULL,
+                    success INTEGER,
+                    analysis TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_analyses_url ON analyses(url);
+
+                CREATE TABLE IF NOT EXISTS signatures (
+                    url TEXT PRIMARY KEY,
+                    signature BLOB NOT NULL
+                );
+            """)
+            try:
+                self._conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS tools_fts USING fts5(url UNINDEXED, name, description, analysis)"
+                )
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                logging.warning("当前 SQLite 不支持 FTS5，文本查询将使用 LIKE")
+                self.has_fts = False
+
+    def add(self, tool: Dict[str, Any], success: Optional[bool] = None, run_id: str = None,
+            analyzed_at: str = None):
+        """
+        写入或更新一个工具；首次发现日期保留最早的值，分析历史追加到 analyses 表。
+        失败（或没有结果）的分析不覆盖已有的成功分析，失败记录只出现在 analyses 表中。
+        """
+        analyzed_at = analyzed_at or datetime.now().isoformat(timespec='seconds')
+        tags = tool.get('tags') or []
+        row = {
+            'url': tool['url'],
+            'name': tool['name'],
+            'description': tool.get('description'),
+            'language': tool.get('language'),
+            'stars': tool.get('stars', 0),
+            'tags': json.dumps(tags, ensure_ascii=False),
+            'discovered_date': tool.get('discovered_date'),
+            'pushed_at': tool.get('pushed_at'),
+            'analysis': tool.get('analysis'),
+            'success': None if success is None else int(success),
+            'analyzed_at': analyzed_at,
+            'run_id': run_id
+        }
+        with self._lock, self._conn:
+            self._conn.execute("""
+                INSERT INTO tools (url, name, description, language, stars, tags, discovered_date, pushed_at,
+                                   analysis, success, analyzed_at, run_id)
+                VALUES (:url, :name, :description, :language, :stars, :tags, :discovered_date, :pushed_at,
+                        :analysis, :success, :analyzed_at, :run_id)
+                ON CONFLICT(url) DO UPDATE SET
+                    name = excluded.name,
+                    description = excluded.description,
+                    language = excluded.language,
+                    stars = excluded.stars,
+                    tags = excluded.tags,
+                    discovered_date = MIN(COALESCE(tools.discovered_date, excluded.discovered_date),
+                                          COALESCE(excluded.discovered_date, tools.discovered_date)),
+                    pushed_at = COALESCE(excluded.pushed_at, tools.pushed_at),
+                    analysis = CASE WHEN {keep} THEN tools.analysis ELSE excluded.analysis END,
+                    success = CASE WHEN {keep} THEN tools.success ELSE excluded.success END,
+                    analyzed_at = CASE WHEN {keep} THEN tools.analyzed_at ELSE excluded.analyzed_at END,
+                    run_id = CASE WHEN {keep} THEN tools.run_id ELSE excluded.run_id END
+            """.format(keep=self.KEEP_PREVIOUS_ANALYSIS), row)
+            self._conn.execute("DELETE FROM tool_tags WHERE url = ?", (row['url'],))
+            self._conn.executemany("INSERT OR IGNORE INTO tool_tags (url, tag) VALUES (?, ?)",
+                                   [(row['url'], tag) for tag in tags])
+            self._conn.execute(
+                "INSERT INTO analyses (url, run_id, analyzed_at, success, analysis) VALUES (?, ?, ?, ?, ?)",
+                (row['url'], run_id, analyzed_at, row['success'], row['analysis'])
+            )
+            if self.has_fts:
+                self._conn.execute("DELETE FROM tools_fts WHERE url = ?", (row['url'],))
+                self._conn.execute(
+                    "INSERT INTO tools_fts (url, name, description, analysis) "
+                    "SELECT url, name, description, analysis FROM tools WHERE url = ?",
+                    (row['url'],)
+                )
+
+    def query(self, language: str = None, min_stars: int = None, max_stars: int = None, tag: str = None,
+              text: str = None, since: str = None, until: str = None, success: Optional[bool] = None,
+              order_by: str = 'stars', limit: Optional[int] = 50) -> List[Dict[str, Any]]:
+        """
+        按条件查询工具，返回与报告所用格式相同的工具字典。
+        since / until 按分析日期过滤（YYYY-MM-DD，包含两端），text 为全文检索表达式。
+        """
+        return list(self.iter_query(language, min_stars, max_stars, tag, text, since, until, success, order_by, limit))
+
+    def iter_query(self, language: str = None, min_stars: int = None, max_stars: int = None, tag: str = None,
+                   text: str = None, since: str = None, until: str = None, success: Optional[bool] = None,
+                   order_by: str = 'stars', limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        conditions, params = [], []
+        if language:
+            conditions.append("t.language = ? COLLATE NOCASE")
+            params.append(language)
+        if min_stars is not None:
+            conditions.append("t.stars >= ?")
+            params.append(min_stars)
+        if max_stars is not None:
+            conditions.append("t.stars <= ?")
+            params.append(max_stars)
+        if tag:
+            conditions.append("EXISTS (SELECT 1 FROM tool_tags g WHERE g.url = t.url AND g.tag = ?)")
+            params.append(tag)
+        if since:
+            conditions.append("t.analyzed_at >= ?")
+            params.append(since)
+        if until:
+            # 日期只精确到天时包含当天
+            conditions.append("t.analyzed_at < ?")
+            params.append(until + 'T99' if len(until) == 10 else until)
+        if success is not None:
+            conditions.append("t.success = ?")
+            params.append(int(success))
+        if text:
+            if self.has_fts:
+                conditions.append("t.url IN (SELECT url FROM tools_fts WHERE tools_fts MATCH ?)")
+                params.append(text)
+            else:
+                conditions.append("(t.name LIKE ? OR t.description LIKE ? OR t.analysis LIKE ?)")
+                params.extend([f"%{text}%"] * 3)
+
+        orders = {
+            'stars': "t.stars DESC",
+            'analyzed': "t.analyzed_at DESC",
+            'discovered': "t.discovered_date DESC",
+            'name': "t.name"
+        }
+        sql = "SELECT * FROM tools t"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {orders.get(order_by, orders['stars'])}"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        # 分批读取，生成大型报告时不需要一次性载入全部分析内容
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(500)
+            if not rows:
+                return
+            for row in rows:
+                yield self._row_to_tool(row)
+
+    @staticmethod
+    def _row_to_tool(row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            'name': row['name'],
+            'description': row['description'],
+            'url': row['url'],
+            'source': 'GitHub',
+            'stars': row['stars'] or 0,
+            'language': row['language'] or '未知',
+            'tags': json.loads(row['tags'] or '[]'),
+            'discovered_date': row['discovered_date'],
+            'pushed_at': row['pushed_at'],
+            'analysis': row['analysis'],
+            'success': None if row['success'] is None else bool(row['success']),
+            'analyzed_at': row['analyzed_at'],
+            'run_id': row['run_id']
+        }
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM tools WHERE url = ?", (url,)).fetchone()
+        return self._row_to_tool(row) if row else None
+
+    def set_signature(self, url: str, signature: bytes):
+        """保存工具的近似重复检测签名（见 scripts/dedup.py）"""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO signatures (url, signature) VALUES (?, ?)", (url, signature))
+
+    def iter_signatures(self) -> Iterator[Tuple[str, bytes]]:
+        """已成功分析的工具的签名 (url, signature)"""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT s.url, s.signature FROM signatures s JOIN tools t ON t.url = s.url WHERE t.success = 1
+            """).fetchall()
+        yield from rows
+
+    def known_tags(self) -> List[str]:
+        """目录中出现过的全部标签"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT tag FROM tool_tags")]
+
+    def history(self, url: str) -> List[Dict[str, Any]]:
+        """返回指定仓库的全部分析记录，按时间从新到旧"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id, analyzed_at, success, analysis FROM analyses WHERE url = ? ORDER BY id DESC", (url,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tools").fetchone()[0]
+
+    def import_jsonl(self, jsonl_path: str) -> int:
+        """导入 ReportWriter 生成的 JSON Lines 文件，返回导入的工具数量"""
+        run_id = os.path.basename(jsonl_path).rsplit('.', 1)[0].replace('ai_tools_', '')
+        count = 0
+        with open(jsonl_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    tool = json.loads(line)
+                except ValueError:
+                    continue
+                self.add(tool, tool.get('success'), run_id,
+                         analyzed_at=tool.get('analyzed_at') or tool.get('discovered_date'))
+                count += 1
+        return count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def write_report(catalog: Catalog, filename: str, **filters) -> int:
+    """根据查询结果生成报告（Markdown / JSON Lines / CSV），不需要网络请求，返回工具数量"""
+    writer = ReportWriter(filename)
+    try:
+        for tool in catalog.iter_query(**filters):
+            writer.add(tool, tool['success'])
+    finally:
+        writer.close()
+    return writer.count
+
+
+def main(argv: List[str] = None) -> int:
+    """命令行入口，也供 cli.py catalog 调用"""
+    import argparse
+    parser = argparse.ArgumentParser(prog='catalog', description='查询本地工具目录，或根据目录重新生成报告')
+    parser.add_argument('--db', default='output/catalog.db', help='目录数据库路径（默认 output/catalog.db）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_filters(sub):
+        sub.add_argument('--language', help='编程语言')
+        sub.add_argument('--min-stars', type=int, help='最少星标数')
+        sub.add_argument('--max-stars', type=int, help='最多星标数')
+        sub.add_argument('--tag', help='包含的标签')
+        sub.add_argument('--text', help='在名称、描述和分析内容中全文检索')
+        sub.add_argument('--since', help='分析日期不早于（YYYY-MM-DD）')
+        sub.add_argument('--until', help='分析日期不晚于（YYYY-MM-DD）')
+        sub.add_argument('--failed', action='store_true', help='只包含分析失败的工具')
+        sub.add_argument('--order-by', default='stars', choices=['stars', 'analyzed', 'discovered', 'name'])
+
+    query_parser = subparsers.add_parser('query', help='查询工具')
+    add_filters(query_parser)
+    query_parser.add_argument('--limit', type=int, default=50, help='最多显示的数量（默认50）')
+    query_parser.add_argument('--json', action='store_true', help='以 JSON Lines 输出完整记录')
+
+    report_parser = subparsers.add_parser('report', help='根据查询结果生成报告')
+    add_filters(report_parser)
+    report_parser.add_argument('--limit', type=int, help='最多包含的数量')
+    report_parser.add_argument('--output', help='报告文件名（默认 output/catalog_report_<时间>.md）')
+
+    import_parser = subparsers.add_parser('import', help='导入已有的 JSON Lines 报告')
+    import_parser.add_argument('files', nargs='+', help='ai_tools_*.jsonl 文件')
+
+    args = parser.parse_args(argv)
+    catalog = Catalog(args.db)
+    try:
+        return _run_command(catalog, args)
+    finally:
+        catalog.close()
+
+
+def _run_command(catalog: Catalog, args) -> int:
+    if args.command == 'import':
+        for path in args.files:
+            print(f"{path}: 导入 {catalog.import_jsonl(path)} 个工具")
+        print(f"目录中共有 {len(catalog)} 个工具")
+        return 0
+
+    filters = {
+        'language': args.language,
+        'min_stars': args.min_stars,
+        'max_stars': args.max_stars,
+        'tag': args.tag,
+        'text': args.text,
+        'since': args.since,
+        'until': args.until,
+        'success': False if args.failed else None,
+        'order_by': args.order_by,
+        'limit': args.limit
+    }
+    if args.command == 'query':
+        try:
+            tools = catalog.query(**filters)
+        except sqlite3.OperationalError as e:
+            print(f"查询失败（检索表达式是否有效？）: {str(e)}")
+            return 1
+        for tool in tools:
+            if args.json:
+                print(json.dumps(tool, ensure_ascii=False))
+            else:
+                print(f"{tool['stars']:>8} ⭐  {tool['name']}  [{tool['language']}]  {tool['analyzed_at']}  {tool['url']}")
+        if not args.json:
+            print(f"共 {len(tools)} 个工具")
+    else:
+        filename = args.output or f"output/catalog_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.md"
+        count = write_report(catalog, filename, **filters)
+        print(f"已根据 {count} 个工具生成报告: {filename}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
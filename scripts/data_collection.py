@@ -1,44 +1,77 @@
 import os
+import sys
+
+if __name__ == "__main__":
+    # 参数解析在 cli.py 中，python3 scripts/data_collection.py 等同于 python3 cli.py collect；
+    # 在导入网络相关的模块之前转发，--show 等管理操作不需要加载它们
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from cli import main as cli_main
+    sys.exit(cli_main(['collect'] + sys.argv[1:]))
+
 import logging
 import requests
 from datetime import datetime
-import time
-import random
 import json
-from typing import List, Dict, Set
+import math
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Iterator, List, Dict, Tuple
+
+from scripts.http_cache import HttpCache
+from scripts.http_client import http_client
+from scripts.metrics import metrics
+from scripts.rate_limiter import RateLimitScheduler
+from scripts.seen_store import SeenStore, open_seen_store
 
 class DataCollector:
-    def __init__(self):
+    TOPICS = ['ai-tools', 'artificial-intelligence', 'machine-learning', 'deep-learning']
+    # 构建工具信息所需的搜索结果字段，缺失时才单独补充
+    REQUIRED_FIELDS = ('topics', 'stargazers_count', 'language', 'description')
+    # 单次 GraphQL 查询包含的仓库数量
+    GRAPHQL_BATCH_SIZE = 50
+    # 星标数按对数分桶，每个桶约为上一个的 1.41 倍，小幅波动不会触发重新分析
+    STARS_BUCKETS_PER_DOUBLING = 2
+
+    def __init__(self, max_pages: int = 3, per_page: int = 30, max_workers: int = 4, use_http_cache: bool = True,
+                 seen_store: SeenStore = None, api_base: str = None, refresh_changed: bool = True):
         self.headers = {
             'Accept': 'application/vnd.github.v3+json',
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
         }
-        self.seen_file = 'output/github_seen_urls.json'
-        self.seen_urls = self._load_seen_urls()
-        self.api_base = "https://api.github.com"
-
-    def _load_seen_urls(self) -> Set[str]:
-        if os.path.exists(self.seen_file):
-            with open(self.seen_file, 'r', encoding='utf-8') as f:
-                try:
-                    return set(json.load(f))
-                except Exception:
-                    return set()
-        return set()
+        # 可选的 GitHub 令牌，提高速率限制并启用 GraphQL 批量查询
+        self.github_token = os.getenv('GITHUB_TOKEN')
+        if self.github_token:
+            self.headers['Authorization'] = f'Bearer {self.github_token}'
+        # 已处理仓库存储，首次使用时自动迁移旧版 github_seen_urls.json
+        self.seen_store = seen_store or open_seen_store()
+        # 已处理的仓库指纹发生变化时重新产出，用于刷新分析
+        self.refresh_changed = refresh_changed
+        # 可以通过参数或 GITHUB_API_BASE 指向 GitHub Enterprise 或本地模拟服务
+        self.api_base = (api_base or os.getenv('GITHUB_API_BASE') or "https://api.github.com").rstrip('/')
+        # 每个主题最多翻页数和每页数量
+        self.max_pages = max(1, max_pages)
+        self.per_page = per_page
+        self.max_workers = max_workers
+        self.session = self._create_session()
+        # 条件请求缓存，未变化的搜索结果页返回 304，不消耗配额
+        self.http_cache = HttpCache() if use_http_cache else None
+        # GitHub 的 search、core 和 graphql 配额相互独立，初始速率在收到响应头后会被校正
+        self.rate_limiters = {
+            'search': RateLimitScheduler('github-search', rate=0.5, burst=len(self.TOPICS)),
+            'core': RateLimitScheduler('github-core', rate=5, burst=10),
+            'graphql': RateLimitScheduler('github-graphql', rate=2, burst=2)
+        }
 
-    def _save_seen_urls(self):
-        os.makedirs(os.path.dirname(self.seen_file), exist_ok=True)
-        with open(self.seen_file, 'w', encoding='utf-8') as f:
-            # 将 URL 列表按字母顺序排序后保存，方便查看
-            json.dump(sorted(list(self.seen_urls)), f, ensure_ascii=False, indent=2)
+    def _create_session(self):
+        """使用进程内共享的连接池，连接数需要容纳并发的搜索和元数据请求"""
+        return http_client.configure(self.api_base, max_connections=self.max_workers * 2, timeout=(10, 30))
 
     def show_processed_repos(self) -> List[str]:
         """显示已处理过的仓库列表"""
-        if not self.seen_urls:
+        if not self.seen_store:
             print("还没有处理过任何仓库")
             return []
         
-        urls = sorted(list(self.seen_urls))
+        urls = list(self.seen_store)
         print(f"\n已处理的仓库 (共 {len(urls)} 个):")
         for i, url in enumerate(urls, 1):
             print(f"{i}. {url}")
@@ -46,16 +79,12 @@ class DataCollector:
 
     def clear_processed_repos(self):
         """清空已处理的仓库列表"""
-        self.seen_urls.clear()
-        if os.path.exists(self.seen_file):
-            os.remove(self.seen_file)
+        self.seen_store.clear()
         print("已清空所有处理记录")
 
     def remove_processed_repo(self, url: str):
         """从已处理列表中移除指定的仓库"""
-        if url in self.seen_urls:
-            self.seen_urls.remove(url)
-            self._save_seen_urls()
+        if self.seen_store.remove(url):
             print(f"已从处理记录中移除: {url}")
         else:
             print(f"未找到该仓库: {url}")
@@ -65,102 +94,262 @@ class DataCollector:
         tools = self._collect_from_github()
         logging.info(f"从 GitHub 收集到 {len(tools)} 个新工具")
         # 更新已抓取url
-        for tool in tools:
-            self.seen_urls.add(tool['url'])
-        self._save_seen_urls()
+        self.seen_store.add_many({'url': tool['url'], 'last_stars': tool['stars'],
+                                  'fingerprint': self._dump_fingerprint(tool['fingerprint'])}
+                                 for tool in tools)
         return tools
 
-    def _collect_from_github(self):
-        """Collect tools from GitHub using the API"""
-        tools = []
-        topics = ['ai-tools', 'artificial-intelligence', 'machine-learning', 'deep-learning']
-        
-        for topic in topics:
+    def _rate_limiter_for(self, url: str) -> RateLimitScheduler:
+        """根据请求路径选择对应的 GitHub 速率限制类别"""
+        if '/search/' in url:
+            return self.rate_limiters['search']
+        if url.endswith('/graphql'):
+            return self.rate_limiters['graphql']
+        return self.rate_limiters['core']
+
+    def _github_request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """通过速率限制调度器发送 GitHub 请求"""
+        # 共享会话不带 GitHub 的请求头，每次请求时合并
+        kwargs['headers'] = dict(self.headers, **(kwargs.get('headers') or {}))
+        response = self._rate_limiter_for(url).request(self.session, method, url, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def _github_get(self, url: str, params: Dict = None) -> Tuple[Any, Dict]:
+        """
+        发送 GitHub GET 请求，返回 (响应 JSON, 分页链接)。
+        启用 HTTP 缓存时发送条件请求，收到 304 则使用本地缓存的响应体。
+        """
+        if not self.http_cache:
+            response = self._github_request('GET', url, params=params)
+            return response.json(), response.links
+
+        cache_key = HttpCache.make_key(url, params)
+        cached = self.http_cache.get(cache_key)
+        response = self._github_request('GET', url, params=params, headers=HttpCache.conditional_headers(cached))
+        if response.status_code == 304 and cached:
+            logging.debug(f"GitHub 返回 304，使用本地缓存: {url}")
+            self.http_cache.mark_not_modified()
+            metrics.counter('github_not_modified_total')
+            return cached['body'], cached.get('links') or {}
+
+        data = response.json()
+        self.http_cache.store(cache_key, response, data)
+        return data, response.links
+
+    def _search_topic(self, topic: str) -> List[Dict]:
+        """按星标数搜索指定主题的仓库，沿 Link 头翻页，最多 max_pages 页"""
+        url = f"{self.api_base}/search/repositories"
+        params = {
+            'q': f'topic:{topic}',
+            'sort': 'stars',
+            'order': 'desc',
+            'per_page': self.per_page
+        }
+        repos = []
+        for _ in range(self.max_pages):
+            with metrics.span('github_search', topic=topic):
+                data, links = self._github_get(url, params=params)
+
+            if 'items' not in data:
+                logging.warning(f"主题 {topic} 的响应中没有找到 items 字段")
+                break
+            repos.extend(data['items'])
+
+            next_link = links.get('next')
+            if not next_link:
+                break
+            # 下一页 URL 已经包含全部查询参数
+            url, params = next_link['url'], None
+
+        logging.info(f"主题 {topic} 找到 {len(repos)} 个仓库")
+        return repos
+
+    def _has_missing_fields(self, repo: Dict) -> bool:
+        # language 和 description 为 null 是合法值，只有字段不存在时才需要补充
+        return any(field not in repo for field in self.REQUIRED_FIELDS) \
+            or repo.get('topics') is None or repo.get('stargazers_count') is None
+
+    def _fill_missing_metadata(self, repos: List[Dict]):
+        """为搜索结果中缺少字段的仓库补充元数据，优先使用 GraphQL 批量查询"""
+        missing = [repo for repo in repos if self._has_missing_fields(repo)]
+        if not missing:
+            return
+        logging.info(f"{len(missing)} 个仓库的搜索结果缺少字段，需要单独补充")
+
+        if self.github_token:
+            for start in range(0, len(missing), self.GRAPHQL_BATCH_SIZE):
+                batch = missing[start:start + self.GRAPHQL_BATCH_SIZE]
+                try:
+                    with metrics.span('github_metadata', method='graphql'):
+                        self._fetch_metadata_graphql(batch)
+                except (requests.RequestException, ValueError, KeyError) as e:
+                    logging.warning(f"GraphQL 批量查询失败，改用逐个请求: {str(e)}")
+
+        # 没有令牌（GraphQL 需要认证）或批量查询失败时，逐个补充主题
+        for repo in missing:
+            if repo.get('topics') is not None:
+                continue
+            topics_url = f"{self.api_base}/repos/{repo['full_name']}/topics"
             try:
-                # 使用 GitHub API 搜索带有特定主题的仓库
-                url = f"{self.api_base}/search/repositories"
-                params = {
-                    'q': f'topic:{topic}',
-                    'sort': 'stars',
-                    'order': 'desc',
-                    'per_page': 20
-                }
-                
-                # 添加随机延迟
-                time.sleep(random.uniform(2, 5))
-                
-                response = requests.get(url, headers=self.headers, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                if 'items' not in data:
-                    logging.warning(f"主题 {topic} 的响应中没有找到 items 字段")
+                with metrics.span('github_metadata', method='rest'):
+                    repo['topics'] = self._github_get(topics_url)[0].get('names')
+            except requests.RequestException as e:
+                logging.warning(f"获取仓库 {repo['full_name']} 的主题失败: {str(e)}")
+
+    def _fetch_metadata_graphql(self, repos: List[Dict]):
+        """用一次 GraphQL 查询获取多个仓库的主题、星标数、语言和描述"""
+        fields = """
+            description
+            stargazerCount
+            pushedAt
+            primaryLanguage { name }
+            repositoryTopics(first: 20) { nodes { topic { name } } }
+        """
+        parts = []
+        for i, repo in enumerate(repos):
+            owner, name = repo['full_name'].split('/', 1)
+            parts.append(f"r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {fields} }}")
+        query = "query {\n" + "\n".join(parts) + "\n}"
+
+        response = self._github_request('POST', f"{self.api_base}/graphql", json={'query': query})
+        data = response.json().get('data') or {}
+
+        for i, repo in enumerate(repos):
+            node = data.get(f"r{i}")
+            if not node:
+                continue
+            if repo.get('topics') is None and 'repositoryTopics' in node:
+                repo['topics'] = [n['topic']['name'] for n in node['repositoryTopics']['nodes']]
+            if repo.get('stargazers_count') is None and 'stargazerCount' in node:
+                repo['stargazers_count'] = node['stargazerCount']
+            if 'language' not in repo and node.get('primaryLanguage'):
+                repo['language'] = node['primaryLanguage']['name']
+            if 'description' not in repo and 'description' in node:
+                repo['description'] = node['description']
+            if repo.get('pushed_at') is None and node.get('pushedAt'):
+                repo['pushed_at'] = node['pushedAt']
+
+    def _build_tool(self, repo: Dict) -> Dict:
+        """直接从搜索结果构建工具信息"""
+        return {
+            "name": repo['full_name'].replace('/', ' / '),
+            "description": repo.get('description') or "无描述",
+            "url": repo['html_url'],
+            "source": "GitHub",
+            "stars": repo.get('stargazers_count') or 0,
+            "language": repo.get('language') or "未知",
+            "tags": repo.get('topics') or repo['_matched_topics'][:1],
+            "discovered_date": datetime.now().strftime('%Y-%m-%d'),
+            "pushed_at": repo.get('pushed_at'),
+            "fingerprint": self._fingerprint(repo),
+            # 重新分析时记录发生变化的字段
+            "changes": repo.get('_changes') or [],
+            # 上次处理时的星标数，新工具为 None，用于计算分析优先级
+            "previous_stars": repo.get('_previous_stars')
+        }
+
+    def _fingerprint(self, repo: Dict) -> Dict[str, Any]:
+        """
+        仓库的指纹：星标数分桶、描述、主题和最近推送的月份。
+        缺失的字段记为 None，比较时跳过。
+        """
+        stars = repo.get('stargazers_count')
+        topics = repo.get('topics')
+        pushed_at = repo.get('pushed_at')
+        return {
+            'stars_bucket': int(math.log2(stars + 1) * self.STARS_BUCKETS_PER_DOUBLING) if stars is not None else None,
+            'description': repo.get('description'),
+            'topics': sorted(topics) if topics is not None else None,
+            # 只按月份比较，活跃仓库最多每月重新分析一次
+            'pushed_month': pushed_at[:7] if pushed_at else None
+        }
+
+    @staticmethod
+    def _dump_fingerprint(fingerprint: Dict[str, Any]) -> str:
+        return json.dumps(fingerprint, ensure_ascii=False, sort_keys=True) if fingerprint else None
+
+    def _changed_fields(self, record: Dict[str, Any], repo: Dict) -> List[str]:
+        """与已保存的指纹比较，返回发生变化的字段；没有保存指纹的旧记录视为没有变化"""
+        if not record.get('fingerprint'):
+            return []
+        try:
+            previous = json.loads(record['fingerprint'])
+        except ValueError:
+            return []
+        current = self._fingerprint(repo)
+        return [field for field, value in current.items()
+                if value is not None and previous.get(field) is not None and previous[field] != value]
+
+    def iter_new_tools(self) -> Iterator[Dict]:
+        """
+        并发搜索所有主题，每个主题的结果一返回就产出其中的新工具。
+        已处理过的仓库只有在指纹变化时才会再次产出（工具的 changes 字段列出变化的字段）。
+        跨主题重复的仓库只产出一次；不会修改已处理记录，由调用方在处理完成后调用 mark_seen。
+        """
+        emitted = set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(self._search_topic, topic): topic for topic in self.TOPICS}
+            for future in as_completed(futures):
+                topic = futures[future]
+                try:
+                    repos = future.result()
+                except Exception as e:
+                    logging.error(f"从 GitHub 主题 {topic} 收集数据时出错: {str(e)}", exc_info=True)
                     continue
-                
-                repos = data['items']
-                logging.info(f"主题 {topic} 找到 {len(repos)} 个仓库")
-                
+
+                # 先去重，再做需要额外请求的补充工作
+                new_repos = []
                 for repo in repos:
+                    url = repo.get('html_url')
+                    if not url or url in emitted:
+                        continue
+                    emitted.add(url)
+                    record = self.seen_store.get(url)
+                    changes = self._seen_repo_changes(url, record, repo) if record else []
+                    if record and not changes:
+                        logging.debug(f"仓库已经处理过: {url}")
+                        continue
+                    new_repos.append(dict(repo, _matched_topics=[topic], _changes=changes,
+                                          _previous_stars=record.get('last_stars') if record else None))
+
+                self._fill_missing_metadata(new_repos)
+
+                for repo in new_repos:
                     try:
-                        url = repo['html_url']
-                        if url in self.seen_urls:
-                            logging.debug(f"仓库已经处理过: {url}")
-                            continue
-                        
-                        name = repo['full_name'].replace('/', ' / ')
-                        description = repo['description'] or "无描述"
-                        stars = repo['stargazers_count']
-                        language = repo['language'] or "未知"
-                        
-                        # 获取仓库的主题
-                        topics_url = f"{self.api_base}/repos/{repo['full_name']}/topics"
-                        topics_response = requests.get(topics_url, headers=self.headers)
-                        topics_data = topics_response.json()
-                        tag_list = topics_data.get('names', [topic])
-                        
-                        tools.append({
-                            "name": name,
-                            "description": description,
-                            "url": url,
-                            "source": "GitHub",
-                            "stars": stars,
-                            "language": language,
-                            "tags": tag_list,
-                            "discovered_date": datetime.now().strftime('%Y-%m-%d')
-                        })
-                        logging.info(f"找到新工具: {name} (⭐ {stars})")
-                        
-                        # 添加短暂延迟，避免触发 API 限制
-                        time.sleep(random.uniform(0.5, 1))
-                        
+                        tool = self._build_tool(repo)
                     except Exception as e:
                         logging.error(f"处理仓库时出错: {str(e)}", exc_info=True)
                         continue
-                
-            except Exception as e:
-                logging.error(f"从 GitHub 主题 {topic} 收集数据时出错: {str(e)}", exc_info=True)
-                continue
-        
+                    if tool['changes']:
+                        logging.info(f"仓库有变化，重新分析: {tool['name']} ({', '.join(tool['changes'])})")
+                    else:
+                        logging.info(f"找到新工具: {tool['name']} (⭐ {tool['stars']})")
+                    yield tool
+        finally:
+            # 调用方提前停止迭代时不再等待剩余的搜索
+            executor.shutdown(wait=False, cancel_futures=True)
+            if self.http_cache:
+                stats = self.http_cache.stats()
+                logging.info(f"HTTP 缓存: 304 命中 {stats['not_modified']} 次, 共 {stats['entries']} 个条目")
+
+    def _seen_repo_changes(self, url: str, record: Dict[str, Any], repo: Dict) -> List[str]:
+        """已处理仓库的变化字段；旧记录没有指纹时补上当前指纹，之后的变化才能被发现"""
+        if not self.refresh_changed:
+            return []
+        if not record.get('fingerprint'):
+            self.seen_store.add(url, fingerprint=self._dump_fingerprint(self._fingerprint(repo)))
+            return []
+        return self._changed_fields(record, repo)
+
+    def mark_seen(self, tool: Dict, analysis_hash: str = None):
+        """在工具处理结果持久化之后，将其记为已处理，同时保存分析时的指纹"""
+        self.seen_store.add(tool['url'], last_stars=tool.get('stars'), analysis_hash=analysis_hash,
+                            fingerprint=self._dump_fingerprint(tool.get('fingerprint')))
+
+    def _collect_from_github(self):
+        """Collect tools from GitHub using the API"""
+        tools = list(self.iter_new_tools())
         # Sort tools by stars
         return sorted(tools, key=lambda x: x['stars'], reverse=True)
-
-if __name__ == "__main__":
-    collector = DataCollector()
-    
-    # 添加命令行参数解析
-    import argparse
-    parser = argparse.ArgumentParser(description='GitHub AI 工具收集器')
-    parser.add_argument('--show', action='store_true', help='显示已处理的仓库列表')
-    parser.add_argument('--clear', action='store_true', help='清空已处理的仓库列表')
-    parser.add_argument('--remove', type=str, help='从已处理列表中移除指定的仓库 URL')
-    args = parser.parse_args()
-    
-    if args.show:
-        collector.show_processed_repos()
-    elif args.clear:
-        collector.clear_processed_repos()
-    elif args.remove:
-        collector.remove_processed_repo(args.remove)
-    else:
-        tools = collector.collect_all_data()
-        print(f"收集到 {len(tools)} 个新工具")
\ No newline at end of file
@@ -0,0 +1,229 @@
+import re
+import array
+import random
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Set, Tuple
+
+from scripts.metrics import metrics
+
+
+class MinHasher:
+    """
+    名称、描述和主题的 MinHash 签名。
+
+    文本切分为英文单词和中文字符二元组，每个词先哈希为 64 位整数，
+    再用 num_perm 个 (a * x + b) mod p 置换取最小值得到签名。
+    两个签名相同位置相等的比例是两组词 Jaccard 相似度的估计。
+    """
+
+    PRIME = (1 << 61) - 1
+    TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[一-鿿]+')
+    # 词太少时相似度估计不可靠（例如没有描述的仓库），不参与去重
+    MIN_TOKENS = 4
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.permutations = [(rng.randrange(1, self.PRIME), rng.randrange(0, self.PRIME)) for _ in range(num_perm)]
+
+    @classmethod
+    def tokens(cls, tool: Dict[str, Any]) -> Set[str]:
+        """仓库名（不含所有者，fork 和镜像的所有者不同）、描述和标签中的词"""
+        name = tool['name'].split(' / ')[-1]
+        description = tool.get('description') or ''
+        if description == '无描述':
+            description = ''
+        text = ' '.join([name, description] + list(tool.get('tags') or [])).lower()
+        tokens = set()
+        for word in cls.TOKEN_PATTERN.findall(text):
+            if word[0] >= '一':
+                tokens.update(word[i:i + 2] for i in range(max(1, len(word) - 1)))
+            else:
+                tokens.add(word)
+        return tokens
+
+    def signature(self, tokens: Iterable[str]) -> Optional[array.array]:
+        hashes = [int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+                  for token in tokens]
+        if len(hashes) < self.MIN_TOKENS:
+            return None
+        prime = self.PRIME
+        return array.array('Q', (min((a * h + b) % prime for h in hashes) for a, b in self.permutations))
+
+    @staticmethod
+    def similarity(first: array.array, second: array.array) -> float:
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+
+class LshIndex:
+    """
+    MinHash 签名的 LSH 索引：签名分为 bands 段，任意一段完全相同的签名成为候选，
+    只对候选计算相似度，查询耗时与索引大小基本无关。
+    64 个置换分为 16 段时，相似度 0.8 的两项成为候选的概率超过 99.9%。
+    """
+
+    def __init__(self, bands: int = 16):
+        self.bands = bands
+        self._buckets: List[Dict[Tuple[int, ...], List[str]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[str, array.array] = {}
+
+    def _band_keys(self, signature: array.array) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+        rows = len(signature) // self.bands
+        for band in range(self.bands):
+            yield band, tuple(signature[band * rows:(band + 1) * rows])
+
+    def add(self, url: str, signature: array.array):
+        if url in self._signatures:
+            self.remove(url)
+        self._signatures[url] = signature
+        for band, key in self._band_keys(signature):
+            self._buckets[band].setdefault(key, []).append(url)
+
+    def remove(self, url: str):
+        signature = self._signatures.pop(url, None)
+        if signature is None:
+            return
+        for band, key in self._band_keys(signature):
+            bucket = self._buckets[band].get(key)
+            if bucket and url in bucket:
+                bucket.remove(url)
+                if not bucket:
+                    del self._buckets[band][key]
+
+    def candidates(self, signature: array.array, min_similarity: float, exclude: str = None) -> List[Tuple[str, float]]:
+        """估计相似度不低于 min_similarity 的候选 [(url, 估计相似度)]，按相似度从高到低排列"""
+        urls = set()
+        for band, key in self._band_keys(signature):
+            urls.update(self._buckets[band].get(key, ()))
+        urls.discard(exclude)
+        scored = [(url, MinHasher.similarity(signature, self._signatures[url])) for url in urls]
+        return sorted((item for item in scored if item[1] >= min_similarity), key=lambda item: -item[1])
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+
+class DuplicateFilter:
+    """
+    收集和分析之间的近似重复检测。
+
+    索引包含目录中已成功分析（且不是沿用分析）的工具，以及本次运行中已交给分析器的工具。
+    filter() 只产出没有近似重复项的工具；重复的工具不再请求 API，
+    在被参照的工具分析成功后由 pop_resolved() 返回沿用其分析的结果。
+    被参照的工具分析失败时，等待它的重复项不会产出，也不会被记为已处理，下次运行时重新处理。
+    调用方在每个工具的分析结果写入目录之后调用 record()。
+
+    签名的估计值只用于筛选候选，是否重复按两组词的实际 Jaccard 相似度判断，
+    避免只差一个版本号之类的仓库因估计误差被误判。
+    """
+
+    # 估计相似度比阈值低这么多以内的候选仍会计算实际相似度
+    ESTIMATE_MARGIN = 0.15
+    # 每个工具最多核对的候选数量
+    MAX_CANDIDATES = 5
+
+    def __init__(self, catalog, threshold: float = 0.85, hasher: MinHasher = None):
+        self.catalog = catalog
+        self.threshold = threshold
+        self.hasher = hasher or MinHasher()
+        self.index = LshIndex()
+        self.reused = 0
+        self._lock = threading.Lock()
+        # 本次运行中已提交分析、尚未得到结果的工具的签名
+        self._in_flight: Dict[str, array.array] = {}
+        # 本次运行中加入索引的工具的词，目录中的工具按需从目录读取
+        self._tokens: Dict[str, Set[str]] = {}
+        # 参照对象 url -> 等待它完成的 (工具, 相似度)
+        self._waiting: Dict[str, List[Tuple[Dict[str, Any], float]]] = {}
+        self._resolved: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        for url, blob in catalog.iter_signatures():
+            signature = array.array('Q')
+            signature.frombytes(blob)
+            if len(signature) == self.hasher.num_perm:
+                self.index.add(url, signature)
+        logging.info(f"近似重复检测: 已载入 {len(self.index)} 个已分析工具的签名")
+
+    def _best_match(self, tokens: Set[str], signature: array.array, url: str) -> Tuple[Optional[str], float]:
+        candidates = self.index.candidates(signature, self.threshold - self.ESTIMATE_MARGIN, exclude=url)
+        best_url, best = None, 0.0
+        for candidate, _ in candidates[:self.MAX_CANDIDATES]:
+            other = self._tokens.get(candidate)
+            if other is None:
+                reference = self.catalog.get(candidate)
+                other = MinHasher.tokens(reference) if reference else set()
+            similarity = len(tokens & other) / len(tokens | other) if other else 0.0
+            if similarity >= self.threshold and similarity > best:
+                best_url, best = candidate, similarity
+        return best_url, best
+
+    def _track(self, url: str, tokens: Set[str], signature: array.array):
+        self.index.add(url, signature)
+        self._in_flight[url] = signature
+        self._tokens[url] = tokens
+
+    def filter(self, tools: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for tool in tools:
+            tokens = MinHasher.tokens(tool)
+            signature = self.hasher.signature(tokens)
+            if signature is None:
+                yield tool
+                continue
+            with self._lock:
+                match, similarity = self._best_match(tokens, signature, tool['url'])
+                if match is None:
+                    self._track(tool['url'], tokens, signature)
+                elif match in self._in_flight:
+                    self._waiting.setdefault(match, []).append((tool, similarity))
+                    metrics.counter('duplicates_total', source='run')
+                else:
+                    reference = self.catalog.get(match)
+                    metrics.counter('duplicates_total', source='catalog')
+                    if reference and reference.get('success'):
+                        self._resolved.append(self._reuse(tool, reference, similarity))
+                    else:
+                        # 目录中的记录已经变为失败，改为单独分析
+                        self.index.remove(match)
+                        self._track(tool['url'], tokens, signature)
+                        match = None
+            if match is None:
+                yield tool
+            else:
+                logging.info(f"{tool['name']} 与 {match} 相似度 {similarity:.0%}，沿用已有分析")
+
+    def record(self, tool: Dict[str, Any], success: bool):
+        """记录一个经过 filter() 的工具的分析结果；成功时保存签名，并解决等待它的重复项"""
+        url = tool['url']
+        with self._lock:
+            signature = self._in_flight.pop(url, None)
+            waiting = self._waiting.pop(url, [])
+            if signature is None:
+                return
+            if not success:
+                self.index.remove(url)
+                self._tokens.pop(url, None)
+                if waiting:
+                    logging.warning(f"{tool['name']} 分析失败，{len(waiting)} 个相似的工具将在下次运行时处理")
+                return
+            for duplicate, similarity in waiting:
+                self._resolved.append(self._reuse(duplicate, tool, similarity))
+        self.catalog.set_signature(url, signature.tobytes())
+
+    def pop_resolved(self) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """取出已经可以沿用分析的重复工具 [(tool, analysis_result)]"""
+        with self._lock:
+            resolved, self._resolved = self._resolved, []
+        return resolved
+
+    def pending(self) -> int:
+        """仍在等待参照对象的重复工具数量"""
+        with self._lock:
+            return sum(len(items) for items in self._waiting.values())
+
+    def _reuse(self, tool: Dict[str, Any], reference: Dict[str, Any], similarity: float):
+        self.reused += 1
+        tool['duplicate_of'] = reference['url']
+        analysis = (f"> 与 [{reference['name']}]({reference['url']}) 高度相似（相似度 {similarity:.0%}），"
+                    f"沿用其分析，未单独请求 API。\n\n{reference['analysis']}")
+        return tool, {"analysis": analysis, "success": True}
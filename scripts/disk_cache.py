@@ -0,0 +1,144 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+
+class DiskCache:
+    """
+    以 JSON 文件保存的键值磁盘缓存。
+
+    每个条目保存为 cache_dir/<键前两位>/<键>.json。超过有效期的条目在读取时被丢弃，
+    条目数超过上限时按最近使用时间（文件修改时间）淘汰最旧的条目，直到低于上限的 90%。
+    """
+
+    label = '磁盘缓存'
+    # 超过上限时淘汰到上限的这个比例
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir: str, ttl_days: float = 30, max_entries: int = 2000):
+        self.cache_dir = cache_dir
+        self.ttl = timedelta(days=ttl_days) if ttl_days and ttl_days > 0 else None
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # 只保护计数，文件读写不持有锁
+        self._lock = threading.Lock()
+        self._evicting = False
+        self._entry_count = len(self._list_entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _list_entries(self):
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    entries.append(os.path.join(root, name))
+        return entries
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存条目，未命中或已过期时返回 None；文件读写不持有锁，多个线程可以同时读取"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count('misses')
+            return None
+
+        cached_at = datetime.fromisoformat(entry.get('cached_at', '1970-01-01T00:00:00'))
+        if self.ttl and datetime.now() - cached_at > self.ttl:
+            logging.debug(f"{self.label}已过期: {key[:12]}")
+            self._remove(path)
+            self._count('misses')
+            return None
+
+        # 更新修改时间，作为 LRU 淘汰的依据
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        self._count('hits')
+        return entry
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def set_entry(self, key: str, entry: Dict[str, Any]):
+        """写入缓存条目；先写到本线程的临时文件再替换，同一个键的并发写入互不影响"""
+        path = self._path(key)
+        entry = dict(entry, cached_at=datetime.now().isoformat())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            existed = os.path.exists(path)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"写入{self.label}时出错: {str(e)}")
+            return
+
+        with self._lock:
+            if not existed:
+                self._entry_count += 1
+            if not self.max_entries or self._entry_count <= self.max_entries or self._evicting:
+                return
+            self._evicting = True
+        try:
+            self._evict()
+        finally:
+            with self._lock:
+                self._evicting = False
+
+    def _remove(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self._entry_count = max(0, self._entry_count - 1)
+
+    def _evict(self):
+        """
+        按最近使用时间淘汰最旧的条目，直到不超过上限的 EVICT_TO（低水位）。
+        每次淘汰需要扫描所有条目，一次淘汰到低水位后，之后的多次写入才会再触发扫描。
+        只有一个线程执行淘汰，其他线程的读写不等待。
+        """
+        entries = []
+        for path in self._list_entries():
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        with self._lock:
+            self._entry_count = len(entries)
+        overflow = len(entries) - max(1, int(self.max_entries * self.EVICT_TO))
+        if overflow <= 0:
+            return
+        entries.sort()
+        for _, path in entries[:overflow]:
+            self._remove(path)
+        logging.debug(f"{self.label}已淘汰 {overflow} 个条目")
+
+    def clear(self):
+        """清空所有缓存条目"""
+        for path in self._list_entries():
+            self._remove(path)
+        with self._lock:
+            self._entry_count = 0
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中/未命中计数和当前条目数"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': self._entry_count
+        }
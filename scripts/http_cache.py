@@ -0,0 +1,62 @@
+import json
+import hashlib
+import threading
+from typing import Dict, Any, Optional
+
+from scripts.disk_cache import DiskCache
+
+
+class HttpCache(DiskCache):
+    """
+    GitHub GET 响应的本地缓存，用于条件请求。
+
+    每个条目保存响应体、ETag / Last-Modified 以及分页用的 Link 信息。
+    再次请求时带上 If-None-Match / If-Modified-Since，服务端返回 304 时直接使用磁盘上的响应体，
+    304 响应不计入 GitHub 的速率限制。
+    """
+
+    label = 'HTTP 缓存'
+
+    def __init__(self, cache_dir: str = 'output/http_cache', ttl_days: float = 7, max_entries: int = 1000):
+        super().__init__(cache_dir, ttl_days=ttl_days, max_entries=max_entries)
+        self.not_modified = 0
+        self._counter_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """根据 URL 和查询参数计算缓存键"""
+        payload = json.dumps([url, sorted((params or {}).items())], ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def conditional_headers(entry: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """根据缓存条目构建条件请求头"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, key: str, response, body: Any):
+        """保存带有校验信息的响应，没有 ETag 和 Last-Modified 的响应不缓存"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not etag and not last_modified:
+            return
+        self.set_entry(key, {
+            'etag': etag,
+            'last_modified': last_modified,
+            'links': response.links,
+            'body': body
+        })
+
+    def mark_not_modified(self):
+        with self._counter_lock:
+            self.not_modified += 1
+
+    def stats(self) -> Dict[str, int]:
+        stats = super().stats()
+        stats['not_modified'] = self.not_modified
+        return stats
@@ -0,0 +1,81 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Tuple, Union
+from urllib.parse import urlsplit
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class _PooledSession(requests.Session):
+    """请求没有指定 timeout 时使用目标主机配置的默认超时"""
+
+    def __init__(self, client: 'HttpClient'):
+        super().__init__()
+        self._client = client
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self._client.timeout_for(url)
+        return super().request(method, url, **kwargs)
+
+
+class HttpClient:
+    """
+    进程内共享的 HTTP 连接池。
+
+    DataCollector 和 ProjectAnalyzer 通过模块级的 http_client 实例使用同一个会话，
+    每个主机一个连接池（keep-alive），连接数上限和默认超时按主机配置。
+    连接池满时请求会等待空闲连接，而不是临时新建连接后丢弃，
+    因此同一主机上的并发连接数不会超过配置的上限。
+    分析器和收集器重复创建时（例如多次运行），已经建立的连接会继续复用。
+    """
+
+    DEFAULT_MAX_CONNECTIONS = 10
+    # (连接超时, 读取超时) 秒
+    DEFAULT_TIMEOUT = (10, 60)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits: Dict[str, int] = {}
+        self._timeouts: Dict[str, Timeout] = {}
+        self.session = _PooledSession(self)
+        # 未单独配置的主机使用默认大小的连接池
+        for scheme in ('http://', 'https://'):
+            self.session.mount(scheme, HTTPAdapter(pool_maxsize=self.DEFAULT_MAX_CONNECTIONS))
+
+    @staticmethod
+    def _host_prefix(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def configure(self, base_url: str, max_connections: int = None, timeout: Timeout = None) -> requests.Session:
+        """
+        为 base_url 所在的主机设置连接数上限和默认超时，返回共享的会话。
+        同一主机被多次配置时取较大的连接数上限，已有的空闲连接会被关闭后重建。
+        """
+        prefix = self._host_prefix(base_url)
+        with self._lock:
+            if timeout is not None:
+                self._timeouts[prefix] = timeout
+            if max_connections:
+                current = self._limits.get(prefix, 0)
+                if max_connections > current:
+                    self._limits[prefix] = max_connections
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+                    previous = self.session.adapters.get(prefix)
+                    self.session.mount(prefix, adapter)
+                    if previous:
+                        previous.close()
+        return self.session
+
+    def timeout_for(self, url: str) -> Timeout:
+        return self._timeouts.get(self._host_prefix(url), self.DEFAULT_TIMEOUT)
+
+    def close(self):
+        """关闭所有空闲连接"""
+        self.session.close()
+
+
+# 全局实例，各模块直接导入使用
+http_client = HttpClient()
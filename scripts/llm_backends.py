@@ -0,0 +1,387 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from typing import Callable, Dict, Any, Iterable, List, Optional
+
+import requests
+
+from scripts.http_client import http_client
+from scripts.metrics import metrics
+from scripts.rate_limiter import RateLimitScheduler
+
+
+# 认证头格式：名称 -> (请求头, 值模板)；OpenAI 兼容的服务使用 bearer
+AUTH_HEADERS = {
+    'bearer': ('Authorization', 'Bearer {key}'),
+    'raw': ('Authorization', '{key}'),
+    'x-api-key': ('X-API-Key', '{key}')
+}
+
+
+def auth_headers(api_key: str, auth: str = 'bearer') -> Dict[str, str]:
+    """返回 JSON 请求的请求头，auth 为 AUTH_HEADERS 中的格式"""
+    name, template = AUTH_HEADERS[auth]
+    return {name: template.format(key=api_key), 'Content-Type': 'application/json'}
+
+
+def response_usage(response: requests.Response, stream: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    读取响应中的 usage 字段，没有时返回 None。
+    流式响应读到结束，取带 usage 的分块；服务端没有返回 usage 时按内容分块数估计 completion tokens。
+    """
+    try:
+        if not stream:
+            return response.json().get('usage')
+        usage, chunk_count = None, 0
+        for line in response.iter_lines(chunk_size=None):
+            if not line or not line.startswith(b'data:'):
+                continue
+            data = line[5:].strip().decode('utf-8')
+            if data == '[DONE]':
+                break
+            chunk = json.loads(data)
+            usage = chunk.get('usage') or usage
+            chunk_count += sum(1 for choice in chunk.get('choices') or [] if (choice.get('delta') or {}).get('content'))
+        return usage or {'completion_tokens': chunk_count}
+    except (requests.exceptions.RequestException, ValueError, AttributeError) as e:
+        logging.debug(f"无法读取响应的 usage: {str(e)}")
+        return None
+    finally:
+        response.close()
+
+
+class BackendUnavailable(Exception):
+    """所有后端的熔断器都处于打开状态"""
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续 failure_threshold 次失败后打开，reset_timeout 秒内不再向后端发送请求；
+    之后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开并把等待时间加倍（最多 max_reset_timeout）。
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30,
+                 max_reset_timeout: float = 600):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否可以发送请求；半开状态下第一个调用者取得试探机会"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def available(self) -> bool:
+        """与 allow() 相同，但不占用半开状态的试探机会，用于选择后端"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at >= self.reset_timeout
+            return not self._probing
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info(f"[{self.name}] 熔断器关闭，恢复发送请求")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.reset_timeout = self.base_reset_timeout
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self.reset_timeout = min(self.max_reset_timeout, self.reset_timeout * 2)
+            elif self.state == self.OPEN or self.failures < self.failure_threshold:
+                return
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probing = False
+        metrics.counter('circuit_breaker_open_total', backend=self.name)
+        logging.warning(f"[{self.name}] 连续 {self.failures} 次失败，熔断 {self.reset_timeout:.0f} 秒")
+
+
+class LlmBackend:
+    """
+    一个 OpenAI 兼容的 chat completions 端点（DeepSeek、其他云服务或本地服务）。
+
+    每个后端有自己的限流调度器和熔断器，并记录最近请求的耗时和错误率，供 BackendRouter 选择后端。
+    model 为 None 时使用请求中的模型（即 ProjectAnalyzer 验证密钥时选择的模型）。
+    prompt_price / completion_price 为每百万 token 的价格（美元），None 时按本次运行的默认价格计算。
+    """
+
+    # 用于计算分位数的最近耗时样本数
+    LATENCY_WINDOW = 200
+    # 错误率的指数加权系数
+    ERROR_ALPHA = 0.1
+
+    def __init__(self, name: str, api_base: str, api_key: str = None, model: str = None,
+                 rate_limiter: RateLimitScheduler = None, max_connections: int = 16,
+                 breaker: CircuitBreaker = None, auth: str = 'bearer', prompt_price: float = None,
+                 completion_price: float = None):
+        self.name = name
+        self.api_base = api_base.rstrip('/')
+        self.chat_url = f"{self.api_base}/chat/completions"
+        self.model = model
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.headers = auth_headers(api_key, auth) if api_key else {'Content-Type': 'application/json'}
+        self.session = http_client.configure(self.api_base, max_connections=max_connections)
+        self.rate_limiter = rate_limiter or RateLimitScheduler(f'llm-{name}', rate=20, burst=max_connections,
+                                                               max_retries=1, backoff_base=2)
+        self.breaker = breaker or CircuitBreaker(name)
+        self.error_rate = 0.0
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._latency_ewma: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def post(self, payload: Dict[str, Any], **request_options) -> requests.Response:
+        if self.model:
+            payload = dict(payload, model=self.model)
+        return self.rate_limiter.request(self.session, 'POST', self.chat_url, headers=self.headers,
+                                         json=payload, **request_options)
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.error_rate = (1 - self.ERROR_ALPHA) * self.error_rate + self.ERROR_ALPHA * (0.0 if ok else 1.0)
+            if ok:
+                self._latencies.append(latency)
+                self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """最近成功请求耗时的分位数，样本不足 min_samples 时返回 None"""
+        with self._lock:
+            if len(self._latencies) < max(1, min_samples):
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def cost(self) -> float:
+        """路由代价：平均耗时按错误率放大；还没有请求过的后端代价为 0，会先被试用"""
+        with self._lock:
+            if self._latency_ewma is None:
+                # 只失败过的后端排在最后
+                return float('inf') if self.error_rate else 0.0
+            return self._latency_ewma * (1 + 4 * self.error_rate)
+
+    def __repr__(self):
+        return f"LlmBackend({self.name}, {self.api_base})"
+
+
+class BackendRouter:
+    """
+    在多个后端之间路由分析请求，降低长尾耗时和单个后端故障的影响。
+
+    - 路由：选择熔断器允许、代价（平均耗时 × 错误率惩罚）最低的后端
+    - 对冲：请求超过所在后端最近耗时的 hedge_quantile 分位数仍未返回时，
+      向另一个后端发送相同的请求，先成功的结果被采用（self_hedge 为 True 时没有其他可用后端也向同一个后端发送）；
+      落后的请求返回后读取其中的 usage 交给 on_usage，再关闭连接、丢弃结果（requests 无法中断进行中的请求）
+    - 故障转移：请求失败且没有其他在途请求时，改用还没有尝试过的后端
+    - 熔断：连续失败的后端暂时不再接收请求，见 CircuitBreaker
+    对冲请求会产生额外的 token 费用，约为 1 - hedge_quantile 的请求比例。
+    on_usage(usage, started, backend) 接收落后请求的用量，started 为该请求开始时的 time.monotonic()，
+    调用方据此把落后请求计入 token 统计和预算。
+    """
+
+    RETRY_STATUSES = RateLimitScheduler.RETRY_STATUSES
+
+    def __init__(self, backends: List[LlmBackend], hedge: bool = True, hedge_quantile: float = 0.95,
+                 min_hedge_samples: int = 20, self_hedge: bool = False,
+                 on_usage: Callable[[Optional[Dict[str, Any]], float, LlmBackend], None] = None):
+        if not backends:
+            raise ValueError("至少需要一个 LLM 后端")
+        self.backends = backends
+        self.primary = backends[0]
+        # 只有一个后端时默认不对冲：重复的请求发往同一个后端，只会多付一次费用
+        self.hedge = hedge and (self_hedge or len(backends) > 1)
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_samples = min_hedge_samples
+        self.self_hedge = self_hedge
+        self.on_usage = on_usage
+
+    def choose(self, exclude: Iterable[LlmBackend] = ()) -> Optional[LlmBackend]:
+        candidates = [backend for backend in self.backends if backend not in exclude and backend.breaker.available()]
+        # 代价相同时按配置顺序，主后端优先
+        for backend in sorted(candidates, key=lambda b: b.cost()):
+            if backend.breaker.allow():
+                return backend
+        return None
+
+    def _attempt(self, backend: LlmBackend, payload: Dict[str, Any], options: Dict[str, Any],
+                 settled: Dict[str, Any], results: queue.Queue, hedged: bool):
+        started = time.monotonic()
+        response, error = None, None
+        try:
+            response = backend.post(payload, **options)
+        except Exception as e:
+            error = e
+        latency = time.monotonic() - started
+        ok = error is None and response.status_code == 200
+        backend.record(latency, ok)
+        # 服务端错误和网络错误才计入熔断；400、401 之类说明后端正常，只影响错误率
+        if ok or (error is None and response.status_code not in self.RETRY_STATUSES):
+            backend.breaker.record_success()
+        else:
+            backend.breaker.record_failure()
+        metrics.counter('llm_backend_requests_total', backend=backend.name, outcome='success' if ok else 'error')
+        metrics.observe('llm_backend_seconds', latency, backend=backend.name)
+        with settled['lock']:
+            lost = settled['done']
+            if not lost:
+                results.put((backend, response, error, hedged, started))
+        if lost:
+            # 对冲中落后的请求：另一个请求的结果已经被采用
+            self._discard(backend, response, started, options)
+
+    def _discard(self, backend: LlmBackend, response: Optional[requests.Response], started: float,
+                 options: Dict[str, Any]):
+        """丢弃落后的响应；成功的响应同样计费，先读取 usage 交给 on_usage 再关闭"""
+        metrics.counter('llm_hedge_total', backend=backend.name, result='lost')
+        if response is None:
+            return
+        if response.status_code != 200:
+            response.close()
+            return
+        usage = response_usage(response, stream=options.get('stream', False))
+        if self.on_usage:
+            self.on_usage(usage, started, backend)
+
+    def request(self, payload: Dict[str, Any], hedge: bool = None, **request_options) -> requests.Response:
+        """
+        发送 chat completions 请求，返回第一个成功的响应；都失败时返回最后一个错误响应或抛出最后一个异常。
+        响应的 backend 属性为处理请求的后端。hedge 为 False 时不发送对冲请求（例如耗时与普通请求不同的批量请求）。
+        """
+        hedge = self.hedge if hedge is None else hedge
+        primary = self.choose()
+        if primary is None:
+            raise BackendUnavailable("所有 LLM 后端都处于熔断状态")
+        settled = {'lock': threading.Lock(), 'done': False}
+        results = queue.Queue()
+        tried = []
+
+        def launch(backend: LlmBackend, hedged: bool = False):
+            tried.append(backend)
+            threading.Thread(target=self._attempt, args=(backend, payload, request_options, settled, results, hedged),
+                             name=f'llm-{backend.name}', daemon=True).start()
+
+        launch(primary)
+        in_flight = 1
+        hedge_delay = primary.quantile(self.hedge_quantile, self.min_hedge_samples) if hedge else None
+        started = time.monotonic()
+        last_response, last_error = None, None
+        while in_flight:
+            timeout = None
+            if hedge_delay is not None:
+                timeout = max(0.0, hedge_delay - (time.monotonic() - started))
+            try:
+                backend, response, error, hedged, _ = results.get(timeout=timeout)
+            except queue.Empty:
+                # 只对冲一次；没有其他可用后端时只有 self_hedge 才向同一个后端再发一次
+                hedge_delay = None
+                other = self.choose(exclude=tried) or (primary if self.self_hedge and primary.breaker.allow() else None)
+                if other is not None:
+                    logging.debug(f"请求超过 {primary.name} 的 p{self.hedge_quantile * 100:.0f} 耗时，向 {other.name} 发送对冲请求")
+                    metrics.counter('llm_hedge_total', backend=other.name, result='sent')
+                    launch(other, hedged=True)
+                    in_flight += 1
+                continue
+            in_flight -= 1
+            if error is None and response.status_code == 200:
+                self._settle(settled, results, request_options)
+                if hedged:
+                    metrics.counter('llm_hedge_total', backend=backend.name, result='won')
+                response.backend = backend
+                if last_response is not None:
+                    last_response.close()
+                return response
+            if last_response is not None:
+                last_response.close()
+            last_response, last_error = response, error
+            if error is not None:
+                logging.warning(f"[{backend.name}] 请求出错: {str(error)}")
+            if not in_flight:
+                other = self.choose(exclude=tried)
+                if other is not None:
+                    logging.warning(f"[{backend.name}] 请求失败，改用 {other.name}")
+                    metrics.counter('llm_failover_total', backend=other.name)
+                    launch(other)
+                    in_flight += 1
+        self._settle(settled, results, request_options)
+        if last_response is not None:
+            last_response.backend = backend
+            return last_response
+        raise last_error
+
+    def _settle(self, settled: Dict[str, Any], results: queue.Queue, options: Dict[str, Any]):
+        """标记请求已经有结果，丢弃已经返回但还没有被读取的其他响应"""
+        with settled['lock']:
+            settled['done'] = True
+            leftovers = []
+            while True:
+                try:
+                    leftovers.append(results.get_nowait())
+                except queue.Empty:
+                    break
+        for backend, response, _, _, started in leftovers:
+            # 流式响应要读到结束才有 usage，不阻塞已经有结果的调用方
+            threading.Thread(target=self._discard, args=(backend, response, started, options),
+                             name=f'llm-{backend.name}-discard', daemon=True).start()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [{
+            'backend': backend.name,
+            'breaker': backend.breaker.state,
+            'error_rate': round(backend.error_rate, 3),
+            'p50': backend.quantile(0.5),
+            'p95': backend.quantile(0.95)
+        } for backend in self.backends]
+
+
+def load_backends(path: str, max_connections: int = 16) -> List[LlmBackend]:
+    """
+    从 JSON 文件读取额外的后端，格式为列表，每项包含 name、api_base，以及可选的 model、
+    api_key 或 api_key_env（从环境变量读取密钥）、rate（每秒请求数）、
+    prompt_price 和 completion_price（每百万 token 的价格，默认与 DeepSeek 相同）。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"无法读取 LLM 后端配置 {path}: {str(e)}")
+    if not isinstance(entries, list):
+        raise ValueError(f"LLM 后端配置应为列表: {path}")
+    backends = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get('name') or not entry.get('api_base'):
+            raise ValueError(f"LLM 后端配置缺少 name 或 api_base: {entry}")
+        api_key = entry.get('api_key') or (os.getenv(entry['api_key_env']) if entry.get('api_key_env') else None)
+        rate_limiter = RateLimitScheduler(f"llm-{entry['name']}", rate=entry.get('rate', 20), burst=max_connections,
+                                          max_retries=1, backoff_base=2)
+        backends.append(LlmBackend(entry['name'], entry['api_base'], api_key, entry.get('model'),
+                                   rate_limiter=rate_limiter, max_connections=max_connections,
+                                   prompt_price=entry.get('prompt_price'),
+                                   completion_price=entry.get('completion_price')))
+    return backends
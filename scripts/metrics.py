@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple
+
+
+# 直方图桶的上界（秒），覆盖从本地缓存命中到长时间 LLM 请求的范围
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _label_value(value: Any) -> str:
+    return str(value).lower() if isinstance(value, bool) else str(value)
+
+
+def _label_key(name: str, labels: Dict[str, Any]) -> LabelKey:
+    return name, tuple(sorted((k, _label_value(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """固定桶的直方图，只保存每个桶的计数、总和与最大值，内存占用与样本数无关"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数，在所在桶内线性插值（超出最后一个桶时返回最大值）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and running + bucket_count >= target:
+                if i >= len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                estimate = lower + (self.buckets[i] - lower) * (target - running) / bucket_count
+                return min(estimate, self.max)
+            running += bucket_count
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    进程内的计数器和直方图。
+
+    各模块通过模块级的 metrics 实例记录数据：counter() 累加次数，observe() 记录耗时，
+    span() 统计一段代码的耗时。运行结束时导出为 Prometheus 文本格式或 JSON 摘要。
+    所有方法都是线程安全的，记录一次数据只需要一次加锁。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[LabelKey, float] = {}
+        self._histograms: Dict[LabelKey, Histogram] = {}
+        self.started_at = time.time()
+
+    def reset(self):
+        """清空所有数据，每次运行开始时调用"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started_at = time.time()
+
+    def counter(self, name: str, value: float = 1, **labels):
+        key = _label_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """统计 with 代码块的耗时，记录到 <name>_seconds 直方图；抛出异常时额外记录 error 标签"""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(f"{name}_seconds", time.perf_counter() - started, **dict(labels, error='true'))
+            raise
+        self.observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Tuple[Dict[LabelKey, float], Dict[LabelKey, Histogram]]:
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {}
+            for key, histogram in self._histograms.items():
+                copy = Histogram(histogram.buckets)
+                copy.counts = list(histogram.counts)
+                copy.count, copy.sum, copy.max = histogram.count, histogram.sum, histogram.max
+                histograms[key] = copy
+        return counters, histograms
+
+    def summary(self) -> Dict[str, Any]:
+        """返回 JSON 友好的摘要：计数器的值，以及每个直方图的次数、总耗时和分位数估计"""
+        counters, histograms = self.snapshot()
+        return {
+            'started_at': self.started_at,
+            'elapsed_seconds': round(time.time() - self.started_at, 3),
+            'counters': [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(counters.items())
+            ],
+            'histograms': [
+                {
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': h.count,
+                    'sum': round(h.sum, 4),
+                    'mean': round(h.sum / h.count, 4) if h.count else 0.0,
+                    'p50': round(h.quantile(0.5), 4),
+                    'p95': round(h.quantile(0.95), 4),
+                    'p99': round(h.quantile(0.99), 4),
+                    'max': round(h.max, 4)
+                }
+                for (name, labels), h in sorted(histograms.items())
+            ]
+        }
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式（可供 node_exporter 的 textfile collector 读取）"""
+        counters, histograms = self.snapshot()
+        lines: List[str] = []
+
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"ai_tools_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{fmt(labels)} {value}")
+
+        for (name, labels), h in sorted(histograms.items()):
+            metric = f"ai_tools_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            running = 0
+            for bound, bucket_count in zip(h.buckets, h.counts):
+                running += bucket_count
+                lines.append(f"{metric}_bucket{fmt(labels, [('le', bound)])} {running}")
+            lines.append(f"{metric}_bucket{fmt(labels, [('le', '+Inf')])} {h.count}")
+            lines.append(f"{metric}_sum{fmt(labels)} {h.sum}")
+            lines.append(f"{metric}_count{fmt(labels)} {h.count}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename: str):
+        """写入文件：.prom 后缀使用 Prometheus 文本格式，其他使用 JSON 摘要"""
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        if filename.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.summary(), ensure_ascii=False, indent=2)
+        tmp_path = f"{filename}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, filename)
+
+    def top_spans(self, limit: int = 8) -> List[Tuple[str, Histogram]]:
+        """按总耗时排序的耗时直方图，用于在日志中输出简要的耗时分布"""
+        _, histograms = self.snapshot()
+        spans = [(name + (f"{dict(labels)}" if labels else ''), h)
+                 for (name, labels), h in histograms.items() if name.endswith('_seconds')]
+        return sorted(spans, key=lambda item: item[1].sum, reverse=True)[:limit]
+
+
+# 全局实例，各模块直接导入使用
+metrics = MetricsRegistry()
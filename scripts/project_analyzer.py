@@ -3,14 +3,56 @@ import logging
 import requests
 import json
 import time
-from typing import Dict, Any
+import queue
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Tuple
 from datetime import datetime, timedelta
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+from scripts.analysis_cache import AnalysisCache
+from scripts.http_client import http_client
+from scripts.llm_backends import BackendRouter, LlmBackend, auth_headers, load_backends
+from scripts.metrics import metrics
+from scripts.rate_limiter import RateLimitScheduler
+from scripts.token_usage import TokenUsage
+
+class StreamInterrupted(Exception):
+    """流式响应在完成前中断，partial 为已经收到的内容"""
+
+    def __init__(self, partial: str, reason: str):
+        super().__init__(reason)
+        self.partial = partial
+        self.reason = reason
 
 class ProjectAnalyzer:
-    def __init__(self, api_key: str = None):
-        self.api_key_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'api_keys.json')
+    # iter_analyses 允许的最大并发请求数
+    MAX_CONCURRENCY = 16
+    SYSTEM_PROMPT = "你是一个专业的AI项目分析专家，负责分析GitHub上的AI工具项目。"
+    TEMPERATURE = 0.7
+    # 流式模式下向 on_partial 提交新增内容的最短间隔（秒）
+    PARTIAL_FLUSH_INTERVAL = 1.0
+    # 提示中最多保留的标签数量
+    MAX_PROMPT_TAGS = 10
+    # 批量模式下单个请求允许的最大回答 token 数（DeepSeek 的输出上限）
+    MAX_BATCH_TOKENS = 8192
+    # 密钥验证结果和选择的模型在配置文件中保留的时间（秒），0 表示每次都重新验证
+    VALIDATION_TTL = 24 * 3600
+    ANALYSIS_ASPECTS = """请从以下几个方面进行分析：
+1. 项目的主要功能和应用场景
+2. 技术特点和创新点
+3. 项目的潜在价值和市场前景
+4. 代码质量和维护状况评估
+5. 建议和改进空间
+
+请用中文回答，并保持专业、客观的分析态度。
+"""
+
+    def __init__(self, api_key: str = None, use_cache: bool = True, cache: AnalysisCache = None,
+                 stream: bool = False, idle_timeout: float = 30, api_base: str = None,
+                 max_tokens: int = 2048, max_description_chars: int = 500, usage: TokenUsage = None,
+                 batch_size: int = 1, validation_ttl: float = VALIDATION_TTL, backends_file: str = None,
+                 hedge: bool = True):
+        self.api_key_file = self.default_key_file()
         self.api_key = api_key
         
         if not self.api_key:
@@ -28,77 +70,202 @@ class ProjectAnalyzer:
         # 保存API密钥以便将来使用
         self._save_api_key(self.api_key)
         
-        # 更新为最新的 DeepSeek API 配置
-        self.headers = {
-            'Authorization': f'Bearer {self.api_key}',
-            'Content-Type': 'application/json'
-        }
-        # 使用官方 API 端点
-        self.api_url = "https://api.deepseek.com/v1/chat/completions"
+        # 更新为最新的 DeepSeek API 配置；认证头格式可以由 test_deepseek_api.py 的探测结果改变
+        self.auth = 'bearer'
+        self.headers = auth_headers(self.api_key, self.auth)
+        # 默认使用官方 API 端点，可以通过参数或 DEEPSEEK_API_BASE 指向兼容的服务
+        self.api_base = (api_base or os.getenv('DEEPSEEK_API_BASE') or "https://api.deepseek.com/v1").rstrip('/')
+        self.api_url = f"{self.api_base}/chat/completions"
         self.model_name = "deepseek-chat"  # 已验证可用的模型名称
+        # 密钥验证成功后在实例的生命周期内不再重复请求（守护模式下分析器在多次运行间复用），
+        # 验证结果同时写入配置文件，validation_ttl 秒内的其他运行也直接使用
+        self.key_validated = False
+        self.validation_ttl = validation_ttl
+        self._validation_lock = threading.Lock()
+        
+        # 使用进程内共享的连接池，重试和限流由调度器负责
+        self.session = self._create_session()
+        # DeepSeek 没有公布固定的请求速率，默认速率只用于平滑突发，实际并发由调用方控制
+        self.rate_limiter = RateLimitScheduler('deepseek', rate=20, burst=self.MAX_CONCURRENCY,
+                                               max_retries=2, backoff_base=5)
+        # 分析请求经过路由器：DeepSeek 为主后端，backends_file 中的 OpenAI 兼容端点为备用后端，
+        # 有备用后端时慢请求发送对冲请求，连续失败的后端暂时熔断；落后的对冲请求同样计入 token 用量
+        self.primary_backend = LlmBackend('deepseek', self.api_base, self.api_key,
+                                          rate_limiter=self.rate_limiter, max_connections=self.MAX_CONCURRENCY)
+        backends = [self.primary_backend]
+        if backends_file:
+            backends += load_backends(backends_file, max_connections=self.MAX_CONCURRENCY)
+            logging.info(f"LLM 后端: {', '.join(backend.name for backend in backends)}")
+        self.router = BackendRouter(backends, hedge=hedge, on_usage=self._record_usage)
+        
+        # 流式模式：逐步接收回答，超过 idle_timeout 秒没有新数据才视为超时
+        self.stream = stream
+        self.idle_timeout = idle_timeout
+        
+        # 分析结果缓存，提示内容不变时不再重复请求
+        self.cache = (cache or AnalysisCache()) if use_cache else None
         
-        # 创建带有重试机制的会话
-        self.session = self._create_retry_session()
+        # 限制回答长度和提示长度，使每次请求的 token 用量和耗时可预期
+        self.max_tokens = max_tokens
+        self.max_description_chars = max_description_chars
+        # 本次运行的 token 用量和预算
+        self.usage = usage or TokenUsage()
+        
+        # 批量模式：一次请求分析 batch_size 个项目，解析失败的项目改为单独请求
+        self.batch_size = max(1, batch_size)
     
-    def _create_retry_session(self):
-        """创建带有重试机制的会话"""
-        retry_strategy = Retry(
-            total=3,  # 最多重试3次
-            backoff_factor=2,  # 指数级增加重试间隔
-            status_forcelist=[429, 500, 502, 503, 504],  # 这些状态码触发重试
-            allowed_methods=["GET", "POST"]  # 只对GET和POST请求进行重试
-        )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        session = requests.Session()
-        session.mount("https://", adapter)
-        return session
+    def _create_session(self):
+        """返回共享的会话，连接池需要容纳 iter_analyses 的并发请求"""
+        return http_client.configure(self.api_base, max_connections=self.MAX_CONCURRENCY)
     
-    def _load_api_key(self) -> str:
-        """从配置文件加载API密钥"""
+    @staticmethod
+    def default_key_file() -> str:
+        """密钥配置文件；DEEPSEEK_API_KEY_FILE 可以把它放到其他位置（例如基准测试时不影响真实配置）"""
+        return os.getenv('DEEPSEEK_API_KEY_FILE') or \
+            os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'api_keys.json')
+    
+    @staticmethod
+    def _read_key_file(path: str) -> Dict[str, Any]:
+        """读取密钥配置文件，不存在或无法解析时返回空字典"""
         try:
-            if not os.path.exists(self.api_key_file):
-                return None
-            
-            with open(self.api_key_file, 'r') as f:
-                data = json.load(f)
-                
-                # 检查密钥是否有效期内
-                if 'expires_at' in data and datetime.now() < datetime.fromisoformat(data['expires_at']):
-                    return data.get('deepseek_api_key')
-            
-            return None
+            if not os.path.exists(path):
+                return {}
+            with open(path, 'r') as f:
+                return json.load(f)
         except Exception as e:
             logging.warning(f"加载API密钥时出错: {str(e)}")
-            return None
+            return {}
+    
+    @staticmethod
+    def _write_key_file(path: str, data: Dict[str, Any]):
+        # 确保目录存在，先写临时文件再替换，避免中断时留下不完整的配置
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+    
+    @staticmethod
+    def _new_key_record(api_key: str) -> Dict[str, Any]:
+        """新密钥的配置，默认有效期为30天"""
+        return {
+            'deepseek_api_key': api_key,
+            'expires_at': (datetime.now() + timedelta(days=30)).isoformat(),
+            'updated_at': datetime.now().isoformat()
+        }
+    
+    @staticmethod
+    def _validation_record(api_base: str, model: str, auth: str) -> Dict[str, Any]:
+        return {
+            'api_base': api_base,
+            'model': model,
+            'auth': auth,
+            'validated_at': datetime.now().isoformat()
+        }
+    
+    @classmethod
+    def store_validation(cls, api_key: str, api_base: str, model: str, auth: str = 'bearer') -> str:
+        """
+        记录在其他地方验证过的配置（test_deepseek_api.py 探测成功后调用），返回配置文件路径。
+        之后 validation_ttl 秒内的运行直接使用这里的模型和认证头格式，不再请求 /models。
+        """
+        path = cls.default_key_file()
+        data = cls._read_key_file(path)
+        if data.get('deepseek_api_key') != api_key or not cls._key_unexpired(data):
+            data = cls._new_key_record(api_key)
+        data['validation'] = cls._validation_record(api_base.rstrip('/'), model, auth)
+        cls._write_key_file(path, data)
+        return path
+    
+    @staticmethod
+    def _key_unexpired(data: Dict[str, Any]) -> bool:
+        try:
+            return 'expires_at' in data and datetime.now() < datetime.fromisoformat(data['expires_at'])
+        except ValueError:
+            return False
+    
+    def _load_api_key(self) -> str:
+        """从配置文件加载API密钥"""
+        data = self._read_key_file(self.api_key_file)
+        # 检查密钥是否有效期内
+        if self._key_unexpired(data):
+            return data.get('deepseek_api_key')
+        return None
     
     def _save_api_key(self, api_key: str):
-        """保存API密钥到配置文件，默认有效期为30天"""
+        """保存API密钥到配置文件，默认有效期为30天；密钥未变化且仍在有效期内时不重写文件"""
+        data = self._read_key_file(self.api_key_file)
+        if data.get('deepseek_api_key') == api_key and self._key_unexpired(data):
+            logging.debug("API密钥未变化，跳过保存")
+            return
         try:
-            # 确保目录存在
-            os.makedirs(os.path.dirname(self.api_key_file), exist_ok=True)
-            
-            # 保存API密钥和过期时间
-            expires_at = datetime.now() + timedelta(days=30)
-            data = {
-                'deepseek_api_key': api_key,
-                'expires_at': expires_at.isoformat(),
-                'updated_at': datetime.now().isoformat()
-            }
-            
-            with open(self.api_key_file, 'w') as f:
-                json.dump(data, f, indent=2)
-                
+            # 保存API密钥和过期时间，旧密钥的验证结果不再保留
+            self._write_key_file(self.api_key_file, self._new_key_record(api_key))
             logging.info("API密钥已保存，30天内无需重新输入")
         except Exception as e:
             logging.warning(f"保存API密钥时出错: {str(e)}")
     
+    def _load_validation(self) -> bool:
+        """
+        使用配置文件中 validation_ttl 秒内的验证结果（同一密钥和 API 端点），并恢复当时选择的模型。
+        记录的认证头格式在验证结果过期后仍然使用，重新验证时也按该格式发送请求。
+        """
+        data = self._read_key_file(self.api_key_file)
+        validation = data.get('validation') or {}
+        if data.get('deepseek_api_key') != self.api_key or validation.get('api_base') != self.api_base:
+            return False
+        self._set_auth(validation.get('auth') or 'bearer')
+        if not self.validation_ttl:
+            return False
+        try:
+            age = (datetime.now() - datetime.fromisoformat(validation['validated_at'])).total_seconds()
+        except (KeyError, TypeError, ValueError):
+            return False
+        if not 0 <= age < self.validation_ttl:
+            return False
+        self.model_name = validation.get('model') or self.model_name
+        logging.info(f"使用 {age / 60:.0f} 分钟前的密钥验证结果，模型: {self.model_name}")
+        return True
+    
+    def _set_auth(self, auth: str):
+        if auth == self.auth:
+            return
+        try:
+            self.headers = auth_headers(self.api_key, auth)
+        except KeyError:
+            logging.warning(f"未知的认证头格式: {auth}，使用 bearer")
+            return
+        self.auth = auth
+        self.primary_backend.headers = self.headers
+        logging.info(f"使用认证头格式: {auth}")
+    
+    def _save_validation(self, validated: bool):
+        """在配置文件中记录（或清除）本次的验证结果和选择的模型"""
+        data = self._read_key_file(self.api_key_file)
+        if data.get('deepseek_api_key') != self.api_key:
+            return
+        if validated:
+            data['validation'] = self._validation_record(self.api_base, self.model_name, self.auth)
+        elif not data.pop('validation', None):
+            return
+        try:
+            self._write_key_file(self.api_key_file, data)
+        except Exception as e:
+            logging.warning(f"保存密钥验证结果时出错: {str(e)}")
+    
     def check_api_key_validity(self) -> bool:
         """检查API密钥是否有效"""
+        if self.key_validated:
+            logging.debug(f"API 密钥已验证，使用模型: {self.model_name}")
+            return True
+        if self._load_validation():
+            self.key_validated = True
+            return True
         try:
             # 使用简单的模型列表请求来验证API密钥 - 这比聊天完成请求更轻量级
             logging.debug(f"正在验证 API 密钥: {self.api_key[:8]}...")
-            models_url = "https://api.deepseek.com/v1/models"
-            response = self.session.get(models_url, headers=self.headers, timeout=15)
+            models_url = f"{self.api_base}/models"
+            response = self.rate_limiter.request(self.session, 'GET', models_url, headers=self.headers, timeout=15)
             
             # 输出详细的响应信息以便调试
             logging.debug(f"API 响应状态码: {response.status_code}")
@@ -116,6 +283,9 @@ class ProjectAnalyzer:
                 except Exception as e:
                     logging.warning(f"解析模型列表时出错: {str(e)}")
                 
+                self.key_validated = True
+                if self.validation_ttl:
+                    self._save_validation(True)
                 return True
             else:
                 logging.warning(f"API密钥验证失败: {response.status_code}")
@@ -127,116 +297,477 @@ class ProjectAnalyzer:
             logging.error(f"验证API密钥时出错: {str(e)}")
             return False
 
-    def analyze_project(self, project_data: Dict[str, Any]) -> Dict[str, Any]:
+    def analyze_project(self, project_data: Dict[str, Any],
+                        on_partial: Callable[[Dict[str, Any], str], None] = None) -> Dict[str, Any]:
         """
         分析单个项目，返回分析结果
+        
+        流式模式下，on_partial(project_data, text) 会在生成过程中按批收到新增的内容。
         """
         # 构建项目分析提示
-        prompt = self._build_analysis_prompt(project_data)
+        with metrics.span('prompt_build'):
+            prompt = self._build_analysis_prompt(project_data)
         
-        max_retries = 2
-        current_retry = 0
+        cache_key, cached = self._lookup_cache(project_data, prompt)
+        if cached:
+            return cached
         
-        while current_retry <= max_retries:
+        payload = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.TEMPERATURE
+        }
+        if self.max_tokens:
+            payload["max_tokens"] = self.max_tokens
+        if self.stream:
+            # 流式模式使用两次数据之间的空闲超时，而不是整个回答的总超时
+            payload.update(stream=True, stream_options={"include_usage": True})
+            request_options = {"timeout": (15, self.idle_timeout), "stream": True}
+        else:
+            request_options = {"timeout": 90}  # 增加到90秒以处理复杂分析
+        
+        started = time.monotonic()
+        try:
+            logging.debug("发送分析请求到 LLM 后端")
+            
+            # 重试和限流由各后端的调度器处理，对冲和故障转移由路由器处理；流式模式下这里只统计到收到响应头为止
+            with metrics.span('llm_request', stream=self.stream):
+                response = self.router.request(payload, **request_options)
+        except requests.exceptions.Timeout:
+            logging.error(f"分析项目 {project_data['name']} 时超时，已达到最大重试次数")
+            return self._failure_result(project_data, "分析失败: 请求超时，请稍后重试或增加超时时间。")
+        except Exception as e:
+            logging.error(f"分析项目 {project_data['name']} 时出错: {str(e)}")
+            return self._failure_result(project_data, f"分析失败: {str(e)}")
+        
+        # 处理响应
+        if response.status_code != 200:
+            logging.error(f"API请求失败: 状态码 {response.status_code}")
+            logging.error(f"响应内容: {response.text}")
+            if response.status_code == 401 and getattr(response, 'backend', None) is self.primary_backend:
+                # 密钥已失效，下次运行时重新验证（并发的请求只清除一次）
+                with self._validation_lock:
+                    if self.key_validated:
+                        self.key_validated = False
+                        self._save_validation(False)
+            if response.status_code in RateLimitScheduler.RETRY_STATUSES:
+                return self._failure_result(project_data, "分析失败: 多次尝试后仍然失败，请检查网络连接或API配置。")
+            return self._failure_result(project_data, f"分析失败: API返回错误 {response.status_code}")
+        
+        timing = None
+        if self.stream:
+            partial_callback = (lambda text: on_partial(project_data, text)) if on_partial else None
+            try:
+                analysis, timing, usage = self._read_stream(response, started, partial_callback)
+            except StreamInterrupted as e:
+                logging.error(f"分析项目 {project_data['name']} 时流式响应中断: {e.reason}")
+                if e.partial:
+                    # 保留已经生成的内容，项目不会被记为已处理，下次运行时重新分析
+                    return self._failure_result(project_data, f"{e.partial}\n\n（分析未完成: 流式响应中断，{e.reason}）")
+                return self._failure_result(project_data, f"分析失败: 流式响应中断，{e.reason}")
+            metrics.observe('llm_ttft_seconds', timing['ttft'])
+            metrics.observe('llm_stream_seconds', timing['duration'])
+            logging.info(
+                f"{project_data['name']}: 首个 token {timing['ttft']:.2f} 秒, "
+                f"共 {timing['duration']:.1f} 秒, {timing['tokens_per_sec']:.1f} tokens/秒"
+            )
+        else:
             try:
-                logging.debug("发送分析请求到 DeepSeek API")
-                
-                # 增加超时时间以避免超时错误
-                response = self.session.post(
-                    self.api_url,
-                    headers=self.headers,
-                    json={
-                        "model": self.model_name,
-                        "messages": [
-                            {"role": "system", "content": "你是一个专业的AI项目分析专家，负责分析GitHub上的AI工具项目。"},
-                            {"role": "user", "content": prompt}
-                        ],
-                        "temperature": 0.7
-                    },
-                    timeout=90  # 增加到90秒以处理复杂分析
-                )
-                
-                # 处理响应
-                if response.status_code != 200:
-                    logging.error(f"API请求失败: 状态码 {response.status_code}")
-                    logging.error(f"响应内容: {response.text}")
-                    
-                    # 对于可恢复的错误，进行重试
-                    if response.status_code in [429, 500, 502, 503, 504]:
-                        current_retry += 1
-                        retry_wait = 5 * (2 ** current_retry)  # 指数级退避
-                        logging.info(f"将在 {retry_wait} 秒后重试 (尝试 {current_retry}/{max_retries})")
-                        time.sleep(retry_wait)
-                        continue
-                    
-                    return {
-                        "project_name": project_data["name"],
-                        "analysis": f"分析失败: API返回错误 {response.status_code}",
-                        "analyzed_at": project_data.get("discovered_date", ""),
-                        "original_data": project_data
-                    }
-                
                 analysis_result = response.json()
-                logging.debug(f"收到API响应: {json.dumps(analysis_result, indent=2)[:200]}...")
+                # 只有开启 DEBUG 日志时才序列化响应
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug(f"收到API响应: {json.dumps(analysis_result, indent=2)[:200]}...")
                 
                 # 解析API响应 (根据 DeepSeek API 的实际返回格式调整)
-                return {
-                    "project_name": project_data["name"],
-                    "analysis": analysis_result["choices"][0]["message"]["content"],
-                    "analyzed_at": project_data.get("discovered_date", ""),
-                    "original_data": project_data
-                }
-                
-            except requests.exceptions.Timeout:
-                current_retry += 1
-                if current_retry <= max_retries:
-                    retry_wait = 5 * (2 ** current_retry)
-                    logging.warning(f"请求超时，将在 {retry_wait} 秒后重试 (尝试 {current_retry}/{max_retries})")
-                    time.sleep(retry_wait)
-                else:
-                    logging.error(f"分析项目 {project_data['name']} 时超时，已达到最大重试次数")
-                    return {
-                        "project_name": project_data["name"],
-                        "analysis": "分析失败: 请求超时，请稍后重试或增加超时时间。",
-                        "analyzed_at": project_data.get("discovered_date", ""),
-                        "original_data": project_data
-                    }
-            
+                choice = analysis_result["choices"][0]
+                analysis = choice["message"]["content"]
+                usage = analysis_result.get("usage")
             except Exception as e:
                 logging.error(f"分析项目 {project_data['name']} 时出错: {str(e)}")
-                return {
-                    "project_name": project_data["name"],
-                    "analysis": f"分析失败: {str(e)}",
-                    "analyzed_at": project_data.get("discovered_date", ""),
-                    "original_data": project_data
-                }
-        
-        # 如果所有重试都失败了
+                return self._failure_result(project_data, f"分析失败: {str(e)}")
+            if choice.get("finish_reason") == "length":
+                logging.warning(f"{project_data['name']} 的分析达到 max_tokens={self.max_tokens} 上限，内容可能不完整")
+        
+        backend = getattr(response, 'backend', None)
+        self._record_usage(usage, started, backend)
+        if self._cacheable(backend):
+            self._store_cache(cache_key, project_data, analysis)
+        result = self._success_result(project_data, analysis)
+        result["usage"] = usage
+        if timing:
+            result["timing"] = timing
+        return result
+
+    def _lookup_cache(self, project_data: Dict[str, Any], prompt: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        返回 (缓存键, 命中时的分析结果)；未启用缓存时缓存键为 None。
+        指纹发生变化的项目（changes 不为空）不读取缓存：最近推送月份等变化不会改变提示，
+        命中缓存会得到旧的分析；新的分析仍以同一个键写入缓存。
+        """
+        if not self.cache:
+            return None, None
+        cache_key = AnalysisCache.make_key(self.model_name, self.SYSTEM_PROMPT, prompt, self.TEMPERATURE)
+        if project_data.get('changes'):
+            metrics.counter('analysis_cache_total', result='bypass')
+            return cache_key, None
+        cached = self.cache.get(cache_key)
+        metrics.counter('analysis_cache_total', result='hit' if cached else 'miss')
+        if not cached:
+            return cache_key, None
+        logging.info(f"命中分析缓存: {project_data['name']}")
+        self.usage.record_cached()
+        result = self._success_result(project_data, cached["analysis"])
+        # 调度器按请求耗时估计剩余时间，命中缓存的结果不计入
+        result["cached"] = True
+        return cache_key, result
+
+    def _store_cache(self, cache_key: str, project_data: Dict[str, Any], analysis: str):
+        if self.cache and cache_key:
+            self.cache.set(cache_key, analysis, {"project_name": project_data["name"], "model": self.model_name})
+
+    def _cacheable(self, backend: LlmBackend) -> bool:
+        """
+        缓存键按主后端的模型计算；故障转移到使用其他模型的后端时，结果不写入缓存，
+        否则之后会被当作该模型的分析返回
+        """
+        return backend is None or backend is self.primary_backend or (backend.model or self.model_name) == self.model_name
+
+    def _record_usage(self, usage: Dict[str, Any], started: float, backend: LlmBackend = None):
+        """按处理请求的后端的价格累计用量"""
+        was_exhausted = self.usage.exhausted
+        self.usage.record(usage, time.monotonic() - started, prompt_price=backend and backend.prompt_price,
+                          completion_price=backend and backend.completion_price)
+        if self.usage.exhausted and not was_exhausted:
+            logging.warning(f"已达到 token 预算 {self.usage.budget}，不再提交新的分析")
+
+    def analyze_batch(self, projects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        在一次请求中分析多个项目，返回与 projects 顺序一致的结果。
+        
+        命中缓存的项目不会进入请求。回答要求为 JSON，按项目编号拆分并校验；
+        请求失败、回答无法解析或缺少某个项目时，相应项目改为单独调用 analyze_project。
+        批量请求不使用流式输出。
+        """
+        results: List[Dict[str, Any]] = [None] * len(projects)
+        pending = []
+        for i, project_data in enumerate(projects):
+            with metrics.span('prompt_build'):
+                prompt = self._build_analysis_prompt(project_data)
+            cache_key, cached = self._lookup_cache(project_data, prompt)
+            if cached:
+                results[i] = cached
+            else:
+                pending.append((i, project_data, cache_key))
+        
+        analyses, backend = self._request_batch([project_data for _, project_data, _ in pending]) \
+            if len(pending) > 1 else ({}, None)
+        for number, (i, project_data, cache_key) in enumerate(pending, 1):
+            analysis = analyses.get(number)
+            if analysis:
+                metrics.counter('batch_items_total', outcome='parsed')
+                # 以单项目提示的缓存键保存，之后无论是否批量都能命中
+                if self._cacheable(backend):
+                    self._store_cache(cache_key, project_data, analysis)
+                results[i] = self._success_result(project_data, analysis)
+            else:
+                if len(pending) > 1:
+                    metrics.counter('batch_items_total', outcome='fallback')
+                    logging.info(f"批量结果中缺少 {project_data['name']}，改为单独分析")
+                results[i] = self.analyze_project(project_data)
+        return results
+
+    def _request_batch(self, projects: List[Dict[str, Any]]) -> Tuple[Dict[int, str], LlmBackend]:
+        """
+        发送批量分析请求，返回 ({项目编号: 分析内容}, 处理请求的后端)；
+        任何错误都返回空字典，由调用方逐个重试
+        """
+        with metrics.span('prompt_build', batch=True):
+            prompt = self._build_batch_prompt(projects)
+        payload = {
+            "model": self.model_name,
+            "messages": [
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": self.TEMPERATURE,
+            "response_format": {"type": "json_object"},
+            # 回答长度按项目数放大，但不超过模型的输出上限
+            "max_tokens": min(self.max_tokens * len(projects), self.MAX_BATCH_TOKENS) if self.max_tokens else self.MAX_BATCH_TOKENS
+        }
+        
+        started = time.monotonic()
+        try:
+            with metrics.span('llm_request', batch=True):
+                # 批量请求的耗时与单个分析不同，不按单个分析的耗时分位数对冲
+                response = self.router.request(payload, hedge=False, timeout=90 + 30 * len(projects))
+        except Exception as e:
+            logging.warning(f"批量分析 {len(projects)} 个项目时出错: {str(e)}")
+            return {}, None
+        backend = getattr(response, 'backend', None)
+        if response.status_code != 200:
+            logging.warning(f"批量分析请求失败: 状态码 {response.status_code}")
+            return {}, backend
+        
+        try:
+            body = response.json()
+            choice = body["choices"][0]
+            content = choice["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            logging.warning(f"批量分析响应格式错误: {str(e)}")
+            return {}, backend
+        self._record_usage(body.get("usage"), started, backend)
+        if choice.get("finish_reason") == "length":
+            logging.warning("批量回答达到 max_tokens 上限，未完整返回的项目会单独分析")
+        return self._parse_batch_response(content, len(projects)), backend
+
+    @staticmethod
+    def _parse_batch_response(content: str, count: int) -> Dict[int, str]:
+        """解析批量回答中的 JSON，只保留编号在范围内且内容非空的项目"""
+        text = content.strip()
+        if text.startswith("```"):
+            # 去掉模型偶尔附带的代码块标记
+            text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            logging.warning(f"无法解析批量回答的 JSON: {str(e)}")
+            return {}
+        
+        items = data.get("analyses") if isinstance(data, dict) else data
+        analyses = {}
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                number = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            analysis = item.get("analysis")
+            if 1 <= number <= count and isinstance(analysis, str) and analysis.strip():
+                analyses[number] = analysis.strip()
+        return analyses
+
+    def _read_stream(self, response: requests.Response, started: float,
+                     on_partial: Callable[[str], None] = None) -> Tuple[str, Dict[str, float], Dict[str, int]]:
+        """
+        读取 SSE 流式回答，返回 (完整内容, 计时统计, usage)。
+        新增内容每隔 PARTIAL_FLUSH_INTERVAL 秒交给 on_partial；
+        连接中断或超过空闲超时时抛出 StreamInterrupted，其中带有已收到的内容。
+        """
+        content = []
+        pending = []
+        chunk_count = 0
+        usage = None
+        first_token_at = None
+        last_flush = time.monotonic()
+        
+        def flush():
+            nonlocal last_flush
+            if on_partial and pending:
+                on_partial(''.join(pending))
+            pending.clear()
+            last_flush = time.monotonic()
+        
+        try:
+            # chunk_size=None 让分块一到达就被处理，首个 token 时间才准确
+            for line in response.iter_lines(chunk_size=None):
+                if not line or not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip().decode('utf-8')
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if chunk.get('usage'):
+                    usage = chunk['usage']
+                for choice in chunk.get('choices') or []:
+                    if choice.get('finish_reason') == 'length':
+                        logging.warning(f"流式回答达到 max_tokens={self.max_tokens} 上限，内容可能不完整")
+                    delta = (choice.get('delta') or {}).get('content')
+                    if not delta:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    content.append(delta)
+                    pending.append(delta)
+                    chunk_count += 1
+                if time.monotonic() - last_flush >= self.PARTIAL_FLUSH_INTERVAL:
+                    flush()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            flush()
+            raise StreamInterrupted(''.join(content), str(e))
+        finally:
+            response.close()
+        flush()
+        
+        finished = time.monotonic()
+        first_token_at = first_token_at or finished
+        # 没有 usage 信息时用收到的分块数近似 token 数
+        completion_tokens = (usage or {}).get('completion_tokens') or chunk_count
+        generation_time = finished - first_token_at
+        return ''.join(content), {
+            "ttft": first_token_at - started,
+            "duration": finished - started,
+            "completion_tokens": completion_tokens,
+            "tokens_per_sec": completion_tokens / generation_time if generation_time > 0 else 0.0
+        }, usage or {"completion_tokens": completion_tokens}
+
+    def _analyze_safely(self, project_data: Dict[str, Any], on_partial=None) -> Dict[str, Any]:
+        try:
+            with metrics.span('analyze_project'):
+                result = self.analyze_project(project_data, on_partial=on_partial)
+        except Exception as e:
+            logging.error(f"分析项目 {project_data['name']} 时出错: {str(e)}")
+            result = self._failure_result(project_data, f"分析失败: {str(e)}")
+        metrics.counter('analyses_total', outcome='success' if result.get('success') else 'failure')
+        return result
+
+    def _analyze_batch_safely(self, projects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        try:
+            with metrics.span('analyze_batch'):
+                results = self.analyze_batch(projects)
+        except Exception as e:
+            logging.error(f"批量分析 {len(projects)} 个项目时出错: {str(e)}")
+            return [self._analyze_safely(project_data) for project_data in projects]
+        for result in results:
+            metrics.counter('analyses_total', outcome='success' if result.get('success') else 'failure')
+        return results
+
+    def _iter_units(self, tools: Iterable[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+        """把项目按 batch_size 分组，非批量模式下每组一个项目"""
+        iterator = iter(tools)
+        while True:
+            unit = list(itertools.islice(iterator, self.batch_size))
+            if not unit:
+                return
+            yield unit
+
+    def _clamp_concurrency(self, max_concurrency: int) -> int:
+        return max(1, min(max_concurrency, self.MAX_CONCURRENCY))
+
+    def analyze_projects(self, tools: List[Dict[str, Any]], max_concurrency: int = 4) -> List[Dict[str, Any]]:
+        """
+        并发分析多个项目，返回与 tools 顺序一致的结果（iter_analyses 的按序版本）。
+        token 预算耗尽后没有分析的项目返回跳过说明的失败结果。
+        """
+        tools = list(tools)
+        results = {id(project_data): result for project_data, result in self.iter_analyses(tools, max_concurrency)}
+        return [results.get(id(project_data)) or
+                self._failure_result(project_data, f"分析跳过: 已达到 token 预算 {self.usage.budget}")
+                for project_data in tools]
+
+    def iter_analyses(self, tools: Iterable[Dict[str, Any]], max_concurrency: int = 4,
+                      on_partial=None, stop_event: threading.Event = None) -> Iterator[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        边接收边分析：从 tools 中逐个取出项目交给工作线程，按完成顺序产出 (project_data, result)。
+        在途请求数不超过 max_concurrency，tools 的生产者会因此被限速，内存占用保持有界。
+        token 预算耗尽后不再从 tools 中取新的项目。批量模式下每凑满 batch_size 个项目提交一次请求。
+        tools 迭代过程中抛出的异常会在调用方重新抛出。on_partial 会从工作线程中被调用。
+        stop_event 被设置后不再提交新的分析，在途的分析完成并产出后结束（用于收到 SIGTERM 时排空）。
+        """
+        max_concurrency = self._clamp_concurrency(max_concurrency)
+        results = queue.Queue()
+        slots = threading.Semaphore(max_concurrency)
+        done = object()
+        stopped = threading.Event()
+        
+        def analyze(index: int, unit: List[Dict[str, Any]]):
+            try:
+                if len(unit) == 1:
+                    logging.info(f"正在分析项目 {index}: {unit[0]['name']}")
+                    results.put((unit[0], self._analyze_safely(unit[0], on_partial)))
+                    return
+                logging.info(f"正在批量分析项目 {index}-{index + len(unit) - 1}")
+                for project_data, result in zip(unit, self._analyze_batch_safely(unit)):
+                    results.put((project_data, result))
+            finally:
+                slots.release()
+        
+        def produce():
+            error = None
+            with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+                try:
+                    index = 1
+                    units = self._iter_units(tools)
+                    while True:
+                        # 先等到空闲位置再取下一个项目，按优先级排序的 tools 可以在这时才决定下一个
+                        slots.acquire()
+                        # 在途请求可能刚刚用完预算
+                        if stopped.is_set() or self.usage.exhausted or (stop_event and stop_event.is_set()):
+                            slots.release()
+                            break
+                        unit = next(units, None)
+                        if unit is None:
+                            slots.release()
+                            break
+                        executor.submit(analyze, index, unit)
+                        index += len(unit)
+                except Exception as e:
+                    error = e
+            results.put((done, error))
+        
+        producer = threading.Thread(target=produce, name='analysis-producer', daemon=True)
+        producer.start()
+        try:
+            while True:
+                project_data, result = results.get()
+                if project_data is done:
+                    if result is not None:
+                        raise result
+                    return
+                yield project_data, result
+        finally:
+            # 调用方提前停止时，不再提交新的分析
+            stopped.set()
+
+    def _success_result(self, project_data: Dict[str, Any], analysis: str) -> Dict[str, Any]:
         return {
             "project_name": project_data["name"],
-            "analysis": "分析失败: 多次尝试后仍然失败，请检查网络连接或API配置。",
+            "analysis": analysis,
             "analyzed_at": project_data.get("discovered_date", ""),
-            "original_data": project_data
+            "original_data": project_data,
+            "success": True
         }
 
+    def _failure_result(self, project_data: Dict[str, Any], message: str) -> Dict[str, Any]:
+        """构建与成功结果格式一致的失败结果"""
+        return {
+            "project_name": project_data["name"],
+            "analysis": message,
+            "analyzed_at": project_data.get("discovered_date", ""),
+            "original_data": project_data,
+            "success": False
+        }
+
+    def _format_project(self, project_data: Dict[str, Any]) -> str:
+        """项目信息部分，过长的描述会被截断，标签最多保留 MAX_PROMPT_TAGS 个"""
+        description = project_data['description'] or ''
+        if self.max_description_chars and len(description) > self.max_description_chars:
+            description = description[:self.max_description_chars].rstrip() + '…'
+        tags = project_data['tags'][:self.MAX_PROMPT_TAGS]
+        return f"""项目名称：{project_data['name']}
+项目描述：{description}
+编程语言：{project_data['language']}
+Star数量：{project_data['stars']}
+标签：{', '.join(tags)}
+"""
+
     def _build_analysis_prompt(self, project_data: Dict[str, Any]) -> str:
         """
         构建用于项目分析的提示
         """
-        return f"""请分析以下AI工具项目并提供专业见解：
+        return f"请分析以下AI工具项目并提供专业见解：\n\n{self._format_project(project_data)}\n{self.ANALYSIS_ASPECTS}"
 
-项目名称：{project_data['name']}
-项目描述：{project_data['description']}
-编程语言：{project_data['language']}
-Star数量：{project_data['stars']}
-标签：{', '.join(project_data['tags'])}
+    def _build_batch_prompt(self, projects: List[Dict[str, Any]]) -> str:
+        """构建批量分析提示，要求以 JSON 返回，每个项目用编号对应"""
+        sections = "\n".join(f"项目编号：{i}\n{self._format_project(p)}" for i, p in enumerate(projects, 1))
+        return f"""请分别分析以下 {len(projects)} 个AI工具项目并提供专业见解：
 
-请从以下几个方面进行分析：
-1. 项目的主要功能和应用场景
-2. 技术特点和创新点
-3. 项目的潜在价值和市场前景
-4. 代码质量和维护状况评估
-5. 建议和改进空间
-
-请用中文回答，并保持专业、客观的分析态度。
+{sections}
+对每个项目，{self.ANALYSIS_ASPECTS}
+请只返回一个 JSON 对象，不要包含其他内容，格式如下：
+{{"analyses": [{{"id": 项目编号, "analysis": "该项目的 Markdown 格式分析"}}]}}
+每个项目对应 analyses 中的一个元素，不要遗漏任何项目。
 """ 
\ No newline at end of file
@@ -0,0 +1,187 @@
+import re
+import time
+import random
+import logging
+import threading
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+
+from scripts.metrics import metrics
+
+
+class RateLimitScheduler:
+    """
+    令牌桶请求调度器，DataCollector 和 ProjectAnalyzer 共用。
+
+    每个实例对应一个速率限制配额（例如 GitHub search、DeepSeek chat）。
+    发送请求前先取得令牌。收到响应后根据 X-RateLimit-Remaining / X-RateLimit-Reset /
+    Retry-After 响应头校正令牌桶：剩余配额可以全速使用，配额耗尽或服务端要求等待时
+    暂停到重置时间，而不是等到请求被拒绝。没有响应头时按初始速率和突发量限流。
+    request() 是唯一的重试策略：对 429、5xx、配额耗尽的 403 以及连接错误和超时进行重试。
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, name: str, rate: float = 5.0, burst: int = 5, max_retries: int = 3,
+                 backoff_base: float = 2.0, max_backoff: float = 60.0):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.retry_count = 0
+        self._capacity = float(self.burst)
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        if elapsed > 0:
+            self._tokens = min(self._capacity, self._tokens + elapsed * self.rate)
+            self._last_refill = now
+
+    def acquire(self):
+        """阻塞直到可以发送下一个请求"""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    break
+                else:
+                    wait = (1 - self._tokens) / self.rate if self.rate > 0 else 1.0
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            metrics.observe('rate_limit_wait_seconds', waited, limiter=self.name)
+
+    def block_for(self, seconds: float):
+        """在指定时间内暂停所有请求"""
+        if seconds <= 0:
+            return
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        logging.info(f"[{self.name}] 速率限制: 暂停 {seconds:.1f} 秒")
+
+    def update_from_headers(self, headers):
+        """根据响应头调整速率和暂停时间"""
+        retry_after = self._parse_retry_after(headers.get('Retry-After'))
+        if retry_after is not None:
+            self.block_for(retry_after)
+
+        remaining = headers.get('X-RateLimit-Remaining', headers.get('x-ratelimit-remaining-requests'))
+        reset_in = self._parse_reset(headers)
+        if remaining is None or reset_in is None:
+            return
+        try:
+            remaining = int(remaining)
+        except ValueError:
+            return
+
+        if remaining <= 0:
+            self.block_for(reset_in + 1)
+            return
+
+        # 剩余配额可以立即全速使用，之后按重置周期补充
+        with self._lock:
+            self._last_refill = time.monotonic()
+            self._capacity = float(remaining)
+            self._tokens = float(remaining)
+            self.rate = remaining / max(reset_in, 1.0)
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now().astimezone()).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _parse_reset(headers) -> Optional[float]:
+        """返回距离配额重置的秒数，兼容 GitHub（时间戳）和 OpenAI 风格（时长，如 6m0s）"""
+        reset = headers.get('X-RateLimit-Reset')
+        if reset is not None:
+            try:
+                return max(0.0, float(reset) - time.time())
+            except ValueError:
+                return None
+
+        reset = headers.get('x-ratelimit-reset-requests')
+        if not reset:
+            return None
+        units = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+        parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', reset)
+        if not parts:
+            return None
+        return sum(float(amount) * units[unit] for amount, unit in parts)
+
+    def _should_retry(self, response: requests.Response) -> bool:
+        if response.status_code in self.RETRY_STATUSES:
+            return True
+        # GitHub 在配额耗尽或触发二级限流时返回 403
+        return response.status_code == 403 and (
+            response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers
+        )
+
+    def _count_retry(self, reason):
+        with self._lock:
+            self.retry_count += 1
+        metrics.counter('retries_total', limiter=self.name, reason=reason)
+
+    def _backoff(self, attempt: int) -> float:
+        wait = min(self.max_backoff, self.backoff_base * (2 ** attempt))
+        return wait + random.uniform(0, wait / 4)
+
+    def _sleep_backoff(self, wait: float):
+        time.sleep(wait)
+        metrics.observe('retry_backoff_seconds', wait, limiter=self.name)
+
+    def request(self, session: requests.Session, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        通过调度器发送请求，按需重试。
+        返回最后一次收到的响应（可能仍是错误状态码），重试用尽后的网络异常会被抛出。
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                wait = self._backoff(attempt)
+                self._count_retry(type(e).__name__)
+                logging.warning(f"[{self.name}] 请求出错: {str(e)}，将在 {wait:.1f} 秒后重试 (尝试 {attempt + 1}/{self.max_retries})")
+                self._sleep_backoff(wait)
+                continue
+
+            metrics.counter('http_responses_total', limiter=self.name, status=response.status_code)
+            self.update_from_headers(response.headers)
+            if not self._should_retry(response) or attempt >= self.max_retries:
+                return response
+
+            self._count_retry(response.status_code)
+            if 'Retry-After' in response.headers or response.headers.get('X-RateLimit-Remaining') == '0':
+                # 暂停时间已由响应头设置，下一次 acquire 会等待
+                logging.warning(f"[{self.name}] 状态码 {response.status_code}，按速率限制等待后重试 (尝试 {attempt + 1}/{self.max_retries})")
+            else:
+                wait = self._backoff(attempt)
+                logging.warning(f"[{self.name}] 状态码 {response.status_code}，将在 {wait:.1f} 秒后重试 (尝试 {attempt + 1}/{self.max_retries})")
+                self._sleep_backoff(wait)
+            response.close()
+        return response
@@ -0,0 +1,233 @@
+import os
+import sys
+import csv
+import json
+import heapq
+import shutil
+import logging
+from datetime import datetime
+from typing import Dict, Any, IO, Iterable, Iterator, List, Optional
+
+# 仓库指纹字段在报告中的名称
+CHANGE_LABELS = {
+    'stars_bucket': '星标数',
+    'description': '描述',
+    'topics': '主题',
+    'pushed_month': '最近推送'
+}
+
+# CSV 输出的列，分析全文只写入 JSON Lines
+CSV_FIELDS = ['name', 'url', 'language', 'stars', 'description', 'tags', 'discovered_date',
+              'pushed_at', 'changes', 'duplicate_of', 'success', 'analysis_chars']
+
+
+def save_to_markdown(tools: List[Dict[str, Any]], filename: str, usage: Optional[Dict[str, Any]] = None):
+    """把一组工具写成 Markdown 报告（每种语言内按星标排序）"""
+    writer = ReportWriter(filename, formats=('md',))
+    for tool in tools:
+        writer.add(tool)
+    writer.close(usage, write_empty=True)
+
+
+class ReportWriter:
+    """
+    增量报告写入器。
+
+    分析完成的工具逐个加入：JSON Lines 和 CSV 输出立即追加，Markdown 所需的工具按语言
+    暂存在内存中，暂存总数超过 MAX_BUFFERED 时把最大的一组按星标排序后写入临时文件。
+    内存中只保留概览所需的累计值和有限的暂存工具。close 时逐个语言归并临时文件，
+    按星标从高到低生成 Markdown 报告。
+
+    运行被强制终止时，JSON Lines 和 CSV 中保留已经写入的工具，
+    可以用 rebuild_markdown() 或 python scripts/report_writer.py <jsonl> 重新生成 Markdown 报告。
+    """
+
+    MAX_BUFFERED = 200
+    FORMATS = ('md', 'jsonl', 'csv')
+
+    def __init__(self, filename: str, formats: Iterable[str] = FORMATS):
+        self.filename = filename
+        self.formats = set(formats)
+        base = filename[:-3] if filename.endswith('.md') else filename
+        self.jsonl_path = f"{base}.jsonl"
+        self.csv_path = f"{base}.csv"
+        self.spill_dir = f"{base}.parts"
+
+        # 概览使用的累计值
+        self.count = 0
+        self.total_stars = 0
+        self.refreshed = 0
+        self.language_counts: Dict[str, int] = {}
+
+        # 按语言暂存的工具和已写出的有序临时文件
+        self._buffers: Dict[str, List[Dict[str, Any]]] = {}
+        self._buffered = 0
+        self._runs: Dict[str, List[str]] = {}
+        self._spill_count = 0
+        self._closed = False
+
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        # 同一运行 ID 继续运行时，之前的临时文件和输出会由调用方重新写入
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        self._jsonl: Optional[IO] = None
+        self._csv_file: Optional[IO] = None
+        self._csv: Optional[csv.DictWriter] = None
+        if 'jsonl' in self.formats:
+            self._jsonl = open(self.jsonl_path, 'w', encoding='utf-8')
+        if 'csv' in self.formats:
+            self._csv_file = open(self.csv_path, 'w', encoding='utf-8-sig', newline='')
+            self._csv = csv.DictWriter(self._csv_file, fieldnames=CSV_FIELDS)
+            self._csv.writeheader()
+
+    def add(self, tool: Dict[str, Any], success: Optional[bool] = None):
+        """加入一个已分析的工具，success 为分析是否成功（未知时为 None）"""
+        language = tool.get('language', '未知')
+        self.count += 1
+        self.total_stars += tool.get('stars', 0)
+        self.language_counts[language] = self.language_counts.get(language, 0) + 1
+        if tool.get('changes'):
+            self.refreshed += 1
+
+        if self._jsonl:
+            self._jsonl.write(json.dumps(dict(tool, success=success), ensure_ascii=False) + "\n")
+            self._jsonl.flush()
+        if self._csv:
+            self._csv.writerow({
+                'name': tool['name'],
+                'url': tool['url'],
+                'language': language,
+                'stars': tool.get('stars', 0),
+                'description': tool.get('description', ''),
+                'tags': ';'.join(tool.get('tags', [])),
+                'discovered_date': tool.get('discovered_date', ''),
+                'pushed_at': tool.get('pushed_at') or '',
+                'changes': ';'.join(tool.get('changes') or []),
+                'duplicate_of': tool.get('duplicate_of') or '',
+                'success': '' if success is None else success,
+                'analysis_chars': len(tool.get('analysis') or '')
+            })
+            self._csv_file.flush()
+
+        if 'md' in self.formats:
+            self._buffers.setdefault(language, []).append(tool)
+            self._buffered += 1
+            if self._buffered > self.MAX_BUFFERED:
+                self._spill_largest()
+
+    def _spill_largest(self):
+        """把暂存最多的语言按星标排序写入临时文件"""
+        language = max(self._buffers, key=lambda lang: len(self._buffers[lang]))
+        tools = self._buffers.pop(language)
+        self._buffered -= len(tools)
+        runs = self._runs.setdefault(language, [])
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"{self._spill_count:05d}.jsonl")
+        self._spill_count += 1
+        with open(path, 'w', encoding='utf-8') as f:
+            for tool in sorted(tools, key=self._sort_key):
+                f.write(json.dumps(tool, ensure_ascii=False) + "\n")
+        runs.append(path)
+
+    @staticmethod
+    def _sort_key(tool: Dict[str, Any]):
+        return -tool.get('stars', 0)
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[Dict[str, Any]]:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+    def _iter_language(self, language: str) -> Iterator[Dict[str, Any]]:
+        """按星标从高到低归并一种语言的临时文件和内存中的暂存"""
+        sources = [self._read_run(path) for path in self._runs.get(language, [])]
+        sources.append(iter(sorted(self._buffers.get(language, []), key=self._sort_key)))
+        return heapq.merge(*sources, key=self._sort_key)
+
+    def close(self, usage: Optional[Dict[str, Any]] = None, write_empty: bool = False):
+        """生成最终的 Markdown 报告，usage 为本次运行的 token 用量摘要"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._jsonl:
+            self._jsonl.close()
+        if self._csv_file:
+            self._csv_file.close()
+        if not self.count and not write_empty:
+            # 没有任何工具时不留下只有表头的输出文件
+            for path, enabled in ((self.jsonl_path, self._jsonl), (self.csv_path, self._csv_file)):
+                if enabled and os.path.exists(path):
+                    os.remove(path)
+        try:
+            if 'md' in self.formats and (self.count or write_empty):
+                self._write_markdown(usage)
+        finally:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def _write_markdown(self, usage: Optional[Dict[str, Any]]):
+        tmp_path = f"{self.filename}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(f"# AI 工具分析报告 - {datetime.now().strftime('%Y-%m-%d')}\n\n")
+            self._write_overview(f, usage)
+            for language in sorted(self.language_counts):
+                f.write(f"## {language} 相关工具\n\n")
+                for i, tool in enumerate(self._iter_language(language), 1):
+                    self._write_tool(f, i, tool)
+        os.replace(tmp_path, self.filename)
+
+    def _write_overview(self, f: IO, usage: Optional[Dict[str, Any]]):
+        f.write(f"## 今日更新概览\n\n")
+        f.write(f"- 新增工具数量: {self.count} 个\n")
+        if self.refreshed:
+            f.write(f"- 其中因仓库变化重新分析: {self.refreshed} 个\n")
+        f.write(f"- 总星标数: {self.total_stars} ⭐\n")
+        f.write(f"- 涉及编程语言: {', '.join(sorted(self.language_counts))}\n")
+        if usage:
+            # usage 为 TokenUsage.summary() 的结果
+            f.write(f"- Token 用量: {usage['total_tokens']}（提示 {usage['prompt_tokens']} / 回答 {usage['completion_tokens']}），"
+                    f"{usage['requests']} 次请求，{usage['cached']} 次缓存命中\n")
+            f.write(f"- 预估费用: ${usage['cost_usd']:.4f}\n")
+            f.write(f"- 平均生成速度: {usage['tokens_per_sec']} tokens/秒\n")
+            if usage.get('budget'):
+                f.write(f"- Token 预算: {usage['budget']}\n")
+        f.write("\n")
+
+    @staticmethod
+    def _write_tool(f: IO, index: int, tool: Dict[str, Any]):
+        changes = [CHANGE_LABELS.get(field, field) for field in tool.get('changes') or []]
+        suffix = f"（{'、'.join(changes)}有变化，重新分析）" if changes else ''
+        f.write(f"### {index}. {tool['name']} ⭐{tool.get('stars', 0)}{suffix}\n\n")
+        f.write(f"**AI 分析报告**:\n\n{tool.get('analysis', '暂无分析')}\n\n")
+        f.write(f"**描述**: {tool['description']}\n\n")
+        f.write(f"**标签**: {', '.join(tool.get('tags', []))}\n\n")
+        f.write(f"**GitHub**: [{tool['url']}]({tool['url']})\n\n")
+        f.write("---\n\n")
+
+
+def rebuild_markdown(jsonl_path: str, filename: str = None) -> int:
+    """根据 JSON Lines 输出重新生成 Markdown 报告（例如运行被强制终止后），返回工具数量"""
+    if filename is None:
+        filename = f"{jsonl_path[:-6] if jsonl_path.endswith('.jsonl') else jsonl_path}.md"
+    writer = ReportWriter(filename, formats=('md',))
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                tool = json.loads(line)
+            except ValueError:
+                # 最后一行可能在写入时被中断
+                logging.warning(f"跳过无法解析的行: {line[:80]}")
+                continue
+            writer.add(tool)
+    writer.close()
+    return writer.count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python scripts/report_writer.py <报告.jsonl> [输出.md]")
+        sys.exit(1)
+    count = rebuild_markdown(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"已根据 {count} 个工具重新生成报告")
@@ -0,0 +1,80 @@
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Any
+
+
+class RunJournal:
+    """
+    自动化运行的日志，用于中断后继续。
+
+    每个分析完成的项目追加一行 JSON 到 output/runs/<run_id>.jsonl，包含运行 ID、仓库 URL、
+    是否成功以及完整的工具信息，写入后立即刷到磁盘。使用同一个 run_id 继续运行时，
+    load() 返回每个 URL 最后一次的记录，已成功的项目无需再次分析。
+    流式分析过程中生成的部分内容以 partial 记录追加，load() 不会把它们当作完成的记录。
+    """
+
+    def __init__(self, run_id: str = None, journal_dir: str = 'output/runs'):
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.path = os.path.join(journal_dir, f"{self.run_id}.jsonl")
+        self._file = None
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """读取日志，返回 {url: 最后一条记录}，忽略中断时写了一半的行"""
+        entries = {}
+        if not self.exists():
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logging.warning(f"运行日志 {self.path} 第 {line_number} 行不完整，已忽略")
+                    continue
+                if 'partial' in entry:
+                    continue
+                if entry.get('run_id') == self.run_id and entry.get('url'):
+                    entries[entry['url']] = entry
+        return entries
+
+    def _append(self, entry: Dict[str, Any]):
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def record(self, tool: Dict[str, Any], success: bool):
+        """记录一个已完成（成功或失败）的分析"""
+        self._append({
+            'run_id': self.run_id,
+            'url': tool['url'],
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'success': success,
+            'tool': tool
+        })
+
+    def record_partial(self, tool: Dict[str, Any], text: str):
+        """追加流式分析中新生成的一段内容，可以从多个工作线程调用"""
+        self._append({
+            'run_id': self.run_id,
+            'url': tool['url'],
+            'partial': text
+        })
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,136 @@
+import re
+from datetime import datetime, timedelta
+from typing import Set
+
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(spec: str) -> float:
+    """解析 90、90s、30m、6h、1d 这样的时长，返回秒数（不带单位时为秒）"""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([smhd]?)', spec.strip().lower())
+    if not match:
+        raise ValueError(f"无法解析的时长: {spec}")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def parse_deadline(spec: str, now: datetime = None) -> datetime:
+    """
+    解析截止时间：HH:MM 表示今天的该时刻（已经过去时为明天），
+    也可以是完整的 ISO 格式日期时间，例如 2025-05-16T18:00。
+    带时区的时间（例如 2025-05-16T18:00+08:00）转换为本地时间，返回值总是不带时区的本地时间。
+    """
+    now = now or datetime.now()
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', spec.strip())
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            raise ValueError(f"无法解析的截止时间: {spec}")
+        deadline = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return deadline if deadline > now else deadline + timedelta(days=1)
+    try:
+        deadline = datetime.fromisoformat(spec.strip())
+    except ValueError:
+        raise ValueError(f"无法解析的截止时间: {spec}（应为 HH:MM 或 ISO 格式）")
+    # 调用方与 datetime.now() 比较，带时区的值需要先转换
+    return deadline.astimezone().replace(tzinfo=None) if deadline.tzinfo else deadline
+
+
+class IntervalSchedule:
+    """
+    固定间隔的调度：下一次运行在上一次开始后 seconds 秒。
+    上一次运行超过间隔时立即开始下一次，不会补跑错过的次数。
+    """
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError(f"运行间隔必须大于0: {seconds}")
+        self.seconds = seconds
+
+    @classmethod
+    def parse(cls, spec: str) -> 'IntervalSchedule':
+        """解析 90、90s、30m、6h、1d 这样的间隔（不带单位时为秒）"""
+        return cls(parse_duration(spec))
+
+    def next_run(self, last_started: datetime) -> datetime:
+        return max(last_started + timedelta(seconds=self.seconds), datetime.now())
+
+    def __str__(self):
+        return f"每 {self.seconds:g} 秒"
+
+
+class CronSchedule:
+    """
+    标准 5 字段 cron 表达式（分 时 日 月 星期），使用本地时间。
+
+    每个字段支持 *、数字、范围 a-b、列表 a,b 和步长 */n、a-b/n；星期中 0 和 7 都表示周日。
+    与 cron 相同，日和星期都不是 * 时，满足其中一个即可。
+    上一次运行结束时已经错过的时间点不会补跑。
+    """
+
+    FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7))
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron 表达式需要 5 个字段: {expression}")
+        values = [self._parse_field(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = values
+        # cron 的星期以周日为 0，转换为 datetime.weekday() 的周一为 0
+        self.weekdays = {(day - 1) % 7 for day in weekdays}
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for item in field.split(','):
+            match = re.fullmatch(r'(\*|\d+)(?:-(\d+))?(?:/(\d+))?', item)
+            if not match:
+                raise ValueError(f"无法解析的 cron 字段: {field}")
+            start, end, step = match.groups()
+            if start == '*':
+                if end:
+                    raise ValueError(f"无法解析的 cron 字段: {field}")
+                first, last = low, high
+            else:
+                first = int(start)
+                # 只有起点带步长时（如 5/15）表示从起点到最大值
+                last = int(end) if end else (high if step else first)
+            step = int(step) if step else 1
+            if first < low or last > high or first > last or step < 1:
+                raise ValueError(f"cron 字段超出范围 {low}-{high}: {field}")
+            values.update(range(first, last + 1, step))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = moment.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, moment: datetime) -> datetime:
+        """返回 moment 之后（不含）第一个匹配的时间点，按月、日、小时逐级跳过不匹配的部分"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # 闰年的 2 月 29 日最多需要向后查找 8 年
+        limit = candidate + timedelta(days=366 * 8)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year, month = divmod(candidate.month, 12)
+                candidate = candidate.replace(year=candidate.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"cron 表达式没有可以匹配的时间: {self.expression}")
+
+    def next_run(self, last_started: datetime) -> datetime:
+        return self.next_after(max(last_started, datetime.now()))
+
+    def __str__(self):
+        return f"cron '{self.expression}'"
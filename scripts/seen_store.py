@@ -0,0 +1,173 @@
+import os
+import json
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+
+class SeenStore(ABC):
+    """
+    已处理仓库的存储接口。
+
+    DataCollector 只依赖这里定义的方法，可以替换为其他后端。
+    每个 URL 记录首次发现时间、最近一次的星标数、分析结果哈希，
+    以及分析时的仓库指纹（用于判断仓库是否有变化需要重新分析）。
+    """
+
+    @abstractmethod
+    def __contains__(self, url: str) -> bool:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    @abstractmethod
+    def __iter__(self) -> Iterator[str]:
+        ...
+
+    @abstractmethod
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """返回指定 URL 的元数据，不存在时返回 None"""
+
+    @abstractmethod
+    def add_many(self, records: Iterable[Dict[str, Any]]):
+        """批量写入记录，每条记录至少包含 url，已存在的 URL 只更新提供的字段"""
+
+    def add(self, url: str, **metadata):
+        self.add_many([dict(metadata, url=url)])
+
+    @abstractmethod
+    def remove(self, url: str) -> bool:
+        """移除指定 URL，返回是否存在"""
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    def close(self):
+        pass
+
+
+class SQLiteSeenStore(SeenStore):
+    """
+    基于 SQLite 的已处理仓库存储。
+
+    url 为主键，成员判断和增量写入都走索引；每次写入都在事务中完成，
+    进程中途退出不会破坏已有数据。
+    """
+
+    COLUMNS = ('first_seen', 'last_seen', 'last_stars', 'analysis_hash', 'fingerprint')
+
+    def __init__(self, db_path: str = 'output/github_seen.db'):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS seen_repos (
+                    url TEXT PRIMARY KEY,
+                    first_seen TEXT NOT NULL,
+                    last_seen TEXT NOT NULL,
+                    last_stars INTEGER,
+                    analysis_hash TEXT,
+                    fingerprint TEXT
+                )
+            """)
+            # 旧版数据库没有 fingerprint 列
+            columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(seen_repos)")}
+            if 'fingerprint' not in columns:
+                self._conn.execute("ALTER TABLE seen_repos ADD COLUMN fingerprint TEXT")
+
+    def __contains__(self, url: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM seen_repos WHERE url = ?", (url,)).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM seen_repos").fetchone()[0]
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT url FROM seen_repos ORDER BY url").fetchall()
+        return iter([row['url'] for row in rows])
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM seen_repos WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def add_many(self, records: Iterable[Dict[str, Any]]):
+        now = datetime.now().isoformat(timespec='seconds')
+        rows = []
+        for record in records:
+            rows.append({
+                'url': record['url'],
+                'first_seen': record.get('first_seen') or now,
+                'last_seen': record.get('last_seen') or now,
+                'last_stars': record.get('last_stars'),
+                'analysis_hash': record.get('analysis_hash'),
+                'fingerprint': record.get('fingerprint')
+            })
+        if not rows:
+            return
+        with self._lock, self._conn:
+            # 已存在的 URL 保留首次发现时间，未提供的字段保持原值
+            self._conn.executemany("""
+                INSERT INTO seen_repos (url, first_seen, last_seen, last_stars, analysis_hash, fingerprint)
+                VALUES (:url, :first_seen, :last_seen, :last_stars, :analysis_hash, :fingerprint)
+                ON CONFLICT(url) DO UPDATE SET
+                    last_seen = excluded.last_seen,
+                    last_stars = COALESCE(excluded.last_stars, seen_repos.last_stars),
+                    analysis_hash = COALESCE(excluded.analysis_hash, seen_repos.analysis_hash),
+                    fingerprint = COALESCE(excluded.fingerprint, seen_repos.fingerprint)
+            """, rows)
+
+    def remove(self, url: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM seen_repos WHERE url = ?", (url,))
+        return cursor.rowcount > 0
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM seen_repos")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def migrate_from_json(self, json_path: str) -> int:
+        """
+        一次性导入旧版 github_seen_urls.json，导入后将原文件重命名为 .migrated。
+        返回导入的 URL 数量。
+        """
+        if not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                urls: List[str] = json.load(f)
+        except Exception as e:
+            logging.warning(f"读取旧版已处理列表 {json_path} 时出错: {str(e)}")
+            return 0
+
+        # 旧文件没有记录发现时间，用文件修改时间代替
+        first_seen = datetime.fromtimestamp(os.path.getmtime(json_path)).isoformat(timespec='seconds')
+        self.add_many({'url': url, 'first_seen': first_seen, 'last_seen': first_seen} for url in urls)
+        os.replace(json_path, f"{json_path}.migrated")
+        logging.info(f"已从 {json_path} 迁移 {len(urls)} 个已处理仓库")
+        return len(urls)
+
+
+def open_seen_store(path: str = 'output/github_seen.db',
+                    legacy_json: str = 'output/github_seen_urls.json') -> SeenStore:
+    """打开默认的已处理仓库存储，并迁移旧版 JSON 文件（如果存在）"""
+    store = SQLiteSeenStore(path)
+    store.migrate_from_json(legacy_json)
+    return store
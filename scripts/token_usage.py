@@ -0,0 +1,82 @@
+import threading
+from typing import Dict, Any, Optional
+
+from scripts.metrics import metrics
+
+
+class TokenUsage:
+    """
+    一次运行的 token 用量统计和预算。
+
+    每次 API 请求完成后调用 record() 累加 usage 中的 prompt / completion / total tokens。
+    设置 budget 后，累计用量达到预算即视为耗尽，ProjectAnalyzer 不再提交新的分析；
+    已经在途的请求仍会完成并计入，对冲中落后的请求也读取 usage 后计入（BackendRouter 的 on_usage）；
+    每个在途分析最多有原请求和一个对冲请求，因此实际用量最多超出 2 × 并发数 × max_tokens
+    （只有一个后端时默认不对冲，最多超出 并发数 × max_tokens）。
+    """
+
+    # 每百万 token 的价格（美元），DeepSeek 调价时通过参数覆盖
+    DEFAULT_PROMPT_PRICE = 0.27
+    DEFAULT_COMPLETION_PRICE = 1.10
+
+    def __init__(self, budget: Optional[int] = None, prompt_price: float = DEFAULT_PROMPT_PRICE,
+                 completion_price: float = DEFAULT_COMPLETION_PRICE):
+        self.budget = budget if budget and budget > 0 else None
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.requests = 0
+        self.cached = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.request_seconds = 0.0
+        self._cost = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, usage: Optional[Dict[str, Any]], duration: float = 0.0, prompt_price: float = None,
+               completion_price: float = None):
+        """
+        累加一次请求的用量，usage 为 API 返回的 usage 字段（可能缺失）。
+        prompt_price / completion_price 为处理该请求的后端的价格，None 时使用默认价格。
+        """
+        usage = usage or {}
+        prompt = int(usage.get('prompt_tokens') or 0)
+        completion = int(usage.get('completion_tokens') or 0)
+        total = int(usage.get('total_tokens') or prompt + completion)
+        prompt_price = self.prompt_price if prompt_price is None else prompt_price
+        completion_price = self.completion_price if completion_price is None else completion_price
+        with self._lock:
+            self._cost += (prompt * prompt_price + completion * completion_price) / 1_000_000
+            self.requests += 1
+            self.prompt_tokens += prompt
+            self.completion_tokens += completion
+            self.total_tokens += total
+            self.request_seconds += duration
+        metrics.counter('llm_tokens_total', prompt, kind='prompt')
+        metrics.counter('llm_tokens_total', completion, kind='completion')
+
+    def record_cached(self):
+        with self._lock:
+            self.cached += 1
+
+    @property
+    def exhausted(self) -> bool:
+        return self.budget is not None and self.total_tokens >= self.budget
+
+    @property
+    def cost(self) -> float:
+        return self._cost
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'cached': self.cached,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'total_tokens': self.total_tokens,
+                'budget': self.budget,
+                'cost_usd': round(self.cost, 4),
+                # 请求耗时之和包含排队和网络时间，得到的是单个请求视角的平均生成速度
+                'tokens_per_sec': round(self.completion_tokens / self.request_seconds, 1) if self.request_seconds else 0.0
+            }
@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+
+
+class WorkQueue(ABC):
+    """
+    待分析工具的共享队列接口，语义与 SQS 的可见性超时相同。
+
+    收集器调用 enqueue() 放入工具，任意数量的工作进程调用 lease() 租用项目：
+    租用的项目在 visibility 秒内对其他工作进程不可见，工作进程通过 heartbeat() 延长租期，
+    完成后调用 complete()，失败时调用 fail()。工作进程崩溃或失联时租期到期，项目重新可见，
+    不会丢失。每次租用生成新的令牌，只有持有当前令牌的一方能完成或退回项目，
+    租期过期后迟到的结果不会覆盖其他工作进程的状态。
+
+    项目的状态为 pending（等待）、leased（已租用）、done（完成）或 failed（超过最大尝试次数）。
+    run_automation.run_worker 只依赖这里定义的方法，可以替换为其他后端。
+    """
+
+    @abstractmethod
+    def enqueue(self, tools: Iterable[Dict[str, Any]]) -> int:
+        """
+        放入工具（按 url 去重），返回新加入或重新放入的数量。
+        等待中的项目只更新工具信息和优先级；已租用的项目不受影响；已完成或失败的项目重新等待。
+        """
+
+    @abstractmethod
+    def lease(self, owner: str, count: int = 1, visibility: float = 300) -> List[Dict[str, Any]]:
+        """按优先级租用最多 count 个可见的项目，返回 [{'url', 'token', 'attempts', 'tool'}]"""
+
+    @abstractmethod
+    def heartbeat(self, leases: Iterable[Dict[str, Any]], visibility: float = 300) -> List[Dict[str, Any]]:
+        """把租期延长到 visibility 秒之后，返回已经失去的租用（租期过期后被其他工作进程租用）"""
+
+    @abstractmethod
+    def complete(self, lease: Dict[str, Any]) -> bool:
+        """标记为完成，租用已经失去时返回 False"""
+
+    @abstractmethod
+    def fail(self, lease: Dict[str, Any], error: str = None) -> Optional[str]:
+        """记录一次失败：未超过最大尝试次数时延迟后重新等待，否则标记为 failed；返回新状态，租用已经失去时返回 None"""
+
+    @abstractmethod
+    def release(self, lease: Dict[str, Any]) -> bool:
+        """退回没有处理的项目，立即重新可见，不计入尝试次数"""
+
+    @abstractmethod
+    def ready(self) -> int:
+        """现在可以租用的项目数量"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """各状态的项目数量"""
+
+    @abstractmethod
+    def requeue_failed(self) -> int:
+        """把失败的项目重新放回等待，尝试次数清零"""
+
+    @abstractmethod
+    def purge(self, state: str = 'done') -> int:
+        """删除指定状态的项目"""
+
+    def close(self):
+        pass
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """
+    基于 SQLite 的工作队列，适合同一台机器上的多个进程共享（WAL 模式）。
+
+    租用在 BEGIN IMMEDIATE 事务中完成，先取得写锁再选择项目，多个进程不会租到同一个项目。
+    visible_at 对等待中的项目表示最早可以租用的时间（失败重试的延迟），
+    对已租用的项目表示租期到期时间，两种情况都用同一个索引查询可以租用的项目。
+    SQLite 文件放在网络文件系统上时文件锁不可靠，跨主机部署需要实现基于数据库服务的 WorkQueue。
+    """
+
+    STATES = ('pending', 'leased', 'done', 'failed')
+
+    def __init__(self, db_path: str = 'output/work_queue.db', max_attempts: int = 3,
+                 retry_delay: float = 60, max_retry_delay: float = 3600):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        # 事务由 _transaction() 显式管理
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._transaction():
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS queue (
+                    url TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    priority REAL NOT NULL DEFAULT 0,
+                    state TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    visible_at REAL NOT NULL,
+                    lease_owner TEXT,
+                    lease_token TEXT,
+                    last_error TEXT,
+                    enqueued_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_queue_ready ON queue(state, visible_at, priority)"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            # IMMEDIATE 在事务开始时就取得写锁，避免读后写时与其他进程互相等待
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    @staticmethod
+    def _now_text() -> str:
+        return datetime.now().isoformat(timespec='seconds')
+
+    def enqueue(self, tools: Iterable[Dict[str, Any]]) -> int:
+        now, now_text = time.time(), self._now_text()
+        count = 0
+        with self._transaction():
+            for tool in tools:
+                row = self._conn.execute("SELECT state FROM queue WHERE url = ?", (tool['url'],)).fetchone()
+                payload = json.dumps(tool, ensure_ascii=False)
+                priority = tool.get('priority') or 0
+                if row is None:
+                    self._conn.execute("""
+                        INSERT INTO queue (url, tool, priority, state, visible_at, enqueued_at, updated_at)
+                        VALUES (?, ?, ?, 'pending', ?, ?, ?)
+                    """, (tool['url'], payload, priority, now, now_text, now_text))
+                    count += 1
+                elif row['state'] == 'pending':
+                    self._conn.execute("UPDATE queue SET tool = ?, priority = ?, updated_at = ? WHERE url = ?",
+                                       (payload, priority, now_text, tool['url']))
+                elif row['state'] in ('done', 'failed'):
+                    self._conn.execute("""
+                        UPDATE queue SET tool = ?, priority = ?, state = 'pending', attempts = 0, visible_at = ?,
+                               lease_owner = NULL, lease_token = NULL, last_error = NULL, enqueued_at = ?, updated_at = ?
+                        WHERE url = ?
+                    """, (payload, priority, now, now_text, now_text, tool['url']))
+                    count += 1
+        return count
+
+    def lease(self, owner: str, count: int = 1, visibility: float = 300) -> List[Dict[str, Any]]:
+        now = time.time()
+        leases = []
+        with self._transaction():
+            while len(leases) < count:
+                row = self._conn.execute("""
+                    SELECT url, tool, state, attempts FROM queue
+                    WHERE state IN ('pending', 'leased') AND visible_at <= ?
+                    ORDER BY priority DESC, enqueued_at LIMIT 1
+                """, (now,)).fetchone()
+                if row is None:
+                    break
+                if row['state'] == 'leased' and row['attempts'] >= self.max_attempts:
+                    # 每次处理都让工作进程崩溃或失联的项目不再租出
+                    self._conn.execute("""
+                        UPDATE queue SET state = 'failed', lease_token = NULL, last_error = ?, updated_at = ?
+                        WHERE url = ?
+                    """, (f"租期过期 {row['attempts']} 次", self._now_text(), row['url']))
+                    continue
+                token = uuid.uuid4().hex
+                self._conn.execute("""
+                    UPDATE queue SET state = 'leased', attempts = attempts + 1, visible_at = ?,
+                           lease_owner = ?, lease_token = ?, updated_at = ?
+                    WHERE url = ?
+                """, (now + visibility, owner, token, self._now_text(), row['url']))
+                leases.append({'url': row['url'], 'token': token, 'attempts': row['attempts'] + 1,
+                               'tool': json.loads(row['tool'])})
+        return leases
+
+    def heartbeat(self, leases: Iterable[Dict[str, Any]], visibility: float = 300) -> List[Dict[str, Any]]:
+        lost = []
+        with self._transaction():
+            for lease in leases:
+                cursor = self._conn.execute(
+                    "UPDATE queue SET visible_at = ? WHERE url = ? AND lease_token = ? AND state = 'leased'",
+                    (time.time() + visibility, lease['url'], lease['token'])
+                )
+                if not cursor.rowcount:
+                    lost.append(lease)
+        return lost
+
+    def complete(self, lease: Dict[str, Any]) -> bool:
+        with self._transaction():
+            cursor = self._conn.execute("""
+                UPDATE queue SET state = 'done', lease_token = NULL, last_error = NULL, updated_at = ?
+                WHERE url = ? AND lease_token = ? AND state = 'leased'
+            """, (self._now_text(), lease['url'], lease['token']))
+        return bool(cursor.rowcount)
+
+    def fail(self, lease: Dict[str, Any], error: str = None) -> Optional[str]:
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT attempts FROM queue WHERE url = ? AND lease_token = ? AND state = 'leased'",
+                (lease['url'], lease['token'])
+            ).fetchone()
+            if row is None:
+                return None
+            state = 'failed' if row['attempts'] >= self.max_attempts else 'pending'
+            delay = min(self.max_retry_delay, self.retry_delay * 2 ** (row['attempts'] - 1))
+            self._conn.execute("""
+                UPDATE queue SET state = ?, visible_at = ?, lease_token = NULL, last_error = ?, updated_at = ?
+                WHERE url = ?
+            """, (state, time.time() + delay, error, self._now_text(), lease['url']))
+        return state
+
+    def release(self, lease: Dict[str, Any]) -> bool:
+        with self._transaction():
+            cursor = self._conn.execute("""
+                UPDATE queue SET state = 'pending', attempts = MAX(0, attempts - 1), visible_at = ?,
+                       lease_token = NULL, updated_at = ?
+                WHERE url = ? AND lease_token = ? AND state = 'leased'
+            """, (time.time(), self._now_text(), lease['url'], lease['token']))
+        return bool(cursor.rowcount)
+
+    def ready(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM queue WHERE state IN ('pending', 'leased') AND visible_at <= ?", (time.time(),)
+            ).fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM queue GROUP BY state").fetchall()
+        counts = dict.fromkeys(self.STATES, 0)
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def requeue_failed(self) -> int:
+        with self._transaction():
+            cursor = self._conn.execute("""
+                UPDATE queue SET state = 'pending', attempts = 0, visible_at = ?, updated_at = ?
+                WHERE state = 'failed'
+            """, (time.time(), self._now_text()))
+        return cursor.rowcount
+
+    def purge(self, state: str = 'done') -> int:
+        with self._transaction():
+            cursor = self._conn.execute("DELETE FROM queue WHERE state = ?", (state,))
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def worker_id() -> str:
+    """当前工作进程的标识：主机名-进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class QueueConsumer:
+    """
+    一个工作进程对队列的使用：按需逐个租用项目交给分析器，后台线程定期为持有的租用发送心跳，
+    分析结果持久化之后调用 done() 完成或记录失败，运行结束时 release_all() 退回没有处理的项目。
+    """
+
+    def __init__(self, queue: WorkQueue, owner: str = None, visibility: float = 300):
+        self.queue = queue
+        self.owner = owner or worker_id()
+        self.visibility = visibility
+        self.leased = 0
+        self._held: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._beat, name='queue-heartbeat', daemon=True)
+        self._heartbeat.start()
+
+    def _beat(self):
+        # 租期的三分之一发送一次心跳，偶尔一次失败不会导致租期过期
+        while not self._stop.wait(self.visibility / 3):
+            with self._lock:
+                leases = list(self._held.values())
+            if not leases:
+                continue
+            try:
+                lost = self.queue.heartbeat(leases, self.visibility)
+            except sqlite3.Error as e:
+                logging.warning(f"工作队列心跳失败: {str(e)}")
+                continue
+            for lease in lost:
+                logging.warning(f"{lease['url']} 的租用已过期并被其他工作进程接手，本进程的结果不会更新队列状态")
+                with self._lock:
+                    self._held.pop(lease['url'], None)
+
+    def iter_tools(self, stop_event: threading.Event = None) -> Iterator[Dict[str, Any]]:
+        """逐个租用并产出工具，队列中没有可租用的项目时结束"""
+        while not (stop_event and stop_event.is_set()):
+            leases = self.queue.lease(self.owner, 1, self.visibility)
+            if not leases:
+                return
+            lease = leases[0]
+            with self._lock:
+                self._held[lease['url']] = lease
+            self.leased += 1
+            if lease['attempts'] > 1:
+                logging.info(f"第 {lease['attempts']} 次尝试: {lease['url']}")
+            yield lease['tool']
+
+    def done(self, tool: Dict[str, Any], success: bool, error: str = None):
+        """分析结果持久化之后调用；同一个工具重复调用时只有第一次生效"""
+        with self._lock:
+            lease = self._held.pop(tool['url'], None)
+        if lease is None:
+            return
+        if success:
+            self.queue.complete(lease)
+            return
+        state = self.queue.fail(lease, error)
+        if state == 'failed':
+            logging.warning(f"{tool['name']} 已失败 {lease['attempts']} 次，不再重试（可使用 queue --requeue-failed 重新放入）")
+
+    def release_all(self) -> int:
+        """退回仍持有的租用（例如收到停止信号或等待的相似工具没有结果），返回数量"""
+        with self._lock:
+            leases, self._held = list(self._held.values()), {}
+        for lease in leases:
+            self.queue.release(lease)
+        return len(leases)
+
+    def close(self):
+        self._stop.set()
+        self._heartbeat.join()
+        self.release_all()
+
+
+def open_work_queue(path: str = 'output/work_queue.db', **options) -> WorkQueue:
+    """打开默认的工作队列"""
+    return SQLiteWorkQueue(path, **options)
@@ -1,131 +1,193 @@
 #!/usr/bin/env python3
 """
 测试 DeepSeek API 连接
-用法: python3 test_deepseek_api.py <your-api-key>
+用法: python3 test_deepseek_api.py <your-api-key> [--deadline 秒数] [--concurrency N] [--no-save]
+
+认证头格式和模型的所有组合并发探测，整体不超过截止时间；第一个成功的聊天请求出现后取消其余探测。
+成功的配置（API 端点、模型和认证头格式）写入密钥配置文件，ProjectAnalyzer 在有效期内直接使用，
+不再请求 /models 验证密钥。
 """
 
+import os
 import sys
-import requests
-import json
+import time
+import queue
+import threading
+from typing import Dict, Any, List, Optional
 
-def test_deepseek_api(api_key):
-    """测试 DeepSeek API 连接"""
-    print(f"使用 API 密钥: {api_key[:8]}...")
-    
-    # 标准 API 端点
-    api_url = "https://api.deepseek.com/v1/chat/completions"
-    
-    # 常用模型名称尝试列表
-    models_to_try = [
-        "deepseek-chat",
-        "deepseek-coder",
-        "deepseek-llm",
-        "deepseek-v2",
-        "deepseek-large"
-    ]
-    
-    # 尝试不同的认证格式
-    auth_formats = [
-        {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-        {"Authorization": api_key, "Content-Type": "application/json"},
-        {"X-API-Key": api_key, "Content-Type": "application/json"}
-    ]
-    
-    success = False
-    
-    print("\n开始测试 DeepSeek API 连接...")
-    print("=" * 50)
-    
-    # 1. 首先尝试获取可用模型列表（如果API支持）
-    print("\n尝试获取可用模型列表...")
-    for auth in auth_formats:
+from scripts.http_client import http_client
+from scripts.llm_backends import AUTH_HEADERS, auth_headers
+
+DEFAULT_API_BASE = "https://api.deepseek.com/v1"
+
+# 常用模型名称，/models 返回的其他模型会追加探测
+MODELS_TO_TRY = [
+    "deepseek-chat",
+    "deepseek-coder",
+    "deepseek-llm",
+    "deepseek-v2",
+    "deepseek-large"
+]
+
+# 单个探测的超时秒数，同时不超过剩余的整体时间
+PROBE_TIMEOUT = 10
+
+
+class ProbeMatrix:
+    """
+    并发执行的探测组合。每个认证头格式先请求一次 /models（返回的模型追加到聊天探测中），
+    每个认证头格式和模型的组合各发送一个最短的聊天请求。
+    探测由 concurrency 个守护线程执行，结果通过队列返回：找到可用组合后不等待在途的请求，
+    进程可以立即退出（与 llm_backends 中的对冲请求相同）。
+    """
+
+    def __init__(self, api_key: str, api_base: str, deadline: float, concurrency: int):
+        self.api_key = api_key
+        self.api_base = api_base.rstrip('/')
+        self.deadline = time.monotonic() + deadline
+        self.session = http_client.configure(self.api_base, max_connections=concurrency)
+        self.concurrency = concurrency
+        # 第一个聊天请求成功后设置，尚未发出的探测直接跳过
+        self.found = threading.Event()
+        self.results: List[Dict[str, Any]] = []
+        self.submitted = set()
+        self._pending = queue.Queue()
+        self._finished = queue.Queue()
+
+    def remaining(self) -> float:
+        return self.deadline - time.monotonic()
+
+    def submit(self, auth: str, model: Optional[str]):
+        """model 为 None 时请求 /models；同一组合只探测一次"""
+        if (auth, model) in self.submitted:
+            return
+        self.submitted.add((auth, model))
+        self._pending.put((auth, model))
+
+    def _work(self):
+        while True:
+            auth, model = self._pending.get()
+            self._finished.put(self._probe(auth, model))
+
+    def _probe(self, auth: str, model: Optional[str]) -> Dict[str, Any]:
+        result = {'auth': auth, 'model': model or '/models', 'status': None, 'latency': None, 'error': None}
+        timeout = min(PROBE_TIMEOUT, self.remaining())
+        if self.found.is_set() or timeout <= 0:
+            result['error'] = '已取消'
+            return result
+        started = time.perf_counter()
         try:
-            models_url = "https://api.deepseek.com/v1/models"  # 假设的模型列表端点
-            print(f"使用认证格式: {auth}")
-            response = requests.get(models_url, headers=auth, timeout=10)
-            print(f"状态码: {response.status_code}")
-            
+            if model is None:
+                response = self.session.get(f"{self.api_base}/models", headers=auth_headers(self.api_key, auth),
+                                            timeout=timeout)
+            else:
+                payload = {"model": model, "messages": [{"role": "user", "content": "ping"}], "max_tokens": 1}
+                response = self.session.post(f"{self.api_base}/chat/completions",
+                                             headers=auth_headers(self.api_key, auth), json=payload, timeout=timeout)
+            result['status'] = response.status_code
             if response.status_code == 200:
-                print("成功获取模型列表!")
-                try:
-                    models = response.json()
-                    print(f"可用模型: {json.dumps(models, indent=2, ensure_ascii=False)}")
-                    success = True
-                    # 如果有可用模型，更新要尝试的模型列表
-                    if "data" in models and isinstance(models["data"], list):
-                        models_to_try = [model["id"] for model in models["data"]]
-                    break
-                except:
-                    print(f"响应不是有效的 JSON: {response.text[:100]}")
+                result['body'] = response.json()
             else:
-                print(f"响应: {response.text[:200]}")
+                result['error'] = response.text[:100]
         except Exception as e:
-            print(f"获取模型列表时出错: {str(e)}")
-    
-    print("\n" + "=" * 50)
-    
-    # 2. 测试简单的聊天请求
-    print("\n测试简单的聊天请求...")
-    for auth in auth_formats:
-        for model in models_to_try:
-            print(f"\n尝试模型: {model}")
-            print(f"使用认证格式: {auth}")
-            
-            try:
-                payload = {
-                    "model": model,
-                    "messages": [
-                        {"role": "user", "content": "你好，请简单介绍一下你自己。"}
-                    ],
-                    "max_tokens": 50
-                }
-                
-                print(f"发送请求到: {api_url}")
-                print(f"请求内容: {json.dumps(payload, indent=2, ensure_ascii=False)}")
-                
-                response = requests.post(
-                    api_url, 
-                    headers=auth,
-                    json=payload,
-                    timeout=20
-                )
-                
-                print(f"状态码: {response.status_code}")
-                
+            result['error'] = str(e)[:100]
+        result['latency'] = time.perf_counter() - started
+        return result
+
+    def run(self) -> Optional[Dict[str, Any]]:
+        """返回第一个成功的聊天探测，截止时间内没有成功时返回 None"""
+        for auth in AUTH_HEADERS:
+            self.submit(auth, None)
+        for model in MODELS_TO_TRY:
+            for auth in AUTH_HEADERS:
+                self.submit(auth, model)
+        for i in range(self.concurrency):
+            threading.Thread(target=self._work, name=f'api-probe-{i + 1}', daemon=True).start()
+        try:
+            while len(self.results) < len(self.submitted) and self.remaining() > 0:
                 try:
-                    response_json = response.json()
-                    print(f"响应: {json.dumps(response_json, indent=2, ensure_ascii=False)[:500]}...")
-                    
-                    if response.status_code == 200:
-                        print(f"成功! 模型 {model} 工作正常。")
-                        success = True
-                        print("\n正确的 API 配置是:")
-                        print(f"API URL: {api_url}")
-                        print(f"模型名称: {model}")
-                        print(f"认证头: {auth}")
-                        return
-                except:
-                    print(f"响应不是有效的 JSON: {response.text[:200]}")
-            except Exception as e:
-                print(f"请求出错: {str(e)}")
-    
-    if not success:
-        print("\n所有尝试均失败。可能的原因:")
-        print("1. API 密钥无效或已过期")
-        print("2. DeepSeek API 端点或请求格式已更改")
-        print("3. 网络连接问题")
-        print("4. DeepSeek 服务暂时不可用")
-        
-        print("\n建议:")
-        print("1. 检查您的 API 密钥是否正确")
-        print("2. 查看 DeepSeek 的最新 API 文档")
-        print("3. 检查网络连接和代理设置")
-        print("4. 联系 DeepSeek 客服获取支持")
+                    result = self._finished.get(timeout=self.remaining())
+                except queue.Empty:
+                    return None
+                self.results.append(result)
+                print_probe(result)
+                if result['status'] != 200:
+                    continue
+                if result['model'] == '/models':
+                    for model in self._listed_models(result.pop('body')):
+                        self.submit(result['auth'], model)
+                else:
+                    result.pop('body', None)
+                    return result
+            return None
+        finally:
+            # 排队中的探测不再发送；在途的请求不等待，守护线程随进程退出
+            self.found.set()
+
+    @staticmethod
+    def _listed_models(body: Any) -> List[str]:
+        try:
+            return [model['id'] for model in body['data']]
+        except (KeyError, TypeError):
+            return []
+
+
+def print_probe(result: Dict[str, Any]):
+    mark = '✓' if result['status'] == 200 else '✗'
+    latency = f"{result['latency'] * 1000:7.0f} ms" if result['latency'] is not None else '       -'
+    detail = result['error'] or ''
+    print(f"  {mark} {result['auth']:<10} {result['model']:<20} {result['status'] or '-':>4} {latency}  {detail}")
+
+
+def test_deepseek_api(api_key: str, api_base: str = None, deadline: float = 30, concurrency: int = 8,
+                      save: bool = True) -> Optional[Dict[str, Any]]:
+    """测试 DeepSeek API 连接，返回可用的配置（api_base、model、auth），全部失败时返回 None"""
+    api_base = (api_base or os.getenv('DEEPSEEK_API_BASE') or DEFAULT_API_BASE).rstrip('/')
+    print(f"使用 API 密钥: {api_key[:8]}...")
+    print(f"API 端点: {api_base}，最长 {deadline:g} 秒，并发 {concurrency}")
+    print("=" * 60)
+
+    started = time.perf_counter()
+    matrix = ProbeMatrix(api_key, api_base, deadline, concurrency)
+    working = matrix.run()
+    elapsed = time.perf_counter() - started
+    print("=" * 60)
+    skipped = len(matrix.submitted) - len(matrix.results)
+    print(f"{len(matrix.results)} 个探测完成，{skipped} 个已取消，用时 {elapsed:.2f} 秒")
+
+    if working:
+        config = {'api_base': api_base, 'model': working['model'], 'auth': working['auth']}
+        print("\n正确的 API 配置是:")
+        print(f"API URL: {api_base}/chat/completions")
+        print(f"模型名称: {working['model']}")
+        print(f"认证头: {AUTH_HEADERS[working['auth']][0]}（{working['auth']}）")
+        print(f"延迟: {working['latency'] * 1000:.0f} ms")
+        if save:
+            from scripts.project_analyzer import ProjectAnalyzer
+            try:
+                path = ProjectAnalyzer.store_validation(api_key, api_base, working['model'], working['auth'])
+                print(f"已写入 {path}，分析时将直接使用该配置")
+            except OSError as e:
+                print(f"写入配置时出错: {str(e)}")
+        return config
+
+    if matrix.remaining() <= 0:
+        print(f"\n{deadline:g} 秒内没有成功的请求。")
+    print("\n所有尝试均失败。可能的原因:")
+    print("1. API 密钥无效或已过期")
+    print("2. DeepSeek API 端点或请求格式已更改")
+    print("3. 网络连接问题")
+    print("4. DeepSeek 服务暂时不可用")
+
+    print("\n建议:")
+    print("1. 检查您的 API 密钥是否正确")
+    print("2. 查看 DeepSeek 的最新 API 文档")
+    print("3. 检查网络连接和代理设置")
+    print("4. 联系 DeepSeek 客服获取支持")
+    return None
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print(f"用法: python3 {sys.argv[0]} <your-api-key>")
-        sys.exit(1)
-    
-    api_key = sys.argv[1]
-    test_deepseek_api(api_key) 
\ No newline at end of file
+    # 参数解析在 cli.py 中，python3 test_deepseek_api.py 等同于 python3 cli.py test-api
+    from cli import main as cli_main
+    sys.exit(cli_main(['test-api'] + sys.argv[1:]))
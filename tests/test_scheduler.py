@@ -0,0 +1,28 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# 让 scripts.* 可以被导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.analysis_scheduler import AnalysisScheduler
+from scripts.scheduler import parse_deadline
+
+
+def test_parse_deadline_with_offset_returns_naive_local_time():
+    deadline = parse_deadline('2026-10-17T18:00+08:00')
+    assert deadline.tzinfo is None
+    expected = datetime(2026, 10, 17, 10, 0, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    assert deadline == expected
+
+
+def test_parse_deadline_without_offset_is_unchanged():
+    assert parse_deadline('2026-10-17T18:00') == datetime(2026, 10, 17, 18, 0)
+
+
+def test_offset_deadline_can_be_compared_with_local_times():
+    deadline = parse_deadline((datetime.now(timezone.utc) + timedelta(hours=1)).isoformat())
+    # main() 与 --max-duration 的截止时间取较早者
+    assert min(deadline, datetime.now() + timedelta(hours=2)) == deadline
+    assert not AnalysisScheduler(deadline=deadline)._deadline_exceeded()
+    assert AnalysisScheduler(deadline=parse_deadline('2000-01-01T00:00+00:00'))._deadline_exceeded()